@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import threading
+
+from os import path
+
+log = logging.getLogger(__name__)
+DEFAULT_CACHE_DIR = path.join(path.expanduser('~'), '.cache', 'epicsmonmtca')
+SDR_CACHE_KEY = 'sdr'
+# sensor thresholds, valid with the same fingerprint as the SDR entries
+THRESHOLDS_CACHE_KEY = 'thresholds'
+
+
+def get_cache_path(cache_dir, mch_ip):
+    return path.join(cache_dir, '{}.json'.format(mch_ip))
+
+
+def sdr_repository_fingerprint(device_id, repo_info):
+    """ Identifies the content of a SDR repository
+        Arguments:
+           device_id: result of Get Device ID for the repository owner
+           repo_info: Get SDR Repository Info response, pyipmi's
+                      SdrRepositoryInfo leaves the erase timestamp out
+        Returns:
+           A string that changes when the MCH or the repository changes
+    """
+    return '{:06x}:{:04x}:{:02x}:{}:{:04x}:{:08x}:{:08x}'.format(
+        device_id.manufacturer_id, device_id.product_id, device_id.device_id,
+        device_id.fw_revision, repo_info.record_count,
+        repo_info.most_recent_addition, repo_info.most_recent_erase)
+
+
+def read_sdr_repository_info(ipmi):
+    """ Returns:
+           The Get Device ID result and the raw Get SDR Repository Info
+           response that identify the repository
+    """
+    return (ipmi.get_device_id(),
+            ipmi.send_message_with_name('GetSdrRepositoryInfo'))
+
+
+class DiskCache(object):
+    """ Raw IPMI data stored in a json file, each entry is only valid while
+        the fingerprint it was stored with matches. Entries can be put and
+        saved from several threads (e.g. the FRU fetcher) """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, 'r') as fhandle:
+                self._entries = json.load(fhandle)
+        except (IOError, ValueError) as e:
+            log.warning('Ignoring unreadable cache %s: %s', self.filepath, e)
+            self._entries = {}
+
+    def get(self, key, fingerprint):
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return None
+        return [bytearray.fromhex(item) for item in entry['data']]
+
+    def put(self, key, fingerprint, data):
+        entry = {
+            'fingerprint': fingerprint,
+            'data': [bytes(item).hex() for item in data]
+        }
+        with self._lock:
+            self._entries[key] = entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def save(self):
+        # entries are replaced, never changed, so a shallow copy is enough
+        with self._lock:
+            entries = dict(self._entries)
+        with self._save_lock:
+            try:
+                os.makedirs(path.dirname(self.filepath), exist_ok=True)
+                tmp_path = self.filepath + '.tmp'
+                with open(tmp_path, 'w') as fhandle:
+                    json.dump(entries, fhandle)
+                os.replace(tmp_path, self.filepath)
+            except (IOError, OSError) as e:
+                log.warning('Failed to save cache %s: %s', self.filepath, e)
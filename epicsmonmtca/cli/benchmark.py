@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import multiprocessing
+import time
+
+from epicsmonmtca.monitor import EpicsMonMTCA
+from epicsmonmtca.pipeline import DEFAULT_WINDOW
+from epicsmonmtca.sessions import DEFAULT_SESSIONS
+from epicsmonmtca.simulator import (MchSimulator, SENSOR_TYPE_TEMPERATURE,
+                                    build_crate)
+from epicsmonmtca.stats import LatencyHistogram
+
+log = logging.getLogger(__name__)
+SIMULATOR_STARTUP_TIMEOUT = 10  # s
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measures the sensor polling throughput against a '
+                    'simulated MCH')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[50, 500, 5000],
+                        help='Number of sensors of each run')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Measuring time of each run in seconds')
+    parser.add_argument('--warmup', type=float, default=2.0,
+                        help='Time before measuring in seconds')
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='Simulated sensor reading latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Simulated sensor reading jitter in ms')
+    parser.add_argument('--ipmi-window', type=int, default=DEFAULT_WINDOW,
+                        help='Maximum number of sensor reads in flight')
+    parser.add_argument('--ipmi-sessions', type=int, default=DEFAULT_SESSIONS,
+                        help='Number of concurrent IPMI sessions')
+    parser.add_argument(
+        '--sensors-polling-period', type=int, default=1,
+        help='Polling period in ms, the default polls as fast as possible')
+    parser.add_argument('--sel-rate', type=float, default=1.0,
+                        help='SEL events generated per second')
+    parser.add_argument('--log-level', default='warning',
+                        choices=['debug', 'info', 'warning', 'error'])
+    return parser.parse_args()
+
+
+def run_simulator(nsensors, latency, jitter, sel_rate, conn):
+    """ Runs in its own process, so its CPU time is not measured """
+    sim = MchSimulator(build_crate(nsensors), latency=latency,
+                       jitter=jitter)
+    sim.start()
+    conn.send(sim.port)
+    while not conn.poll(1.0 / sel_rate if sel_rate > 0 else None):
+        sim.crate.add_sel_event(1, SENSOR_TYPE_TEMPERATURE, 0x01,
+                                (0x07, 85, 80))
+    sim.stop()
+
+
+def start_simulator(nsensors, args):
+    (conn, child_conn) = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=run_simulator,
+        args=(nsensors, args.latency / 1000.0, args.jitter / 1000.0,
+              args.sel_rate, child_conn))
+    process.daemon = True
+    process.start()
+    if not conn.poll(SIMULATOR_STARTUP_TIMEOUT):
+        process.terminate()
+        raise RuntimeError('MCH simulator did not start')
+    return (process, conn, conn.recv())
+
+
+def get_latency_delta(before, after):
+    delta = LatencyHistogram()
+    delta.counts = [a - b for (a, b) in zip(after.counts, before)]
+    delta.total = sum(delta.counts)
+    return delta
+
+
+def run_benchmark(nsensors, args):
+    (process, conn, port) = start_simulator(nsensors, args)
+    try:
+        start = time.monotonic()
+        monitor = EpicsMonMTCA('127.0.0.1', port=port,
+                               pv_prefix='BENCH{}'.format(nsensors),
+                               ipmi_window=args.ipmi_window,
+                               ipmi_sessions=args.ipmi_sessions)
+        monitor.watch_sensors(args.sensors_polling_period)
+        monitor.watch_sel()
+        startup = time.monotonic() - start
+        time.sleep(args.warmup)
+
+        stats = monitor.stats
+        (reads, errors) = (stats.reads, stats.errors)
+        latency_counts = list(stats.latency.counts)
+        (wall_start, cpu_start) = (time.monotonic(), time.process_time())
+        time.sleep(args.duration)
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+        (reads, errors) = (stats.reads - reads, stats.errors - errors)
+        latency = get_latency_delta(latency_counts, stats.latency)
+        monitor.stop()
+    finally:
+        conn.send(None)
+        process.join(SIMULATOR_STARTUP_TIMEOUT)
+
+    nwatched = len(monitor._to_monitor)
+    return {
+        'sensors': nwatched,
+        'startup': startup,
+        'reads_per_s': reads / wall,
+        'sweeps_per_s': reads / wall / nwatched if nwatched else 0.0,
+        'p50': latency.percentile(50) or 0.0,
+        'p99': latency.percentile(99) or 0.0,
+        'cpu_per_read': cpu / reads * 1e6 if reads else 0.0,
+        'errors': errors,
+    }
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    print('{:>8} {:>10} {:>10} {:>10} {:>8} {:>8} {:>12} {:>7}'.format(
+        'sensors', 'startup s', 'reads/s', 'sweeps/s', 'p50 ms', 'p99 ms',
+        'CPU us/read', 'errors'))
+    for nsensors in args.sizes:
+        result = run_benchmark(nsensors, args)
+        print('{sensors:>8} {startup:>10.2f} {reads_per_s:>10.1f} '
+              '{sweeps_per_s:>10.2f} {p50:>8.2f} {p99:>8.2f} '
+              '{cpu_per_read:>12.1f} {errors:>7}'.format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,81 @@
 #!/usr/bin/env python
 import argparse
 
-from os import path
-
-from epicsmonmtca.mtcaedm import create_edm_from_manifest, create_edm_startup
+from epicsmonmtca.crates import parse_crates_file
+from epicsmonmtca.mtcaedm import EdmCrate, create_edm_from_manifests
 
 
 def parse_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('manifest_path')
-    parser.add_argument('pv_prefix')
-    parser.add_argument('crate_name')
-    parser.add_argument('output_dir')
-    return parser.parse_args()
+    parser = argparse.ArgumentParser(
+        usage='%(prog)s [-h] [--processes N] [--verbose]\n'
+              '       (manifest_path pv_prefix crate_name | '
+              '--crates-file CRATES_FILE) output_dir',
+        description='Creates the EDM screens of one crate in output_dir, or '
+                    'of every crate of a crates file in output_dir/<pv_prefix>'
+                    '. Files whose content did not change are not written.')
+    parser.add_argument('args', nargs='+', metavar='arg',
+                        help=argparse.SUPPRESS)
+    parser.add_argument(
+        '--crates-file', default=None,
+        help='Crates file of the IOC, every crate needs a manifest. The PV '
+             'prefix is used as crate name')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of processes creating the screens, the '
+                             'number of CPUs by default')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Print every created and updated file')
+    args = parser.parse_args()
+
+    if args.crates_file:
+        if len(args.args) != 1:
+            parser.error('only output_dir is expected with --crates-file')
+        args.output_dir = args.args[0]
+        try:
+            configs = parse_crates_file(args.crates_file)
+        except (IOError, ValueError) as e:
+            parser.error(str(e))
+        for config in configs:
+            if not config.manifest_path:
+                parser.error('crate {} has no manifest'.format(
+                    config.pv_prefix))
+        args.crates = [EdmCrate(config.manifest_path, config.pv_prefix,
+                                config.pv_prefix) for config in configs]
+        args.single = False
+    else:
+        if len(args.args) != 4:
+            parser.error('manifest_path, pv_prefix, crate_name and output_dir '
+                         'are required without --crates-file')
+        args.output_dir = args.args[3]
+        args.crates = [EdmCrate(*args.args[:3])]
+        args.single = True
+
+    return args
 
 
 def main():
     args = parse_args()
-    create_edm_from_manifest(
-        args.manifest_path, args.pv_prefix, args.crate_name, args.output_dir)
+    # a single crate is written straight in output_dir as before
+    if args.single:
+        results = create_edm_from_manifests(args.crates, args.output_dir,
+                                            flat=True)
+    else:
+        results = create_edm_from_manifests(args.crates, args.output_dir,
+                                            args.processes)
+    totals = [0, 0, 0]
+    for crate, changes in results:
+        if args.verbose:
+            for filepath in changes.created:
+                print('created {}'.format(filepath))
+            for filepath in changes.updated:
+                print('updated {}'.format(filepath))
+        print('{}: {} created, {} updated, {} unchanged'.format(
+            crate.crate_name, len(changes.created), len(changes.updated),
+            len(changes.unchanged)))
+        for i, files in enumerate(changes):
+            totals[i] += len(files)
+
+    if len(args.crates) > 1:
+        print('total: {} created, {} updated, {} unchanged'.format(*totals))
 
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ import argparse
 from os import path
 
 from epicsmonmtca.epicsutils import get_sensor_pv_suffix
-from epicsmonmtca.manifest import parse_manifest
+from epicsmonmtca.manifest import get_concrete_modules, parse_manifest
 
 
 def parse_args():
@@ -17,7 +17,7 @@ def parse_args():
 
 def main():
     args = parse_args()
-    slots = parse_manifest(args.manifest_path)
+    slots = get_concrete_modules(parse_manifest(args.manifest_path))
     with open(args.output_path, 'w') as fhandle:
         for slot_id, mod in slots.items():
             for sensor in mod.sensors:
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import argparse
 
+from epicsmonmtca.cache import DEFAULT_CACHE_DIR
 from epicsmonmtca.monitor import EpicsMonMTCA
 
 
@@ -8,12 +9,17 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("mch_ip")
     parser.add_argument("output_path")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory where SDR data is cached")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always read the SDR repository from the MCH")
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    ipmi_manager = EpicsMonMTCA(args.mch_ip)
+    cache_dir = None if args.no_cache else args.cache_dir
+    ipmi_manager = EpicsMonMTCA(args.mch_ip, cache_dir=cache_dir)
     ipmi_manager.process_sdr_repository()
     ipmi_manager.create_manifest(args.output_path)
 
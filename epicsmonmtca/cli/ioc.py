@@ -3,50 +3,254 @@
 import argparse
 import logging
 import os
+import time
 
 from softioc import softioc, builder
 from epicsmonmtca import EpicsMonMTCA
-from epicsmonmtca.manifest import parse_manifest_sensor_names
+from epicsmonmtca.cache import DEFAULT_CACHE_DIR
+from epicsmonmtca.crates import CrateConfig, parse_crates_file
+from epicsmonmtca.manifest import ManifestIndex
+from epicsmonmtca.metrics import DEFAULT_METRICS_PORT, MetricsServer
+from epicsmonmtca.monitor import DEFAULT_RMCP_PORT
+from epicsmonmtca.pipeline import DEFAULT_WINDOW
+from epicsmonmtca.polling import Deadband
+from epicsmonmtca.seljournal import get_journal_path
+from epicsmonmtca.sessions import (DEFAULT_SESSIONS, DEFAULT_TRIP_TIMEOUTS,
+                                   SHARD_BY_SLOT, SHARD_POLICIES)
+from epicsmonmtca.spares import DEFAULT_SPARE_SENSORS
+from epicsmonmtca.timeutils import CATCH_UP_POLICIES, CATCH_UP_SKIP
 
 log = logging.getLogger(__name__)
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('mch_ip', help='IP address of the MCH')
-    parser.add_argument('pv_prefix', help='EPICS PV prefix')
+    parser.add_argument('mch_ip', nargs='?', help='IP address of the MCH')
+    parser.add_argument('pv_prefix', nargs='?', help='EPICS PV prefix')
+    parser.add_argument(
+        '--crates-file', default=None,
+        help='File with a "<mch_ip> <pv_prefix> [<manifest_path>]" line for '
+             'each crate served by this IOC')
+    parser.add_argument(
+        '--crate-retries', type=int, default=3,
+        help='Times a crate that failed to start is tried again before the '
+             'IOC starts without it')
+    parser.add_argument(
+        '--crate-retry-delay', type=float, default=10.0,
+        help='Time in seconds between the attempts to start failed crates')
     parser.add_argument('--log-level', default='info', choices=['debug',
                                                                 'info',
                                                                 'warning',
                                                                 'error',
                                                                 'critical'])
+    parser.add_argument('--mch-port', type=int, default=DEFAULT_RMCP_PORT,
+                        help='RMCP port of the MCH')
     parser.add_argument('--ipmi-timeout', type=float, default=5.0,
                         help='Timeout for IPMI commands')
+    parser.add_argument(
+        '--trip-timeouts', type=int, default=DEFAULT_TRIP_TIMEOUTS,
+        help='Consecutive read timeouts after which the sensors of a session '
+             'go INVALID and it is reconnected, 0 disables it')
     parser.add_argument('--sensors-polling-rate', type=float, default=1.0,
                         help='Rate at which to poll the sensors in seconds')
     parser.add_argument(
         '--sel-polling-rate', type=float, default=-1.0,
         help='Rate at which to poll the SEL in seconds, -1 to disable')
+    parser.add_argument(
+        '--ipmi-window', type=int, default=DEFAULT_WINDOW,
+        help='Maximum number of sensor reads in flight at once')
+    parser.add_argument(
+        '--ipmi-sessions', type=int, default=DEFAULT_SESSIONS,
+        help='Number of concurrent IPMI sessions to the MCH')
+    parser.add_argument(
+        '--session-shard', default=SHARD_BY_SLOT, choices=SHARD_POLICIES,
+        help='How sensors are spread across the IPMI sessions')
+    parser.add_argument(
+        '--deadband', type=float, default=0.0,
+        help='Minimum change of a sensor value to publish it')
+    parser.add_argument(
+        '--deadband-rel', type=float, default=0.0,
+        help='Minimum change of a sensor value to publish it, as a fraction '
+             'of the last published value')
+    parser.add_argument(
+        '--max-silence', type=float, default=10.0,
+        help='Time in seconds after which an unchanged value is published '
+             'again')
+    parser.add_argument(
+        '--fixed-route', action='store_true',
+        help='Send every sensor read to the carrier manager instead of the '
+             'controller owning the sensor')
+    parser.add_argument(
+        '--sel-journal-dir', default=None,
+        help='Directory where the SEL entries are stored, one SQLite '
+             'database per crate')
+    parser.add_argument(
+        '--no-event-reads', action='store_true',
+        help='Do not read the sensors of SEL events right away')
+    parser.add_argument(
+        '--catch-up', default=CATCH_UP_SKIP, choices=CATCH_UP_POLICIES,
+        help='What the polling loops do with the periods missed while '
+             'overrunning: skip them or run them back to back')
+    parser.add_argument(
+        '--spare-sensors', type=int, default=DEFAULT_SPARE_SENSORS,
+        help='Spare sensor records of each empty AMC slot, used by modules '
+             'inserted while the IOC runs')
+    parser.add_argument(
+        '--history-depth', type=int, default=0,
+        help='Readings of each sensor kept in its history waveform, 0 to '
+             'disable the history')
+    parser.add_argument(
+        '--history-decimation', type=int, default=1,
+        help='Publish one history sample out of this many')
+    parser.add_argument(
+        '--freeze-history-on-alarm', action='store_true',
+        help='Stop recording the history of a sensor shortly after it goes '
+             'into alarm, until HIST:FREEZE is reset')
+    parser.add_argument(
+        '--record-dir', default=None,
+        help='Directory where every published reading is recorded, one '
+             'subdirectory per crate')
+    parser.add_argument(
+        '--record-max-size', type=float, default=64.0,
+        help='Size in MB after which a new recording file is started')
+    parser.add_argument(
+        '--record-max-age', type=float, default=24.0,
+        help='Age in hours after which a new recording file is started')
+    parser.add_argument(
+        '--record-keep', type=int, default=0,
+        help='Number of recording files kept, 0 keeps all of them')
+    parser.add_argument(
+        '--metrics-port', type=int, nargs='?', const=DEFAULT_METRICS_PORT,
+        default=None,
+        help='Serve the readings and polling statistics in OpenMetrics '
+             'format on this HTTP port (default {})'.format(
+                 DEFAULT_METRICS_PORT))
+    parser.add_argument('--metrics-host', default='',
+                        help='Address the metrics server listens on, all of '
+                             'them by default')
     parser.add_argument('--manifest-path', default=None)
-    return parser.parse_args()
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Directory where SDR data is cached')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always read the SDR repository from the MCH')
+    args = parser.parse_args()
+    if not args.crates_file and not (args.mch_ip and args.pv_prefix):
+        parser.error('mch_ip and pv_prefix are required without '
+                     '--crates-file')
+    return args
 
 
-def main():
-    args = parse_args()
-    log_level = getattr(logging, args.log_level.upper())
-    logging.basicConfig(level=log_level)
-    builder.SetDeviceName(args.pv_prefix)
-    builder.stringIn("HOSTNAME", VAL=os.uname()[1])
-    allowed_sensors = parse_manifest_sensor_names(args.manifest_path) \
-        if args.manifest_path else None
-    monitor = EpicsMonMTCA(args.mch_ip, 'rmcp',
-                           allowed_sensors=allowed_sensors)
+def start_crate_monitor(crate, args):
+    manifest_path = crate.manifest_path or args.manifest_path
+    allowed_sensors = ManifestIndex.from_file(manifest_path) \
+        if manifest_path else None
+    cache_dir = None if args.no_cache else args.cache_dir
+    monitor = EpicsMonMTCA(crate.mch_ip, 'rmcp',
+                           allowed_sensors=allowed_sensors,
+                           cache_dir=cache_dir, pv_prefix=crate.pv_prefix,
+                           ipmi_window=args.ipmi_window, port=args.mch_port,
+                           ipmi_sessions=args.ipmi_sessions)
+    try:
+        configure_crate_monitor(monitor, crate, args)
+    except Exception:
+        monitor.stop()
+        raise
+    return monitor
+
+
+def configure_crate_monitor(monitor, crate, args):
     # this crate seems to have a slower IPMI interface
-    monitor.ipmi.interface.set_timeout(args.ipmi_timeout)
+    monitor.set_ipmi_timeout(args.ipmi_timeout)
+    monitor.set_trip_timeouts(args.trip_timeouts)
+    monitor.session_shard = args.session_shard
+    monitor.route_by_owner = not args.fixed_route
+    monitor.deadband = Deadband(args.deadband, args.deadband_rel)
+    monitor.max_silence = int(args.max_silence * 1000)
+    monitor.spare_sensors_per_slot = args.spare_sensors
+    monitor.catch_up = args.catch_up
+    monitor.read_on_event = not args.no_event_reads
+    monitor.history_depth = args.history_depth
+    monitor.history_decimation = args.history_decimation
+    monitor.freeze_history_on_alarm = args.freeze_history_on_alarm
+    if args.metrics_port is not None:
+        monitor.export_metrics()
+    if args.record_dir:
+        monitor.record_readings(
+            os.path.join(args.record_dir, crate.pv_prefix),
+            max_bytes=int(args.record_max_size * 1024 * 1024),
+            max_age=args.record_max_age * 3600, keep=args.record_keep)
     monitor.watch_sensors(int(args.sensors_polling_rate * 1000))
+    if args.sel_journal_dir:
+        monitor.journal_sel(
+            get_journal_path(args.sel_journal_dir, crate.pv_prefix))
     if args.sel_polling_rate > 0:
         monitor.watch_sel(int(args.sel_polling_rate * 1000))
 
+
+def start_crate_monitors(crates, args):
+    """ Starts the monitor of each crate, the crates failing to start are
+        logged and tried again after the others. A crate that already
+        defined some of its records is not retried, records can't be
+        removed from the database.
+        Returns:
+           A dict of the monitors started by PV prefix
+    """
+    for crate in crates:
+        builder.SetDeviceName(crate.pv_prefix)
+        builder.stringIn("HOSTNAME", VAL=os.uname()[1])
+
+    monitors = {}
+    pending = list(crates)
+    for attempt in range(args.crate_retries + 1):
+        if attempt:
+            log.info('Trying %d crates again in %g s', len(pending),
+                     args.crate_retry_delay)
+            time.sleep(args.crate_retry_delay)
+        failed = []
+        for crate in pending:
+            log.info('Starting monitor for %s (%s)', crate.mch_ip,
+                     crate.pv_prefix)
+            nrecords = builder.CountRecords()
+            try:
+                monitors[crate.pv_prefix] = start_crate_monitor(crate, args)
+            except Exception as e:
+                log.error('Failed to start monitor for %s (%s): %s',
+                          crate.mch_ip, crate.pv_prefix, e)
+                if builder.CountRecords() == nrecords:
+                    failed.append(crate)
+                else:
+                    log.error('Not retrying %s, some of its records are '
+                              'already defined', crate.pv_prefix)
+        pending = failed
+        if not pending:
+            break
+
+    for crate in pending:
+        log.error('Giving up on %s (%s)', crate.mch_ip, crate.pv_prefix)
+    return monitors
+
+
+def main():
+    args = parse_args()
+    log_level = getattr(logging, args.log_level.upper())
+    logging.basicConfig(level=log_level)
+    if args.crates_file:
+        crates = parse_crates_file(args.crates_file)
+    else:
+        crates = [CrateConfig(args.mch_ip, args.pv_prefix, None)]
+
+    # all crates share the same softioc database, each one with its own
+    # IPMI session and polling threads
+    monitors = start_crate_monitors(crates, args)
+    if not monitors:
+        raise SystemExit('No crate could be started')
+    monitor = monitors.get(crates[0].pv_prefix)
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(monitors, args.metrics_port,
+                                       args.metrics_host)
+        metrics_server.start()
+
     # Now get the IOC started
     builder.LoadDatabase()
     softioc.iocInit()
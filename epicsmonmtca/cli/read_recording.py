@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import sys
+
+from datetime import datetime
+
+from epicsmonmtca.recorder import read_recording
+from epicsmonmtca.timeutils import parse_time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Prints the sensor readings recorded by the IOC as CSV')
+    parser.add_argument('record_dir')
+    parser.add_argument(
+        '--start', type=parse_time, default=None,
+        help='Epoch seconds, ISO date (e.g. 2024-05-01T12:00) or time '
+             'back from now (e.g. 12h, 7d)')
+    parser.add_argument('--end', type=parse_time, default=None,
+                        help='Same formats as --start')
+    parser.add_argument(
+        '--sensor', action='append', default=None,
+        help='Glob pattern of the sensor PV suffixes to print, e.g. '
+             '"AMC2:*TEMP*", can be repeated')
+    parser.add_argument('--epoch', action='store_true',
+                        help='Print the times as epoch seconds')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['time', 'sensor', 'value', 'status'])
+    for reading in read_recording(args.record_dir, args.start, args.end,
+                                  args.sensor):
+        timestamp = reading.time if args.epoch else \
+            datetime.fromtimestamp(reading.time).isoformat()
+        writer.writerow([timestamp, reading.sensor,
+                         '{:g}'.format(reading.value), reading.status])
+
+
+if __name__ == "__main__":
+    main()
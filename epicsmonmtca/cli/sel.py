@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+import argparse
+
+from datetime import datetime
+
+from epicsmonmtca.seljournal import EVENT_KINDS, query_sel_journal
+from epicsmonmtca.timeutils import parse_time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Queries the SEL entries journaled by the IOC')
+    parser.add_argument('journal_path')
+    parser.add_argument(
+        '--since', type=parse_time, default=None,
+        help='Epoch seconds, ISO date (e.g. 2024-05-01T12:00) or time back '
+             'from now (e.g. 12h, 7d)')
+    parser.add_argument('--until', type=parse_time, default=None,
+                        help='Same formats as --since')
+    parser.add_argument('--slot', default=None, help='e.g. AMC5')
+    parser.add_argument('--sensor', default=None,
+                        help='Glob pattern of the sensor name')
+    parser.add_argument('--kind', default=None, choices=sorted(EVENT_KINDS))
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Only the newest events')
+    parser.add_argument('--raw', action='store_true',
+                        help='Print the raw SEL entries as well')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    events = query_sel_journal(args.journal_path, args.since, args.until,
+                               args.slot, args.sensor, args.kind, args.limit)
+    for event in events:
+        line = event.summary or '{} {} {}'.format(
+            datetime.fromtimestamp(event.time).strftime('%Y-%m-%d %H:%M:%S'),
+            event.slot or '-', event.sensor or '-')
+        if args.raw:
+            line += ' [{}]'.format(' '.join('%02x' % b for b in event.raw))
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+import argparse
+import logging
+
+from epicsmonmtca.simulator import MchSimulator, build_crate
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Simulated MCH answering IPMI over RMCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6230)
+    parser.add_argument('--sensors', type=int, default=50,
+                        help='Number of temperature sensors in the crate')
+    parser.add_argument('--amcs', type=int, default=12,
+                        help='Number of AMCs in the crate')
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='Sensor reading latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Sensor reading jitter in ms')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sim = MchSimulator(build_crate(args.sensors, args.amcs), host=args.host,
+                       port=args.port, latency=args.latency / 1000.0,
+                       jitter=args.jitter / 1000.0)
+    sim.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+import logging
+import math
+
+from array import array
+
+from softioc import alarm
+
+log = logging.getLogger(__name__)
+RAW_VALUES = 256  # sensor readings are one byte wide
+THRESHOLD_READING_TYPE = 0x01
+THRESHOLD_STATUS_MASK = 0x3f
+# severity of a threshold based sensor for each value of the status byte,
+# any threshold crossed is a minor alarm
+THRESHOLD_SEVERITIES = array(
+    'B', [alarm.MINOR_ALARM if status & THRESHOLD_STATUS_MASK
+          else alarm.NO_ALARM for status in range(RAW_VALUES)])
+# thresholds in Get Sensor Thresholds order, also the bits of its mask
+THRESHOLD_NAMES = ('lnc', 'lcr', 'lnr', 'unc', 'ucr', 'unr')
+# EPICS alarm limit of each threshold, a non-recoverable threshold is only
+# used when the critical one is missing
+THRESHOLD_LIMITS = (
+    ('LOW', ('lnc',)),
+    ('LOLO', ('lcr', 'lnr')),
+    ('HIGH', ('unc',)),
+    ('HIHI', ('ucr', 'unr')),
+)
+
+
+def get_threshold_limits(values):
+    """ Arguments:
+           values: engineering value of each threshold by name
+        Returns:
+           The LOW, LOLO, HIGH and HIHI fields given by the thresholds
+    """
+    limits = {}
+    for (field, names) in THRESHOLD_LIMITS:
+        for name in names:
+            if values.get(name) is not None:
+                limits[field] = values[name]
+                break
+    return limits
+
+
+def get_limits_severity(value, limits):
+    if value >= limits.get('HIHI', math.inf) or \
+            value <= limits.get('LOLO', -math.inf):
+        return alarm.MAJOR_ALARM
+    if value >= limits.get('HIGH', math.inf) or \
+            value <= limits.get('LOW', -math.inf):
+        return alarm.MINOR_ALARM
+    return alarm.NO_ALARM
+
+
+class SensorValueTables(object):
+    """ Engineering values of every raw reading of the full sensors of a
+        crate, kept in one flat array with a 256 entry table per sensor, so
+        converting a reading is a lookup instead of evaluating the SDR
+        conversion formula. Sensors with known thresholds get a table with
+        the severity of every raw reading as well. The tables of removed
+        sensors (e.g. extracted modules) are reused by the next ones """
+    def __init__(self):
+        self._values = array('d')
+        self._severities = array('B')
+        self._threshold_based = array('B')
+        self._has_limits = array('B')
+        self._free = []
+
+    def __len__(self):
+        return len(self._threshold_based) - len(self._free)
+
+    def add(self, sdr_entry):
+        """ Returns:
+               The index of the table of the sensor
+        """
+        values = array('d')
+        for raw in range(RAW_VALUES):
+            try:
+                value = sdr_entry.convert_sensor_raw_to_value(raw)
+            except Exception:
+                value = float('nan')
+            values.append(value)
+        severities = array('B', [alarm.NO_ALARM]) * RAW_VALUES
+        threshold_based = \
+            sdr_entry.event_reading_type_code == THRESHOLD_READING_TYPE
+
+        if not self._free:
+            self._values.extend(values)
+            self._severities.extend(severities)
+            self._threshold_based.append(threshold_based)
+            self._has_limits.append(False)
+            return len(self._threshold_based) - 1
+
+        index = self._free.pop()
+        start = index * RAW_VALUES
+        self._values[start:start + RAW_VALUES] = values
+        self._severities[start:start + RAW_VALUES] = severities
+        self._threshold_based[index] = threshold_based
+        self._has_limits[index] = False
+        return index
+
+    def remove(self, index):
+        """ The table can be given to another sensor from now on """
+        self._free.append(index)
+
+    def set_thresholds(self, index, thresholds):
+        """ Arguments:
+               thresholds: raw value of each readable threshold by name
+            Returns:
+               The alarm limits of the sensor as record fields
+        """
+        values = {}
+        for (name, raw) in thresholds.items():
+            value = self.get_value(index, raw)
+            if not math.isnan(value):
+                values[name] = value
+        limits = get_threshold_limits(values)
+        if not limits:
+            return limits
+
+        start = index * RAW_VALUES
+        for raw in range(RAW_VALUES):
+            value = self._values[start + raw]
+            self._severities[start + raw] = alarm.NO_ALARM \
+                if math.isnan(value) else get_limits_severity(value, limits)
+        self._has_limits[index] = True
+        return limits
+
+    def get_value(self, index, raw):
+        return self._values[index * RAW_VALUES + raw]
+
+    def get_values(self, index):
+        start = index * RAW_VALUES
+        return self._values[start:start + RAW_VALUES]
+
+    def get_severity(self, index, raw, status):
+        """ Severity from the thresholds when they are known, from the
+            threshold status bits of the reading otherwise """
+        if self._has_limits[index]:
+            return self._severities[index * RAW_VALUES + raw]
+        if self._threshold_based[index]:
+            return THRESHOLD_SEVERITIES[status & 0xff]
+        return alarm.NO_ALARM
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+from collections import namedtuple
+
+CrateConfig = namedtuple('CrateConfig',
+                         ['mch_ip', 'pv_prefix', 'manifest_path'])
+
+
+def parse_crates_file(filepath):
+    """ Parses a file with one crate per line
+        Each line has the format: <mch_ip> <pv_prefix> [<manifest_path>],
+        empty lines and lines starting with # are ignored
+        Returns:
+           A list of CrateConfig
+    """
+    crates = []
+    with open(filepath, 'r') as fhandle:
+        for line in fhandle:
+            sline = line.strip()
+            if sline.startswith("#") or not sline:
+                continue
+            fields = sline.split()
+            if len(fields) not in (2, 3):
+                raise ValueError('Invalid crate definition: {}'.format(sline))
+            manifest_path = fields[2] if len(fields) == 3 else None
+            crates.append(CrateConfig(fields[0], fields[1], manifest_path))
+
+    if not crates:
+        raise ValueError('No crates defined in {}'.format(filepath))
+
+    prefixes = [crate.pv_prefix for crate in crates]
+    if len(set(prefixes)) != len(prefixes):
+        raise ValueError('Crates must have different PV prefixes')
+
+    return crates
@@ -7,8 +7,7 @@ WW = GRID * 8    # default widget width
 BH = GRID * 4    # default banner height
 
 
-def screen(w, h, title):
-    return Template('''4 0 1
+SCREEN_TEMPLATE = Template('''4 0 1
 beginScreenProperties
 major 4
 minor 0
@@ -34,13 +33,14 @@ showGrid
 snapToGrid
 gridSize 8
 endScreenProperties
-''').safe_substitute(**locals())
+''')
 
 
-def static_text(x, y, s):
-    w = TW
-    h = TH
-    return Template('''
+def screen(w, h, title):
+    return SCREEN_TEMPLATE.safe_substitute(**locals())
+
+
+STATIC_TEXT_TEMPLATE = Template('''
 # (Static Text)
 object activeXTextClass
 beginObjectProperties
@@ -58,13 +58,16 @@ value {
   "${s}"
 }
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def text_monitor(x, y, pv):
+def static_text(x, y, s):
     w = TW
     h = TH
-    return Template('''
+    return STATIC_TEXT_TEMPLATE.safe_substitute(**locals())
+
+
+TEXT_MONITOR_TEMPLATE = Template('''
 # (Text Monitor)
 object activeXTextDspClass:noedit
 beginObjectProperties
@@ -90,13 +93,16 @@ showUnits
 newPos
 objType "monitors"
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def text_control(x, y, pv):
+def text_monitor(x, y, pv):
     w = TW
     h = TH
-    return Template('''
+    return TEXT_MONITOR_TEMPLATE.safe_substitute(**locals())
+
+
+TEXT_CONTROL_TEMPLATE = Template('''
 # (Text Control)
 object activeXTextDspClass
 beginObjectProperties
@@ -119,13 +125,16 @@ useHexPrefix
 newPos
 objType "controls"
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def button_toggle(x, y, spv, rpv):
-    w = WW
-    h = WH
-    return Template('''
+def text_control(x, y, pv):
+    w = TW
+    h = TH
+    return TEXT_CONTROL_TEMPLATE.safe_substitute(**locals())
+
+
+BUTTON_TOGGLE_TEMPLATE = Template('''
 # (Button)
 object activeButtonClass
 beginObjectProperties
@@ -148,11 +157,16 @@ indicatorPv "${rpv}"
 font "arial-medium-r-12.0"
 objType "controls"
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def button_push(x, y, spv, rpv):
-    return Template('''
+def button_toggle(x, y, spv, rpv):
+    w = WW
+    h = WH
+    return BUTTON_TOGGLE_TEMPLATE.safe_substitute(**locals())
+
+
+BUTTON_PUSH_TEMPLATE = Template('''
 # (Button)
 object activeButtonClass
 beginObjectProperties
@@ -176,11 +190,14 @@ buttonType "push"
 font "arial-medium-r-12.0"
 objType "controls"
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def menu(x, y, spv, rpv):
-    return Template('''
+def button_push(x, y, spv, rpv):
+    return BUTTON_PUSH_TEMPLATE.safe_substitute(**locals())
+
+
+MENU_TEMPLATE = Template('''
 # (Menu Button)
 object activeMenuButtonClass
 beginObjectProperties
@@ -200,11 +217,14 @@ controlPv "${spv}"
 indicatorPv "${rpv}"
 font "arial-medium-r-12.0"
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def byte(x, y, pv, c1=15, c2=19):  # default colors: green on and green off
-    return Template('''
+def menu(x, y, spv, rpv):
+    return MENU_TEMPLATE.safe_substitute(**locals())
+
+
+BYTE_TEMPLATE = Template('''
 # (Byte)
 object ByteClass
 beginObjectProperties
@@ -221,12 +241,14 @@ onColor index ${c1}
 offColor index ${c2}
 numBits 1
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def banner(w, title="$(device)"):
-    h = BH
-    return Template('''
+def byte(x, y, pv, c1=15, c2=19):  # default colors: green on and green off
+    return BYTE_TEMPLATE.safe_substitute(**locals())
+
+
+BANNER_TEMPLATE = Template('''
 # (Static Text)
 object activeXTextClass
 beginObjectProperties
@@ -246,11 +268,15 @@ value {
 }
 border
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def waveform(x, y, pv):
-    return Template('''
+def banner(w, title="$(device)"):
+    h = BH
+    return BANNER_TEMPLATE.safe_substitute(**locals())
+
+
+WAVEFORM_TEMPLATE = Template('''
 # (X-Y Graph)
 object xyGraphClass
 beginObjectProperties
@@ -291,11 +317,14 @@ plotColor {
   0 index 14
 }
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def embed(x, y, w, h, filename, macros):
-    return Template('''
+def waveform(x, y, pv):
+    return WAVEFORM_TEMPLATE.safe_substitute(**locals())
+
+
+EMBED_TEMPLATE = Template('''
 # (Embedded Window)
 object activePipClass
 beginObjectProperties
@@ -322,11 +351,14 @@ symbols {
 }
 noScroll
 endObjectProperties
-''').safe_substitute(**locals())
+''')
 
 
-def related_display(x, y, w, h, label, filename, macros):
-    return Template('''
+def embed(x, y, w, h, filename, macros):
+    return EMBED_TEMPLATE.safe_substitute(**locals())
+
+
+RELATED_DISPLAY_TEMPLATE = Template('''
 # (Related Display)
 object relatedDisplayClass
 beginObjectProperties
@@ -352,7 +384,11 @@ symbols {
 }
 topShadowColor index 1
 endObjectProperties
-''').safe_substitute(**locals())
+''')
+
+
+def related_display(x, y, w, h, label, filename, macros):
+    return RELATED_DISPLAY_TEMPLATE.safe_substitute(**locals())
 
 
 def embedded_grid(title, w_h_filenames, max_width=1600):
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+import logging
+import threading
+
+from queue import Queue
+
+from pyipmi.fru import FruInventory
+
+log = logging.getLogger(__name__)
+FRU_HEADER_LENGTH = 8
+# cards are told apart by an info area up to its serial number: header
+# offset of the area, bytes before its first field and index of the serial
+# number field, for the board area and, without it, the product area
+FRU_IDENTITY_AREAS = ((3, 6, 2), (4, 3, 4))
+FRU_END_OF_FIELDS = 0xc1
+FRU_INFO_AREA_OFFSETS = (2, 3, 4)  # chassis, board and product info areas
+FRU_MULTIRECORD_OFFSET = 5
+
+
+def get_fru_cache_key(fru_id):
+    return 'fru:{}'.format(fru_id)
+
+
+def get_area_identity(area, fixed_length, serial_index):
+    """ Returns:
+           The start of an info area up to the end of its serial number
+           field
+    """
+    pos = fixed_length
+    for _ in range(serial_index + 1):
+        if pos >= len(area) or area[pos] == FRU_END_OF_FIELDS:
+            break
+        pos += 1 + (area[pos] & 0x3f)
+    return bytes(area[:pos])
+
+
+def read_fru_fingerprint(ipmi, fru_id):
+    """ Identifies the card behind a FRU device by the common header and
+        the board info area up to the serial number, or the product info
+        area when there is no board area
+    """
+    header = bytes(ipmi.read_fru_data(offset=0, count=FRU_HEADER_LENGTH,
+                                      fru_id=fru_id))
+    identity = b''
+    for (index, fixed_length, serial_index) in FRU_IDENTITY_AREAS:
+        offset = header[index] * 8
+        if not offset:
+            continue
+        area_header = ipmi.read_fru_data(offset=offset, count=2,
+                                         fru_id=fru_id)
+        area = ipmi.read_fru_data(offset=offset, count=area_header[1] * 8,
+                                  fru_id=fru_id)
+        identity = get_area_identity(area, fixed_length, serial_index)
+        break
+
+    return (header + identity).hex()
+
+
+def read_fru_info_areas(ipmi, fru_id):
+    """ Reads the common header and the info areas of a FRU inventory
+        Arguments:
+           ipmi: pyipmi connection
+           fru_id: FRU device id
+        Returns:
+           The FRU data with only the info areas in place, which is
+           enough to build a FruInventory with fewer reads than
+           get_fru_inventory
+    """
+    header = bytearray(ipmi.read_fru_data(
+        offset=0, count=FRU_HEADER_LENGTH, fru_id=fru_id))
+    # the multirecord area is not used, drop it and fix the checksum
+    header[FRU_MULTIRECORD_OFFSET] = 0
+    header[-1] = -sum(header[:-1]) & 0xff
+    data = bytearray(header)
+    for index in FRU_INFO_AREA_OFFSETS:
+        offset = header[index] * 8
+        if not offset:
+            continue
+        area_header = ipmi.read_fru_data(offset=offset, count=2,
+                                         fru_id=fru_id)
+        area = ipmi.read_fru_data(offset=offset, count=area_header[1] * 8,
+                                  fru_id=fru_id)
+        if len(data) < offset + len(area):
+            data.extend(bytes(offset + len(area) - len(data)))
+        data[offset:offset + len(area)] = area
+
+    return data
+
+
+class FruFetcher(object):
+    """ Reads the FRU inventories of the modules in a background thread,
+        so module discovery doesn't wait for them """
+    def __init__(self, ipmi, ipmi_lock, cache=None):
+        self.ipmi = ipmi
+        self.ipmi_lock = ipmi_lock
+        self.cache = cache
+        # once set, the inventories are read through the request engine
+        self.engine = None
+        self._queue = Queue()
+        self._thread = None
+
+    def fetch(self, mtca_mod, fru_id, fingerprint):
+        self._queue.put((mtca_mod, fru_id, fingerprint))
+        if not self._thread:
+            self._thread = threading.Thread(None, self._fetch_loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _fetch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            mtca_mod, fru_id, fingerprint = item
+            log.info('Reading fru %d', fru_id)
+            try:
+                if self.engine:
+                    data = self.engine.call(
+                        read_fru_info_areas, self.ipmi, fru_id).result()
+                else:
+                    with self.ipmi_lock:
+                        data = read_fru_info_areas(self.ipmi, fru_id)
+                mtca_mod.fru = FruInventory(data)
+            except Exception as e:
+                log.error('Failed to read fru %d: %s', fru_id, e)
+                continue
+
+            if self.cache:
+                self.cache.put(get_fru_cache_key(fru_id), fingerprint, [data])
+
+        if self.cache:
+            self.cache.save()
+
+    def wait(self):
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+import logging
+import math
+import threading
+import time
+
+from array import array
+
+from softioc import builder
+
+from epicsmonmtca.timeutils import time_ms
+
+log = logging.getLogger(__name__)
+DEFAULT_HISTORY_DEPTH = 600  # samples, 10 minutes of a 1 s sensor
+HISTORY_PUBLISH_PERIOD = 5000  # ms
+# a history frozen by an alarm keeps recording this fraction of its depth,
+# so it shows what happened after the alarm as well as before
+POST_TRIGGER_FRACTION = 0.25
+
+
+class HistoryStore(object):
+    """ Ring buffers with the last readings of every sensor
+
+        All the sensors share two flat arrays, values and timestamps (epoch
+        seconds), sensor i owns the slice [i * depth, (i + 1) * depth). So a
+        reading costs two array stores instead of a Python object and the
+        memory is 16 bytes per sample, known as soon as the sensors are
+        added. The histories are published as waveforms every
+        HISTORY_PUBLISH_PERIOD, keeping one sample out of `decimation`.
+
+        A frozen history keeps its contents until it is released, the
+        waveforms then show the readings around the moment it was frozen.
+    """
+    def __init__(self, depth=DEFAULT_HISTORY_DEPTH, decimation=1):
+        self.depth = depth
+        self.decimation = max(1, decimation)
+        self._values = array('d')
+        self._times = array('d')
+        self._heads = array('l')
+        self._counts = array('l')
+        # samples still recorded by a history being frozen, -1 if it is not
+        self._remaining = array('l')
+        self._dirty = set()
+        self._records = []
+        self._freeze_record = None
+        self._lock = threading.Lock()
+        self._last_publish = time_ms()
+
+    def __len__(self):
+        return len(self._heads)
+
+    @property
+    def nbytes(self):
+        return (self._values.itemsize + self._times.itemsize) * \
+            len(self._values)
+
+    def add_sensor(self, prefix):
+        """ Adds the history of a sensor and its waveform records
+            Returns:
+               The index of the sensor in the store
+        """
+        length = self.depth // self.decimation
+        with self._lock:
+            index = len(self._heads)
+            self._values.extend(array('d', [math.nan]) * self.depth)
+            self._times.extend(array('d', [0.0]) * self.depth)
+            self._heads.append(0)
+            self._counts.append(0)
+            self._remaining.append(-1)
+        self._records.append((
+            builder.WaveformIn(prefix + ':HIST', length=length, FTVL='DOUBLE'),
+            builder.WaveformIn(prefix + ':HIST:TIME', length=length,
+                               FTVL='DOUBLE')))
+        return index
+
+    def create_records(self):
+        """ HIST:FREEZE freezes all the histories when set to 1 and releases
+            them when set back to 0 """
+        self._freeze_record = builder.boolOut(
+            'HIST:FREEZE', ZNAM='Running', ONAM='Frozen',
+            on_update=self._on_freeze_update)
+
+    def _on_freeze_update(self, value):
+        if value:
+            self.freeze_all()
+        else:
+            self.release()
+
+    def append(self, index, value, timestamp=None):
+        with self._lock:
+            remaining = self._remaining[index]
+            if remaining == 0:
+                return
+            if remaining > 0:
+                self._remaining[index] = remaining - 1
+            head = self._heads[index]
+            pos = index * self.depth + head
+            self._values[pos] = value
+            self._times[pos] = time.time() if timestamp is None \
+                else timestamp
+            self._heads[index] = (head + 1) % self.depth
+            if self._counts[index] < self.depth:
+                self._counts[index] += 1
+            self._dirty.add(index)
+
+    def freeze(self, index, post_trigger=True):
+        """ Stops recording the history of a sensor, after
+            POST_TRIGGER_FRACTION of its depth if post_trigger is set. A
+            frozen history stays frozen, a second alarm doesn't overwrite
+            the first one """
+        with self._lock:
+            if self._remaining[index] < 0:
+                self._remaining[index] = \
+                    int(self.depth * POST_TRIGGER_FRACTION) \
+                    if post_trigger else 0
+
+    def freeze_all(self):
+        for index in range(len(self)):
+            self.freeze(index, post_trigger=False)
+
+    def release(self, index=None):
+        """ Records the history of a sensor again, of all of them if index is
+            None """
+        with self._lock:
+            indexes = range(len(self)) if index is None else [index]
+            for i in indexes:
+                self._remaining[i] = -1
+
+    def is_frozen(self, index):
+        return self._remaining[index] == 0
+
+    def snapshot(self, index):
+        """ Returns:
+               A (values, timestamps) tuple of arrays, oldest first and
+               decimated
+        """
+        with self._lock:
+            base = index * self.depth
+            head = self._heads[index]
+            count = self._counts[index]
+            if count < self.depth:
+                values = self._values[base:base + count]
+                times = self._times[base:base + count]
+            else:
+                values = self._values[base + head:base + self.depth] + \
+                    self._values[base:base + head]
+                times = self._times[base + head:base + self.depth] + \
+                    self._times[base:base + head]
+        if self.decimation > 1 and values:
+            # the newest sample is always kept
+            start = (len(values) - 1) % self.decimation
+            values = values[start::self.decimation]
+            times = times[start::self.decimation]
+        return (values, times)
+
+    def publish_if_due(self):
+        now = time_ms()
+        if now - self._last_publish < HISTORY_PUBLISH_PERIOD:
+            return
+        self._last_publish = now
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+        for index in dirty:
+            (values, times) = self.snapshot(index)
+            (values_record, times_record) = self._records[index]
+            values_record.set(values)
+            times_record.set(times)
@@ -52,6 +52,14 @@ threshold_offsets_msg = [
 ]
 
 
+def get_sdr_name(entry):
+    name = getattr(entry, 'device_id_string', None)
+    if name is None:
+        return ''
+    # older python-ipmi versions return bytes
+    return name.decode() if isinstance(name, bytes) else name
+
+
 def get_sdr_egu(entry):
     unit1 = entry.units_1
     unit2 = entry.units_2
@@ -65,10 +73,12 @@ def get_sdr_egu(entry):
             + ((mod_unit + rate_unit) if rate_unit else "")).strip()
 
 
-def get_sdr_prec(entry):
-    delta = entry.convert_sensor_raw_to_value(0) - \
-        entry.convert_sensor_raw_to_value(1)
-    offset = entry.convert_sensor_raw_to_value(0)
+def get_sdr_prec(entry, values=None):
+    # values is the table of converted readings when already available
+    if values is None:
+        values = [entry.convert_sensor_raw_to_value(raw) for raw in (0, 1)]
+    delta = values[0] - values[1]
+    offset = values[0]
     delta_frac = delta % 1
     offset_frac = offset % 1
     prec = 0
@@ -1,11 +1,27 @@
 #!/usr/bin/env python
 from collections import namedtuple
+from fnmatch import fnmatchcase
 
 from epicsmonmtca.mtcautils import valid_mtca_module_types
+from epicsmonmtca.polling import Deadband
 
 ManifestModule = namedtuple('ManifestModule', ['name', 'sensors'])
-ManifestSensor = namedtuple('ManifestSensor', ['name'])
+# attributes of a sensor in the manifest, None when not given
+SensorPolicy = namedtuple('SensorPolicy', ['period', 'deadband', 'severity'],
+                          defaults=(None, None, None))
+# pattern is set when the name is a glob pattern
+ManifestSensor = namedtuple('ManifestSensor', ['name', 'policy', 'pattern'],
+                            defaults=(SensorPolicy(), False))
 SENSOR_START_MARK = '-'
+# sensor attributes go after this mark, e.g. "- FPGA Temp | period=500"
+ATTRIBUTES_MARK = '|'
+# sensor names are taken as they are unless they start with this prefix,
+# e.g. "- glob:Temp*", sensor names can contain wildcard characters
+GLOB_PREFIX = 'glob:'
+WILDCARD_CHARS = '*?['
+ANY_SLOT = ('*', '*')
+# severities a manifest can give to a sensor crossing its thresholds
+SEVERITY_NAMES = ('NONE', 'MINOR', 'MAJOR')
 
 
 def create_manifest(slots, output_path):
@@ -17,7 +33,62 @@ def create_manifest(slots, output_path):
                 fhandle.write("{} {}\n".format(SENSOR_START_MARK, sensor.name))
 
 
+def is_pattern(text):
+    return any(char in text for char in WILDCARD_CHARS)
+
+
+def is_slot_pattern(slot_key):
+    return slot_key[0] == '*' or not isinstance(slot_key[1], int)
+
+
+def parse_sensor_policy(text):
+    """ Parses "period=500 deadband=0.5 severity=major", the deadband is
+        relative to the last value when it ends with % """
+    fields = {}
+    for item in text.split():
+        key, _, value = item.partition('=')
+        key = key.strip().lower()
+        if key == 'period':
+            fields['period'] = int(value)
+        elif key == 'deadband':
+            if value.endswith('%'):
+                fields['deadband'] = Deadband(0.0, float(value[:-1]) / 100)
+            else:
+                fields['deadband'] = Deadband(float(value), 0.0)
+        elif key == 'severity':
+            severity = value.upper()
+            if severity not in SEVERITY_NAMES:
+                raise ValueError('Invalid severity {}'.format(value))
+            fields['severity'] = severity
+        else:
+            raise ValueError('Unknown sensor attribute {}'.format(key))
+
+    return SensorPolicy(**fields)
+
+
+def parse_slot_key(field):
+    mod_type, mod_number = (part.strip() for part in field.split(','))
+    if mod_type != '*' and mod_type not in valid_mtca_module_types:
+        raise ValueError('Invalid module type')
+    return (mod_type, mod_number if is_pattern(mod_number)
+            else int(mod_number))
+
+
+def parse_sensor_name(text):
+    """ Returns:
+           The sensor name, or the pattern without GLOB_PREFIX, and whether
+           it is a pattern
+    """
+    if text.startswith(GLOB_PREFIX):
+        return (text[len(GLOB_PREFIX):].strip(), True)
+    return (text, False)
+
+
 def parse_manifest(filepath):
+    """ Returns:
+           A dict of slot key to ManifestModule in file order, slot keys
+           can be glob patterns and so can the sensors flagged as patterns
+    """
     slots = {}
     slot_id = None
     with open(filepath, 'r') as fhandle:
@@ -29,22 +100,99 @@ def parse_manifest(filepath):
                 if not slot_id:
                     raise ValueError(
                         'No module associated to {}'.format(sline))
-                slots[slot_id].sensors.append(ManifestSensor(sline[2:]))
+                name, _, attributes = sline[2:].partition(ATTRIBUTES_MARK)
+                name, pattern = parse_sensor_name(name.strip())
+                slots[slot_id].sensors.append(ManifestSensor(
+                    name, parse_sensor_policy(attributes), pattern))
             else:
-                field, key = sline.split(':')
-                mod_type, mod_number = field.split(',')
-                slot_id = (mod_type.strip(), int(mod_number))
-                if slot_id[0] not in valid_mtca_module_types:
-                    raise ValueError('Invalid module type')
-                slots[slot_id] = ManifestModule(key, [])
+                field, key = sline.split(':', 1)
+                slot_id = parse_slot_key(field)
+                slots.setdefault(slot_id, ManifestModule(key.strip(), []))
 
     return slots
 
 
-def parse_manifest_sensor_names(filepath):
-    slots = parse_manifest(filepath)
-    sensors = []
-    for _, mod in slots.items():
-        sensors.extend([i.name for i in mod.sensors])
+def get_concrete_modules(slots):
+    """ Returns:
+           The modules and sensors of a parsed manifest that name a single
+           slot or sensor, which are the ones with screens and PVs
+    """
+    return {
+        slot_id: ManifestModule(
+            mod.name, [sensor for sensor in mod.sensors if not sensor.pattern])
+        for (slot_id, mod) in slots.items() if not is_slot_pattern(slot_id)}
+
+
+def merge_policies(policies):
+    """ The first policy giving an attribute wins """
+    return SensorPolicy(*(
+        next((value for value in values if value is not None), None)
+        for values in zip(*policies)))
+
+
+class ManifestIndex(object):
+    """ Manifest compiled for lookups by slot and sensor name
+
+        A sensor matches exact (slot, name) entries first, then names listed
+        for any slot, then the patterns in file order. It is allowed when
+        anything matches and its attributes are taken from the first match
+        giving each of them. Every result is memoized, so looking a sensor
+        up again is a single dict access.
+    """
+    def __init__(self, slots=None):
+        self._exact = {}
+        self._any_slot = {}
+        self._patterns = []
+        self._memo = {}
+        for (slot_key, mod) in (slots or {}).items():
+            for sensor in mod.sensors:
+                self.add(slot_key, sensor.name, sensor.policy,
+                         sensor.pattern)
+
+    @classmethod
+    def from_file(cls, filepath):
+        return cls(parse_manifest(filepath))
+
+    @classmethod
+    def from_names(cls, names):
+        """ Index of a plain list of sensor names, allowed in any slot """
+        index = cls()
+        for name in names:
+            index.add(ANY_SLOT, name)
+        return index
+
+    def add(self, slot_key, name, policy=SensorPolicy(), pattern=False):
+        self._memo.clear()
+        slot_pattern = '{},{}'.format(*slot_key)
+        if pattern or (is_slot_pattern(slot_key) and slot_key != ANY_SLOT):
+            self._patterns.append((slot_pattern, name, pattern, policy))
+        elif slot_key == ANY_SLOT:
+            self._any_slot[name] = policy
+        else:
+            self._exact[(slot_key, name)] = policy
+
+    def lookup(self, slot_id, name):
+        """ Returns:
+               The SensorPolicy of the sensor, None if it is not allowed
+        """
+        key = (slot_id, name)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+
+        matches = []
+        if key in self._exact:
+            matches.append(self._exact[key])
+        if name in self._any_slot:
+            matches.append(self._any_slot[name])
+        slot = '{},{}'.format(*slot_id) if slot_id else ''
+        for (slot_pattern, pattern_name, pattern, policy) in self._patterns:
+            if fnmatchcase(slot, slot_pattern) and \
+                    (fnmatchcase(name, pattern_name) if pattern
+                     else name == pattern_name):
+                matches.append(policy)
 
-    return sensors
+        policy = merge_policies(matches) if matches else None
+        self._memo[key] = policy
+        return policy
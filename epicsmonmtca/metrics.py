@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+import logging
+import math
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from epicsmonmtca.timeutils import time_ms
+
+log = logging.getLogger(__name__)
+DEFAULT_METRICS_PORT = 9623
+METRICS_PATH = '/metrics'
+METRICS_CONTENT_TYPE = \
+    'application/openmetrics-text; version=1.0.0; charset=utf-8'
+# the body is rendered again at most this often, scrapes in between get
+# the same bytes
+RENDER_PERIOD = 1000  # ms
+# family name, help and PollingStats attribute of each counter
+STATS_COUNTERS = [
+    ('emm_sensor_reads', 'Sensor readings received', 'reads'),
+    ('emm_sensor_read_errors', 'Sensor reads that failed', 'errors'),
+    ('emm_sensor_read_timeouts', 'Sensor reads that timed out', 'timeouts'),
+    ('emm_sensor_event_reads', 'Sensor reads triggered by SEL events',
+     'event_reads'),
+    ('emm_sensor_published', 'Sensor updates published', 'published'),
+    ('emm_sensor_suppressed', 'Sensor updates not published',
+     'suppressed'),
+    ('emm_session_trips', 'Times an IPMI session stopped answering',
+     'trips'),
+]
+# family name, help and LoopTiming attribute of each loop counter
+LOOP_COUNTERS = [
+    ('emm_loop_iterations', 'Wake-ups of the polling loop', 'iterations'),
+    ('emm_loop_overruns', 'Reads done after their next deadline',
+     'overruns'),
+    ('emm_loop_skipped', 'Periods skipped by the polling loop', 'skipped'),
+]
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(key, escape_label_value(value))
+                          for (key, value) in sorted(labels.items())) + '}'
+
+
+def format_metric_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def format_family(name, typ, help_text, samples):
+    """ Returns:
+           The lines of a metric family, samples is a list of (suffix,
+           labels, value) tuples with the labels already formatted
+    """
+    lines = ['# TYPE {} {}'.format(name, typ),
+             '# HELP {} {}'.format(name, help_text)]
+    for (suffix, labels, value) in samples:
+        lines.append('{}{}{} {}'.format(name, suffix, labels,
+                                        format_metric_value(value)))
+    return lines
+
+
+class SensorMetrics(object):
+    """ Latest published value and severity of every sensor of a monitor
+
+        The polling loops only store the pair, the sample lines of a sensor
+        are formatted when the body is rendered and only if the sensor was
+        published since the previous render.
+    """
+    def __init__(self, crate):
+        self.crate = crate
+        self._labels = {}
+        self._lines = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def update(self, slot_id, sensor_name, value, severity):
+        with self._lock:
+            self._pending[(slot_id, sensor_name)] = (value, severity)
+
+    def _get_labels(self, key):
+        labels = self._labels.get(key)
+        if labels is None:
+            (slot_id, sensor_name) = key
+            labels = format_labels(crate=self.crate,
+                                   slot='{}{}'.format(*slot_id),
+                                   sensor=sensor_name)
+            self._labels[key] = labels
+        return labels
+
+    def take_lines(self):
+        """ Returns:
+               A list of (value line, severity line) tuples, sorted by slot
+               and sensor
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        for (key, (value, severity)) in pending.items():
+            labels = self._get_labels(key)
+            self._lines[key] = (
+                'emm_sensor_value{} {}'.format(
+                    labels, format_metric_value(value)),
+                'emm_sensor_severity{} {}'.format(labels, int(severity)))
+        return [self._lines[key] for key in sorted(self._lines)]
+
+
+class MetricsServer(object):
+    """ Serves the readings, severities and polling statistics of monitors
+        in OpenMetrics text format on METRICS_PATH
+
+        A scrape only reads what the polling loops already stored, it never
+        sends IPMI requests. The body is kept for RENDER_PERIOD, so any
+        number of scrapers costs one render per period.
+    """
+    def __init__(self, monitors, port=DEFAULT_METRICS_PORT, host=''):
+        self.monitors = monitors
+        self.port = port
+        self.host = host
+        self._body = None
+        self._last_render = None
+        self._render_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server:
+            return
+        self._server = ThreadingHTTPServer((self.host, self.port),
+                                           MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics = self
+        self.port = self._server.server_address[1]
+        log.info('Serving metrics on port %d', self.port)
+        self._thread = threading.Thread(None, self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def get_body(self):
+        with self._render_lock:
+            now = time_ms()
+            if self._body is None or \
+                    now - self._last_render >= RENDER_PERIOD:
+                self._body = self.render().encode()
+                self._last_render = now
+            return self._body
+
+    def render(self):
+        monitors = [self.monitors[crate] for crate in sorted(self.monitors)]
+        lines = []
+        sensor_lines = [monitor.metrics.take_lines() for monitor in monitors
+                        if monitor.metrics]
+        lines.extend([
+            '# TYPE emm_sensor_value gauge',
+            '# HELP emm_sensor_value Last published value of the sensor'])
+        for crate_lines in sensor_lines:
+            lines.extend(value_line for (value_line, _) in crate_lines)
+        lines.extend([
+            '# TYPE emm_sensor_severity gauge',
+            '# HELP emm_sensor_severity EPICS alarm severity of the sensor, '
+            '0 NO_ALARM, 1 MINOR, 2 MAJOR, 3 INVALID'])
+        for crate_lines in sensor_lines:
+            lines.extend(severity_line for (_, severity_line) in crate_lines)
+
+        crate_labels = [format_labels(crate=monitor.pv_prefix)
+                        for monitor in monitors]
+        for (name, help_text, attr) in STATS_COUNTERS:
+            lines.extend(format_family(name, 'counter', help_text, [
+                ('_total', labels, getattr(monitor.stats, attr))
+                for (monitor, labels) in zip(monitors, crate_labels)]))
+        lines.extend(format_family(
+            'emm_sensors_parked', 'gauge', 'Sensors without value', [
+                ('', labels, monitor.stats.parked)
+                for (monitor, labels) in zip(monitors, crate_labels)]))
+        lines.extend(format_family(
+            'emm_sessions_offline', 'gauge', 'IPMI sessions not answering', [
+                ('', labels, monitor.stats.offline)
+                for (monitor, labels) in zip(monitors, crate_labels)]))
+        for (pct, name) in [(50, 'emm_ipmi_latency_p50_seconds'),
+                            (99, 'emm_ipmi_latency_p99_seconds')]:
+            samples = []
+            for (monitor, labels) in zip(monitors, crate_labels):
+                percentile = monitor.stats.latency.percentile(pct)
+                if percentile is not None:
+                    samples.append(('', labels, percentile / 1000.0))
+            lines.extend(format_family(
+                name, 'gauge', 'Round trip time percentile of the sensor '
+                'reads', samples))
+
+        for (name, help_text, attr) in LOOP_COUNTERS:
+            samples = []
+            for monitor in monitors:
+                for loop in monitor.stats.loops:
+                    samples.append(('_total', format_labels(
+                        crate=monitor.pv_prefix, loop=loop.name),
+                        getattr(loop.timing, attr)))
+            lines.extend(format_family(name, 'counter', help_text, samples))
+
+        lines.append('# EOF\n')
+        return '\n'.join(lines)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+        body = self.server.metrics.get_body()
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        log.debug('%s - %s', self.address_string(), fmt % args)
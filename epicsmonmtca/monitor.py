@@ -1,33 +1,117 @@
 import atexit
+import functools
 import logging
+import math
+import socket
 import threading
 import time
 
 from os import path
 
-from collections import namedtuple
 from datetime import datetime
 
-from pyipmi import create_connection, interfaces, sensor, sdr, Target, errors
+from pyipmi import create_connection, interfaces, sensor, sdr, errors
+from pyipmi.msgs import create_request_by_name
+from pyipmi.utils import check_completion_code
+from pyipmi.fru import FruInventory
 from softioc import softioc, builder, alarm
 
+from epicsmonmtca.cache import (DiskCache, get_cache_path,
+                                read_sdr_repository_info,
+                                sdr_repository_fingerprint, SDR_CACHE_KEY,
+                                THRESHOLDS_CACHE_KEY)
+from epicsmonmtca.conversion import (THRESHOLD_NAMES, THRESHOLD_READING_TYPE,
+                                     SensorValueTables)
 from epicsmonmtca.epicsutils import get_sensor_pv_suffix
+from epicsmonmtca.fruutils import (FruFetcher, get_fru_cache_key,
+                                   read_fru_fingerprint)
+from epicsmonmtca.history import HistoryStore
 from epicsmonmtca.ipmiutils import (hs_states2string, get_sdr_egu,
-                                    get_sdr_prec, threshold_offsets_msg)
-from epicsmonmtca.manifest import create_manifest
-from epicsmonmtca.mtcautils import (entity_to_slot_id, get_slot_fru_id,
-                                    MTCAModule, valid_mtca_module_types)
-from epicsmonmtca.timeutils import reset_timer, time_ms, wait_period
+                                    get_sdr_name, get_sdr_prec,
+                                    threshold_offsets_msg)
+from epicsmonmtca.manifest import (ManifestIndex, SensorPolicy,
+                                   create_manifest)
+from epicsmonmtca.metrics import SensorMetrics
+from epicsmonmtca.mtcautils import (entity_to_slot_id,
+                                    get_carrier_manager_target,
+                                    get_empty_slot_ids, get_owner_target,
+                                    get_slot_fru_id, ipmb_address_to_slot_id,
+                                    is_slot_sensor_record,
+                                    MCH_IPMB_ADDRESS, MTCAModule,
+                                    read_slot_sdr_entries,
+                                    RMCP_SLAVE_ADDRESS,
+                                    valid_mtca_module_types)
+from epicsmonmtca.pipeline import (create_sensor_reading_request,
+                                   decode_sensor_reading, send_message,
+                                   DEFAULT_WINDOW)
+from epicsmonmtca.polling import (DEFAULT_MAX_SILENCE, MAX_IDLE_WAIT,
+                                  MAX_PROBE_BACKOFF, MIN_PROBE_BACKOFF,
+                                  NO_DEADBAND, Deadband,
+                                  SensorScheduler, get_default_polling_period,
+                                  is_outside_deadband)
+from epicsmonmtca.recorder import ReadingRecorder
+from epicsmonmtca.seljournal import SelJournal
+from epicsmonmtca.selutils import SelEventLog, SelReader, SelWorker
+from epicsmonmtca.sessions import (DEFAULT_SESSIONS, IpmiSessionPool,
+                                   SHARD_BY_OWNER, SHARD_BY_SLOT)
+from epicsmonmtca.spares import SpareRecordPool
+from epicsmonmtca.stats import PollingStats
+from epicsmonmtca.timeutils import (CATCH_UP_SKIP, LoopTiming, PeriodicTimer,
+                                    time_ms)
 
 log = logging.getLogger(__name__)
 sel_log = logging.getLogger('sel')
 
 DEFAULT_SENSOR_POLLING_PERIOD = 1000  # ms
-POLLING_TIMER = 0
 DEFAULT_SEL_POLLING_PERIOD = 1000  # ms
-SEL_TIMER = 1
+DEFAULT_RMCP_PORT = 623
+HS_STATE_NOT_INSTALLED = 0
+HS_STATE_ACTIVE = 4
+# severity of threshold crossings set per sensor in the manifest
+MANIFEST_SEVERITIES = {
+    'NONE': alarm.NO_ALARM,
+    'MINOR': alarm.MINOR_ALARM,
+    'MAJOR': alarm.MAJOR_ALARM,
+}
+# FRU records of each slot and the MTCAModule attribute they publish
+FRU_RECORD_FIELDS = [
+    ('MANUFACTURER', 'manufacturer'),
+    ('PARTNUMBER', 'part_number'),
+    ('SERIALNUMBER', 'serial_number'),
+    ('VERSION', 'version'),
+    ('NAME', 'name'),
+    ('PRODUCTNAME', 'product_name'),
+]
 
-SensorWatch = namedtuple('SensorWatch', ['sdr', 'record', 'type'])
+
+class SensorWatch(object):
+    __slots__ = ('sdr', 'record', 'type', 'slot_id', 'period', 'deadband',
+                 'last_raw', 'last_status', 'last_value', 'last_publish',
+                 'backoff', 'bound', 'session', 'severity', 'history')
+
+    def __init__(self, sdr_entry, record, typ, slot_id=None,
+                 period=DEFAULT_SENSOR_POLLING_PERIOD, deadband=NO_DEADBAND):
+        self.sdr = sdr_entry
+        self.record = record
+        self.type = typ
+        self.slot_id = slot_id
+        self.period = period
+        self.deadband = deadband
+        # last reading and last published value, for change detection
+        self.last_raw = None
+        self.last_status = None
+        self.last_value = None
+        self.last_publish = None
+        # time to the next probe while parked, 0 while active
+        self.backoff = 0
+        # False once the module of the sensor is extracted
+        self.bound = True
+        # IPMI session of the pool reading the sensor
+        self.session = None
+        # alarm severity given by the manifest to threshold crossings
+        self.severity = None
+        # index in the history store, None without history
+        self.history = None
 
 
 class InfoType(object):
@@ -38,22 +122,97 @@ class InfoType(object):
 
 class EpicsMonMTCA(object):
     def __init__(self, mch_ip, backend='rmcp', user='', password='',
-                 allowed_sensors=None):
-        self._create_ipmi_session(mch_ip, backend, user, password)
+                 allowed_sensors=None, cache_dir=None, pv_prefix=None,
+                 ipmi_window=DEFAULT_WINDOW, port=DEFAULT_RMCP_PORT,
+                 ipmi_sessions=DEFAULT_SESSIONS):
+        self.mch_ip = mch_ip
+        self.pv_prefix = pv_prefix
+        # the polling loops send their requests through the engines of the
+        # pool, the primary session serves the SEL and FRU requests
+        self.pool = IpmiSessionPool(
+            functools.partial(self._create_ipmi_session, mch_ip, backend,
+                              user, password, port),
+            ipmi_sessions, ipmi_window)
+        self.ipmi = self.pool.primary.ipmi
+        self.engine = self.pool.primary.engine
+        # sensors are spread across the sessions by slot or by owner IPMC
+        self.session_shard = SHARD_BY_SLOT
+        # sensor reads go straight to the controller owning the sensor,
+        # otherwise everything goes to the carrier manager
+        self.route_by_owner = True
+        self._owner_targets = {}
+        self.cache = DiskCache(get_cache_path(cache_dir, mch_ip)) \
+            if cache_dir else None
         self._to_monitor = []
+        # sensors with a value, the parked ones are only probed
+        self.active_sensors = set()
         self._sensor_index = {}
+        # sensors by (owner id, lun, number), to find the sensor of an event
+        self._watch_index = {}
+        # SEL events make the sensors they concern be read right away
+        self.read_on_event = True
+        self.value_tables = SensorValueTables()
+        # raw thresholds by (owner id, lun, number), read once per sensor
+        self._thresholds = {}
+        self._thresholds_changed = False
+        self._sdr_fingerprint = None
+        # the SDR entries behind the cache, updated by slot rescans
+        self._sdr_entries = []
         self.slots = {}
+        # records of the sensors found at startup, by slot and sensor name,
+        # and of the FRU fields of each slot
+        self._slot_records = {}
+        self._fru_records = {}
+        # spare records of the slots empty at startup
+        self.spare_sensors_per_slot = 0
+        self._spare_pools = {}
+        # no records can be created once the polling starts
+        self._records_frozen = False
         self.initialized = False
         self.ipmi_lock = threading.Lock()
-        self.sensor_thread = None
+        # one sensor polling thread per session
+        self.sensor_threads = []
         self.sel_thread = None
         self._quit_sensor_thread = False
         self._quit_sel_thread = False
         self.sensor_polling_period = DEFAULT_SENSOR_POLLING_PERIOD
         self.sel_polling_period = DEFAULT_SEL_POLLING_PERIOD
+        # what the polling loops do with the periods missed while overrunning
+        self.catch_up = CATCH_UP_SKIP
+        self._sel_timer = None
+        # each session reads its own sensors, in deadline order
+        self._polling_timing = LoopTiming()
+        self._schedulers = [SensorScheduler(timing=self._polling_timing)
+                            for _ in self.pool.sessions]
+        self.sensor_polling_overrides = {}
+        self.deadband = NO_DEADBAND
+        self.sensor_deadband_overrides = {}
+        self.max_silence = DEFAULT_MAX_SILENCE
         self._sensor_value_delay = {}
+        self.stats = PollingStats(len(self.pool))
+        # history of the last readings of each sensor, 0 samples disables it
+        self.history_depth = 0
+        self.history_decimation = 1
+        self.freeze_history_on_alarm = False
+        self.history = None
+        self._history_index = {}
+        # local files with every published reading
+        self.recorder = None
+        self.metrics = None
         self._time_logging = False
+        # a ManifestIndex, or a list of sensor names allowed in any slot
+        if allowed_sensors is not None and \
+                not isinstance(allowed_sensors, ManifestIndex):
+            allowed_sensors = ManifestIndex.from_names(allowed_sensors)
         self.allowed_sensors = allowed_sensors
+        self._fru_fetcher = FruFetcher(self.ipmi, self.ipmi_lock, self.cache)
+        self._sel_reader = SelReader(self.ipmi)
+        # the SEL loop only drains the SEL, the entries are handled by the
+        # worker
+        self._sel_worker = SelWorker(self._handle_sel_entry,
+                                     self._flush_sel_journal)
+        self.sel_events = SelEventLog()
+        self.sel_journal = None
 
     def set_time_logging(self, val):
         self._time_logging = val
@@ -69,61 +228,156 @@ class EpicsMonMTCA(object):
 
         log.info('Identifying module %s%d', slot_id[0], slot_id[1])
         try:
-            fru = self.ipmi.get_fru_inventory(fru_id)
+            fingerprint = self._call_ipmi(read_fru_fingerprint, fru_id)
         except errors.CompletionCodeError as e:
             log.error('Got bad completion code while getting fru: %s', e)
             return None
 
-        self.slots[slot_id] = MTCAModule(slot_id, fru)
-        return self.slots[slot_id]
+        mtca_mod = MTCAModule(slot_id, None)
+        self.slots[slot_id] = mtca_mod
+        cached_data = self.cache.get(get_fru_cache_key(fru_id), fingerprint) \
+            if self.cache else None
+        if cached_data:
+            mtca_mod.fru = FruInventory(cached_data[0])
+        else:
+            # the inventory is read in the background, SDR processing
+            # carries on meanwhile
+            self._fru_fetcher.fetch(mtca_mod, fru_id, fingerprint)
+
+        return mtca_mod
 
-    def _create_ipmi_session(self, ip, backend, user='', password=''):
+    def _call_ipmi(self, func, *args):
+        """ Runs func(ipmi, *args) on the primary session, through its
+            engine once the polling has started """
+        if self._records_frozen:
+            return self.engine.call(func, self.ipmi, *args).result()
+        with self.ipmi_lock:
+            return func(self.ipmi, *args)
+
+    def wait_fru_inventories(self):
+        self._fru_fetcher.wait()
+
+    def _create_ipmi_session(self, ip, backend, user='', password='',
+                             port=DEFAULT_RMCP_PORT):
         if backend == 'rmcp':
             interface = interfaces.create_interface(
-                interface='rmcp', slave_address=0x81, host_target_address=0x20,
-                keep_alive_interval=2)
+                interface='rmcp', slave_address=RMCP_SLAVE_ADDRESS,
+                host_target_address=MCH_IPMB_ADDRESS, keep_alive_interval=2)
         elif backend == 'ipmitool':
             interface = interfaces.create_interface(
                 'ipmitool', interface_type='lan')
         else:
             raise ValueError('Unknown IPMI backend')
 
-        self.ipmi = create_connection(interface)
-        self.ipmi.session.set_session_type_rmcp(host=ip, port=623)
-        self.ipmi.session.set_auth_type_user(username=user, password=password)
-        self.ipmi.target = Target(
-            ipmb_address=0x82, routing=[(0x81, 0x20, 0), (0x20, 0x82, None)])
-        self.ipmi.session.establish()
+        ipmi = create_connection(interface)
+        ipmi.session.set_session_type_rmcp(host=ip, port=port)
+        ipmi.session.set_auth_type_user(username=user, password=password)
+        ipmi.target = get_carrier_manager_target()
+        ipmi.session.establish()
+        return ipmi
+
+    def set_ipmi_timeout(self, timeout):
+        """ Sets the timeout in seconds of every session of the pool """
+        self.pool.set_timeout(timeout)
+
+    def set_trip_timeouts(self, timeouts):
+        """ Consecutive read timeouts after which a session is considered
+            down, 0 keeps polling it whatever happens """
+        self.pool.set_trip_timeouts(timeouts)
+
+    def _get_sensor_session(self, sensor_watch):
+        if self.session_shard == SHARD_BY_OWNER:
+            return self.pool.get_session(sensor_watch.sdr.owner_id)
+        return self.pool.get_session(sensor_watch.slot_id)
+
+    def _get_scheduler(self, sensor_watch):
+        return self._schedulers[sensor_watch.session.index]
+
+    def set_device_name(self):
+        # records of each crate go under its own prefix when several
+        # crates share the IOC
+        if self.pv_prefix:
+            builder.SetDeviceName(self.pv_prefix)
 
     def create_amc_fru_records(self, **kwargs):
-        for slot_id in self.slots:
+        self.wait_fru_inventories()
+        self.set_device_name()
+        slot_ids = list(self.slots)
+        if self.spare_sensors_per_slot:
+            slot_ids += get_empty_slot_ids(self.slots)
+        for slot_id in slot_ids:
             if slot_id[0] in valid_mtca_module_types:
-                builder.stringIn(
-                    '{}{}:MANUFACTURER'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].manufacturer,
-                    **kwargs)
-                builder.stringIn(
-                    '{}{}:PARTNUMBER'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].part_number, **kwargs)
-                builder.stringIn(
-                    '{}{}:SERIALNUMBER'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].serial_number,
-                    **kwargs)
-                builder.stringIn(
-                    '{}{}:VERSION'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].version,
-                    **kwargs)
-                builder.stringIn(
-                    '{}{}:NAME'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].name, **kwargs)
-                builder.stringIn(
-                    '{}{}:PRODUCTNAME'.format(slot_id[0], slot_id[1]),
-                    initial_value=self.slots[slot_id].product_name,
-                    **kwargs)
-
-    def is_sensor_allowed(self, sensor_name):
+                self._fru_records[slot_id] = {
+                    field: builder.stringIn(
+                        '{}{}:{}'.format(slot_id[0], slot_id[1], field),
+                        initial_value=self._get_fru_field(slot_id, attr),
+                        **kwargs)
+                    for (field, attr) in FRU_RECORD_FIELDS}
+
+    def _get_fru_field(self, slot_id, attr):
+        mtca_mod = self.get_slot_module(slot_id)
+        return getattr(mtca_mod, attr) if mtca_mod else ''
+
+    def _update_fru_records(self, slot_id):
+        for (field, attr) in FRU_RECORD_FIELDS:
+            record = self._fru_records.get(slot_id, {}).get(field)
+            if record:
+                record.set(self._get_fru_field(slot_id, attr))
+
+    def create_spare_records(self):
+        """ Creates the spare records of the empty slots, so modules
+            inserted later can be monitored """
+        if not self.spare_sensors_per_slot:
+            return
+        self.set_device_name()
+        for slot_id in get_empty_slot_ids(self.slots):
+            self._spare_pools[slot_id] = SpareRecordPool(
+                slot_id, self.spare_sensors_per_slot)
+
+    def create_history_records(self):
+        """ History waveforms of the sensors found at startup, sensors bound
+            to spare records have no history """
+        if not self.history_depth or self.history:
+            return
+        self.history = HistoryStore(self.history_depth,
+                                    self.history_decimation)
+        self.history.create_records()
+        for sensor_watch in self._to_monitor:
+            if sensor_watch.type == InfoType.HOTSWAP:
+                continue
+            key = (sensor_watch.slot_id, sensor_watch.sdr.name)
+            if key not in self._history_index:
+                self._history_index[key] = self.history.add_sensor(
+                    get_sensor_pv_suffix(*key))
+        log.info('History of %d sensors uses %d kB', len(self.history),
+                 self.history.nbytes // 1024)
+
+    def record_readings(self, directory, **kwargs):
+        """ Appends every published reading to files in directory, see
+            ReadingRecorder for the rotation arguments """
+        if not self.recorder:
+            self.recorder = ReadingRecorder(directory, **kwargs)
+            self.recorder.start()
+
+    def export_metrics(self):
+        """ Keeps the last published value and severity of every sensor
+            for a MetricsServer """
+        if not self.metrics:
+            self.metrics = SensorMetrics(self.pv_prefix)
+
+    def is_sensor_allowed(self, sensor_name, slot_id=None):
         return self.allowed_sensors is None or \
-            sensor_name in self.allowed_sensors
+            self.allowed_sensors.lookup(slot_id, sensor_name) is not None
+
+    def get_sensor_policy(self, sensor_watch):
+        """ Returns:
+               The SensorPolicy given by the manifest to the sensor
+        """
+        policy = None
+        if self.allowed_sensors is not None:
+            policy = self.allowed_sensors.lookup(sensor_watch.slot_id,
+                                                 sensor_watch.sdr.name)
+        return policy or SensorPolicy()
 
     def _handle_sdr_full_sensor_record(self, entry):
         log.info(
@@ -137,7 +391,7 @@ class EpicsMonMTCA(object):
         if not slot_id:
             return
 
-        if not self.is_sensor_allowed(entry.name):
+        if not self.is_sensor_allowed(entry.name, slot_id):
             log.info('Ignoring sensor %s (not allowed)', entry.name)
             return
 
@@ -148,16 +402,19 @@ class EpicsMonMTCA(object):
         mtca_mod.sensors.append(entry)
         infotype = InfoType.FULL
         EGU = get_sdr_egu(entry)
-        PREC = get_sdr_prec(entry)
+        entry.value_table_index = self.value_tables.add(entry)
+        PREC = get_sdr_prec(
+            entry, self.value_tables.get_values(entry.value_table_index))
+        limits = self._get_threshold_limits(entry)
         try:
-            record = builder.aIn(
-                get_sensor_pv_suffix(slot_id, entry.name), EGU=EGU, PREC=PREC)
+            record = self._get_sensor_record(slot_id, entry, infotype,
+                                             EGU=EGU, PREC=PREC, **limits)
         except Exception as e:
             log.error('Failed to add PV: %s', e)
+            self.value_tables.remove(entry.value_table_index)
             return
 
-        self._sensor_index[(entry.number, entry.owner_lun)] = entry
-        self._to_monitor.append(SensorWatch(entry, record, infotype))
+        self._add_sensor_watch(SensorWatch(entry, record, infotype, slot_id))
 
     def _handle_sdr_compact_sensor_record(self, entry):
         log.info(
@@ -175,7 +432,7 @@ class EpicsMonMTCA(object):
         if not mtca_mod:
             return  # ignore sensors for cards not inserted
 
-        if not self.is_sensor_allowed(entry.name):
+        if not self.is_sensor_allowed(entry.name, slot_id):
             log.info('Ignoring sensor %s (not allowed)', entry.name)
             return
 
@@ -183,14 +440,13 @@ class EpicsMonMTCA(object):
         infotype = InfoType.COMPACT
         EGU = get_sdr_egu(entry)
         try:
-            record = builder.aIn(
-                get_sensor_pv_suffix(slot_id, entry.name), EGU=EGU)
+            record = self._get_sensor_record(slot_id, entry, infotype,
+                                             EGU=EGU)
         except Exception as e:
             log.error('Failed to add PV: %s', e)
             return
 
-        self._sensor_index[(entry.number, entry.owner_lun)] = entry
-        self._to_monitor.append(SensorWatch(entry, record, infotype))
+        self._add_sensor_watch(SensorWatch(entry, record, infotype, slot_id))
 
     def _handle_sdr_hs_sensor(self, entry):
         log.info(
@@ -210,31 +466,183 @@ class EpicsMonMTCA(object):
             if not mtca_mod:
                 return
 
-        if not self.is_sensor_allowed(entry.name):
+        if not self.is_sensor_allowed(entry.name, slot_id):
             log.info('Ignoring sensor %s (not allowed)', entry.name)
             return
 
         mtca_mod.sensors.append(entry)
         infotype = InfoType.HOTSWAP
         try:
-            record = builder.stringIn(
-                get_sensor_pv_suffix(slot_id, entry.name))
+            record = self._get_sensor_record(slot_id, entry, infotype)
         except Exception as e:
             log.error('Failed to add PV: %s', e)
             return
-        self._sensor_index[(entry.number, entry.owner_lun)] = entry
-        if self.is_sensor_allowed(entry.name):
-            self._to_monitor.append(SensorWatch(entry, record, infotype))
+        self._add_sensor_watch(SensorWatch(entry, record, infotype, slot_id))
+
+    def _get_threshold_limits(self, entry):
+        """ Alarm limits of a threshold based sensor, the severity of its
+            readings is computed from them from now on
+            Returns:
+               The LOLO, LOW, HIGH and HIHI fields of the record
+        """
+        if entry.event_reading_type_code != THRESHOLD_READING_TYPE:
+            return {}
+        capabilities = getattr(entry, 'capabilities', ())
+        if 'threshold_readable' not in capabilities and \
+                'threshold_read_and_setable' not in capabilities:
+            return {}
+        thresholds = self._get_sensor_thresholds(entry)
+        if not thresholds:
+            return {}
+        return self.value_tables.set_thresholds(entry.value_table_index,
+                                                thresholds)
+
+    def _get_sensor_thresholds(self, entry):
+        """ Raw thresholds of a sensor, read once and cached with the SDR
+            entries """
+        key = (entry.owner_id, entry.owner_lun, entry.number)
+        if key not in self._thresholds:
+            try:
+                self._thresholds[key] = self._read_sensor_thresholds(entry)
+            except Exception as e:
+                log.warning('Failed to read thresholds of %s: %s',
+                            entry.name, e)
+                return None
+            self._thresholds_changed = True
+        return self._thresholds[key]
+
+    def _read_sensor_thresholds(self, entry):
+        req = create_request_by_name('GetSensorThresholds')
+        req.sensor_number = entry.number
+        req.lun = entry.owner_lun
+        req.target = self._get_owner_target(entry.owner_id) \
+            if self.route_by_owner else None
+        if self._records_frozen:
+            # found by a slot rescan, the engine owns the connection
+            rsp = self.engine.submit(req).result()
         else:
-            log.info('Ignoring sensor %s (not allowed)', entry.name)
+            # the FRU inventories are read meanwhile in the background
+            with self.ipmi_lock:
+                rsp = send_message(self.ipmi, req)
+        check_completion_code(rsp.completion_code)
+        return {name: getattr(rsp.threshold, name)
+                for name in THRESHOLD_NAMES
+                if getattr(rsp.readable_mask, name)}
 
-    def process_sdr_repository(self, **kwargs):
+    def _load_cached_thresholds(self):
+        cached = self.cache.get(THRESHOLDS_CACHE_KEY, self._sdr_fingerprint)
+        for data in cached or []:
+            mask = data[3]
+            self._thresholds[tuple(data[:3])] = {
+                name: data[4 + bit] for (bit, name)
+                in enumerate(THRESHOLD_NAMES) if mask & (1 << bit)}
+
+    def _save_cached_thresholds(self):
+        data = []
+        for (key, thresholds) in self._thresholds.items():
+            mask = 0
+            for (bit, name) in enumerate(THRESHOLD_NAMES):
+                if name in thresholds:
+                    mask |= 1 << bit
+            data.append(bytes(key) + bytes([mask]) + bytes(
+                thresholds.get(name, 0) for name in THRESHOLD_NAMES))
+        self.cache.put(THRESHOLDS_CACHE_KEY, self._sdr_fingerprint, data)
+        self.cache.save()
+        self._thresholds_changed = False
+
+    def _get_sensor_record(self, slot_id, entry, infotype, **fields):
+        record = self._slot_records.get((slot_id, entry.name))
+        if not self._records_frozen:
+            if record is None:
+                name = get_sensor_pv_suffix(slot_id, entry.name)
+                if infotype == InfoType.HOTSWAP:
+                    record = builder.stringIn(name)
+                else:
+                    record = builder.aIn(name, **fields)
+                self._slot_records[(slot_id, entry.name)] = record
+            return record
+
+        if record is None:
+            pool = self._spare_pools.get(slot_id)
+            record = pool.take(entry.name, infotype == InfoType.HOTSWAP) \
+                if pool else None
+            if record is None:
+                raise ValueError('No record for {}'.format(entry.name))
+        # the startup record of a reinserted module may describe another
+        # card, fields can only be changed in a running IOC
+        for (field, value) in fields.items():
+            try:
+                record.set_field(field, value)
+            except Exception as e:
+                log.debug('Failed to set %s: %s', field, e)
+        return record
+
+    def _get_owner_target(self, owner_id):
+        target = self._owner_targets.get(owner_id)
+        if target is None:
+            target = get_owner_target(owner_id)
+            self._owner_targets[owner_id] = target
+        return target
+
+    def _add_sensor_watch(self, sensor_watch):
+        entry = sensor_watch.sdr
+        entry.target = self._get_owner_target(entry.owner_id) \
+            if self.route_by_owner else None
+        self._sensor_index[(entry.number, entry.owner_lun)] = entry
+        self._watch_index[(entry.owner_id, entry.owner_lun, entry.number)] = \
+            sensor_watch
+        self._to_monitor.append(sensor_watch)
+        if self._records_frozen:
+            # found by a slot rescan, the polling has already started
+            self._start_sensor_watch(sensor_watch)
+
+    def _start_sensor_watch(self, sensor_watch):
+        sensor_watch.period = self.get_sensor_polling_period(sensor_watch)
+        sensor_watch.deadband = self.get_sensor_deadband(sensor_watch)
+        sensor_watch.severity = MANIFEST_SEVERITIES.get(
+            self.get_sensor_policy(sensor_watch).severity)
+        sensor_watch.session = self._get_sensor_session(sensor_watch)
+        sensor_watch.history = self._history_index.get(
+            (sensor_watch.slot_id, sensor_watch.sdr.name))
+        self.active_sensors.add(sensor_watch)
+        self._get_scheduler(sensor_watch).add(sensor_watch)
+
+    def _read_sdr_repository(self):
+        if not self.cache:
+            return list(self.ipmi.sdr_repository_entries())
+
+        # the cached entries are valid while the repository timestamps
+        # don't change
+        fingerprint = sdr_repository_fingerprint(
+            *read_sdr_repository_info(self.ipmi))
+        self._sdr_fingerprint = fingerprint
+        cached_entries = self.cache.get(SDR_CACHE_KEY, fingerprint)
+        if cached_entries is not None:
+            log.info('Using %d cached SDR entries', len(cached_entries))
+            self._sdr_entries = [sdr.SdrCommon.from_data(data)
+                                 for data in cached_entries]
+            return self._sdr_entries
+
+        log.info('SDR cache is not valid, reading SDR repository')
         sdr_entries = list(self.ipmi.sdr_repository_entries())
+        self.cache.put(SDR_CACHE_KEY, fingerprint,
+                       [entry.data for entry in sdr_entries])
+        self.cache.save()
+        self._sdr_entries = sdr_entries
+        return sdr_entries
+
+    def process_sdr_repository(self, **kwargs):
+        self.set_device_name()
+        sdr_entries = self._read_sdr_repository()
+        if self.cache:
+            self._load_cached_thresholds()
+        self._process_sdr_entries(sdr_entries)
+        if self.cache and self._thresholds_changed:
+            self._save_cached_thresholds()
+
+    def _process_sdr_entries(self, sdr_entries):
         for entry in sdr_entries:
-            if hasattr(entry, 'device_id_string'):
-                entry.name = entry.device_id_string.decode()
-            else:
-                entry.name = ''
+            entry.name = get_sdr_name(entry)
 
         for entry in sdr_entries:
             if entry.type == sdr.SDR_TYPE_COMPACT_SENSOR_RECORD and \
@@ -250,17 +658,205 @@ class EpicsMonMTCA(object):
                     entry.sensor_type_code != sensor.SENSOR_TYPE_FRU_HOT_SWAP:
                 self._handle_sdr_compact_sensor_record(entry)
 
+    def rescan_slot(self, slot_id):
+        """ Discovers the module in a slot, reading only its SDR entries
+            and FRU, and binds its sensors to their records """
+        log.info('Rescanning slot %s%d', slot_id[0], slot_id[1])
+        self.detach_slot(slot_id)
+        if self.cache:
+            # read first, so a change made meanwhile invalidates the cache
+            repo_info = self._call_ipmi(read_sdr_repository_info)
+        sdr_entries = read_slot_sdr_entries(self._call_ipmi, slot_id)
+        self._process_sdr_entries(sdr_entries)
+        self.wait_fru_inventories()
+        self._update_fru_records(slot_id)
+        if self.cache:
+            self._update_cached_repository(slot_id, sdr_entries, repo_info)
+
+    def _update_cached_repository(self, slot_id, slot_entries, repo_info):
+        """ Caches the entries of a rescanned slot in place of the old ones,
+            along with the thresholds read for them """
+        sdr_entries = [entry for entry in self._sdr_entries
+                       if not is_slot_sensor_record(entry, slot_id)]
+        sdr_entries += slot_entries
+        if len(sdr_entries) != repo_info[1].record_count:
+            log.info('SDR repository changed outside slot %s%d, not caching '
+                     'it', slot_id[0], slot_id[1])
+            return
+        self._sdr_entries = sdr_entries
+        self._sdr_fingerprint = sdr_repository_fingerprint(*repo_info)
+        self.cache.put(SDR_CACHE_KEY, self._sdr_fingerprint,
+                       [entry.data for entry in sdr_entries])
+        self._save_cached_thresholds()
+
+    def detach_slot(self, slot_id):
+        """ Stops monitoring the sensors of an extracted module """
+        if not self.slots.pop(slot_id, None):
+            return
+
+        log.info('Detaching slot %s%d', slot_id[0], slot_id[1])
+        pool = self._spare_pools.get(slot_id)
+        sensor_watches = [sensor_watch for sensor_watch in self._to_monitor
+                          if sensor_watch.slot_id == slot_id]
+        for sensor_watch in sensor_watches:
+            # the scheduler drops it the next time it is due
+            sensor_watch.bound = False
+            self.active_sensors.discard(sensor_watch)
+            self._to_monitor.remove(sensor_watch)
+            entry = sensor_watch.sdr
+            key = (entry.number, entry.owner_lun)
+            if self._sensor_index.get(key) is entry:
+                del self._sensor_index[key]
+            key = (entry.owner_id, entry.owner_lun, entry.number)
+            if self._watch_index.get(key) is sensor_watch:
+                del self._watch_index[key]
+            # the next module in the slot may have other thresholds
+            if self._thresholds.pop(key, None) is not None:
+                self._thresholds_changed = True
+            self._set_sensor_invalid(sensor_watch)
+            index = getattr(entry, 'value_table_index', None)
+            if index is not None:
+                self.value_tables.remove(index)
+            if pool:
+                pool.release(sensor_watch.record)
+        self._update_fru_records(slot_id)
+
+    def _handle_hotswap_event(self, sel_entry):
+        if sel_entry.event_type != 0x6f or \
+                sel_entry.sensor_type != sensor.SENSOR_TYPE_FRU_HOT_SWAP:
+            return
+
+        # AMC events come from the MMC of the module, the sensor number
+        # alone does not tell the modules apart
+        address = sel_entry.generator_id & 0xff
+        slot_id = ipmb_address_to_slot_id(address)
+        sdr_entry = self._sensor_index.get(
+            (sel_entry.sensor_number, (sel_entry.generator_id >> 8) & 3))
+        if not slot_id and sdr_entry and sdr_entry.owner_id == address:
+            slot_id = entity_to_slot_id(sdr_entry.entity_id,
+                                        sdr_entry.entity_instance)
+        if not slot_id:
+            return
+
+        state = sel_entry.event_data[0] & 15
+        if state == HS_STATE_NOT_INSTALLED:
+            self.detach_slot(slot_id)
+        elif state == HS_STATE_ACTIVE and slot_id not in self.slots:
+            self.rescan_slot(slot_id)
+
+    def _get_event_sensor(self, sel_entry):
+        """ The sensor generating a SEL entry, by generator address first,
+            as the sensor number and lun alone are shared by the modules """
+        lun = (sel_entry.generator_id >> 8) & 3
+        sensor_watch = self._watch_index.get(
+            (sel_entry.generator_id & 0xff, lun, sel_entry.sensor_number))
+        if sensor_watch:
+            return sensor_watch
+        sdr_entry = self._sensor_index.get((sel_entry.sensor_number, lun))
+        if sdr_entry:
+            return self._watch_index.get(
+                (sdr_entry.owner_id, lun, sel_entry.sensor_number))
+        return None
+
+    @staticmethod
+    def _get_event_slot(sel_entry, sensor_watch):
+        slot_id = ipmb_address_to_slot_id(sel_entry.generator_id & 0xff)
+        if not slot_id and sensor_watch:
+            slot_id = sensor_watch.slot_id
+        return slot_id
+
+    def _read_event_sensors(self, sel_entry):
+        """ Reads the sensor of an event right away, or every sensor of the
+            slot for hot-swap events, instead of waiting for their turn """
+        sensor_watch = self._get_event_sensor(sel_entry)
+        if sel_entry.sensor_type == sensor.SENSOR_TYPE_FRU_HOT_SWAP:
+            slot_id = self._get_event_slot(sel_entry, sensor_watch)
+            sensor_watches = [watch for watch in self._to_monitor
+                              if watch.slot_id == slot_id]
+        else:
+            sensor_watches = [sensor_watch] if sensor_watch else []
+
+        for sensor_watch in sensor_watches:
+            self.read_sensor_now(sensor_watch)
+
+    def read_sensor_now(self, sensor_watch):
+        """ Moves a sensor to the front of its queue, a sensor being read
+            at the moment is not read again """
+        if not sensor_watch.bound or sensor_watch.session is None or \
+                sensor_watch.session.breaker.is_open:
+            return
+        scheduler = self._get_scheduler(sensor_watch)
+        if sensor_watch.backoff:
+            scheduler.add_probe(sensor_watch, time_ms())
+        else:
+            scheduler.add(sensor_watch)
+        self.stats.add_event_read()
+
+    def get_sensor_polling_period(self, sensor_watch):
+        period = self.sensor_polling_overrides.get(sensor_watch.sdr.name) \
+            or self.get_sensor_policy(sensor_watch).period
+        if period:
+            return period
+        return get_default_polling_period(
+            sensor_watch.sdr, self.sensor_polling_period)
+
+    def set_sensor_polling_period(self, sensor_name, period):
+        """ Overrides the polling period (in ms) of the sensors with the
+            given name, None restores the default period """
+        if period:
+            self.sensor_polling_overrides[sensor_name] = period
+        else:
+            self.sensor_polling_overrides.pop(sensor_name, None)
+        for sensor_watch in self._to_monitor:
+            if sensor_watch.sdr.name == sensor_name:
+                sensor_watch.period = \
+                    self.get_sensor_polling_period(sensor_watch)
+
+    def get_sensor_deadband(self, sensor_watch):
+        deadband = self.sensor_deadband_overrides.get(sensor_watch.sdr.name)
+        if deadband is None:
+            deadband = self.get_sensor_policy(sensor_watch).deadband
+        return self.deadband if deadband is None else deadband
+
+    def set_sensor_deadband(self, sensor_name, absolute=0.0, relative=0.0):
+        """ Overrides the deadband of the sensors with the given name,
+            None restores the default deadband """
+        if absolute is None:
+            self.sensor_deadband_overrides.pop(sensor_name, None)
+        else:
+            self.sensor_deadband_overrides[sensor_name] = \
+                Deadband(absolute, relative)
+        for sensor_watch in self._to_monitor:
+            if sensor_watch.sdr.name == sensor_name:
+                sensor_watch.deadband = self.get_sensor_deadband(sensor_watch)
+
     def watch_sensors(self, polling_period=None):
         if not self._to_monitor:
             self.process_sdr_repository()
             self.create_amc_fru_records()
 
-        if not self.sensor_thread:
+        if not self.sensor_threads:
             if polling_period:
                 self.sensor_polling_period = polling_period
-            self.sensor_thread = threading.Thread(
-                None, self._sensor_polling_loop)
-            self.sensor_thread.start()
+            for scheduler in self._schedulers:
+                scheduler.catch_up = self.catch_up
+            self.create_history_records()
+            for sensor_watch in self._to_monitor:
+                self._start_sensor_watch(sensor_watch)
+            self.create_spare_records()
+            self.set_device_name()
+            self.stats.create_records(
+                sorted(set(self.slots) | set(self._spare_pools)))
+            self.stats.add_loop('POLL', self._polling_timing)
+            self._records_frozen = True
+            self._fru_fetcher.engine = self.engine
+            self.pool.start()
+            self.sensor_threads = [
+                threading.Thread(None, self._sensor_polling_loop,
+                                 args=(session,))
+                for session in self.pool.sessions]
+            for thread in self.sensor_threads:
+                thread.start()
         else:
             log.error("Sensor polling loop already started")
 
@@ -272,19 +868,24 @@ class EpicsMonMTCA(object):
         if not self.sel_thread:
             if polling_period:
                 self.sel_polling_period = polling_period
+            self._sel_timer = PeriodicTimer(self.sel_polling_period,
+                                            self.catch_up)
+            self.set_device_name()
+            self.stats.add_loop('SEL', self._sel_timer.timing)
+            self.sel_events.create_records(
+                sorted(set(self.slots) | set(self._spare_pools)))
+            self.pool.start()
+            self._sel_worker.start()
             self.sel_thread = threading.Thread(None, self._sel_polling_loop)
             self.sel_thread.start()
         else:
             log.error("SEL polling loop already started")
 
-    @staticmethod
-    def _get_sensor_alarm(sdr_entry, status):
-        # Considers severity for threshold-based sensors overpassing a
-        # threshold
-        if sdr_entry.event_reading_type_code == 1 and status & 0x3f != 0:
-            return alarm.MINOR_ALARM
-        else:
-            return alarm.NO_ALARM
+    def convert_sensor_raw_to_value(self, sdr_entry, raw):
+        index = getattr(sdr_entry, 'value_table_index', None)
+        if index is None:
+            return sdr_entry.convert_sensor_raw_to_value(raw)
+        return self.value_tables.get_value(index, raw)
 
     def format_sel_entry(self, sel_entry):
         parts = ['SEL Entry {}'.format(sel_entry.record_id)]
@@ -297,8 +898,7 @@ class EpicsMonMTCA(object):
         # Adds sensor name if we can find it
         if sensor_id in self._sensor_index:
             sdr_entry = self._sensor_index[sensor_id]
-            parts.append('Sensor: {}'.format(
-                sdr_entry.device_id_string.decode()))
+            parts.append('Sensor: {}'.format(get_sdr_name(sdr_entry)))
 
         parts.append('Sensor number/lun: {}'.format(sensor_id))
 
@@ -319,10 +919,10 @@ class EpicsMonMTCA(object):
                 sel_entry.event_data[0] & 15]))
             if sdr_entry and len(sel_entry.event_data) >= 3:
                 parts.append('Value: {} Threshold: {}'.format(
-                    sdr_entry.convert_sensor_raw_to_value(
-                        sel_entry.event_data[1]),
-                    sdr_entry.convert_sensor_raw_to_value(
-                        sel_entry.event_data[2])))
+                    self.convert_sensor_raw_to_value(
+                        sdr_entry, sel_entry.event_data[1]),
+                    self.convert_sensor_raw_to_value(
+                        sdr_entry, sel_entry.event_data[2])))
 
         raw_hex = 'Raw: [{}]'.format(
             ' '.join(['0x%02x' % b for b in sel_entry.data]))
@@ -330,65 +930,335 @@ class EpicsMonMTCA(object):
 
         return '\n'.join(parts)
 
+    def format_sel_summary(self, sel_entry):
+        """ One line description of a SEL entry for the SEL:EVENTS PV """
+        sensor_watch = self._get_event_sensor(sel_entry)
+        slot_id = self._get_event_slot(sel_entry, sensor_watch)
+        parts = [datetime.fromtimestamp(sel_entry.timestamp).strftime(
+            '%Y-%m-%d %H:%M:%S')]
+        if slot_id:
+            parts.append('{}{}'.format(*slot_id))
+        if sensor_watch:
+            parts.append(sensor_watch.sdr.name)
+        else:
+            parts.append('sensor {}'.format(sel_entry.sensor_number))
+        if sel_entry.event_type == 0x6f and \
+                sel_entry.sensor_type == sensor.SENSOR_TYPE_FRU_HOT_SWAP:
+            parts.append('M{}'.format(sel_entry.event_data[0] & 15))
+        elif sel_entry.event_type == 0x01:
+            parts.append('{} {}'.format(
+                'Deassert' if sel_entry.event_direction else 'Assert',
+                threshold_offsets_msg[sel_entry.event_data[0] & 15]))
+        else:
+            parts.append('type 0x{:02x}/0x{:02x} data {}'.format(
+                sel_entry.sensor_type, sel_entry.event_type,
+                ' '.join('%02x' % b for b in sel_entry.event_data)))
+        return ' '.join(parts)
+
+    def journal_sel(self, filepath):
+        """ Stores every SEL entry in a SQLite database, see SelJournal """
+        if not self.sel_journal:
+            self.sel_journal = SelJournal(filepath)
+
+    def _handle_sel_entry(self, sel_entry):
+        sel_log.info(self.format_sel_entry(sel_entry))
+        sensor_watch = self._get_event_sensor(sel_entry)
+        slot_id = self._get_event_slot(sel_entry, sensor_watch)
+        summary = self.format_sel_summary(sel_entry)
+        if self.sel_journal:
+            self.sel_journal.add(
+                sel_entry, slot_id,
+                sensor_watch.sdr.name if sensor_watch else None, summary)
+        self._handle_hotswap_event(sel_entry)
+        if self.read_on_event:
+            self._read_event_sensors(sel_entry)
+        self.sel_events.add(summary, slot_id)
+
+    def _flush_sel_journal(self):
+        if self.sel_journal:
+            self.sel_journal.flush()
+
     def _poll_sel(self):
-        # log sel to standard output when user configured monitor_sel to True
+        # only the SEL transaction runs on the engine, the entries are
+        # decoded and logged by the SEL worker
+        breaker = self.pool.primary.breaker
+        if breaker.is_open:
+            return
         log.debug('Getting SEL entries')
-        with self.ipmi_lock:
-            sel_count = self.ipmi.get_sel_entries_count()
-            log.debug('SEL number of entries: %d', sel_count)
-            if sel_count == 0:
-                return
-            sel_entry = self.ipmi.get_and_clear_sel_entry(0)
-            sel_log.info(self.format_sel_entry(sel_entry))
+        sel_entries = self.engine.call(self._sel_reader.drain).result()
+        breaker.add_success()
+        self._sel_worker.put(sel_entries)
 
     def _sel_polling_loop(self):
-        reset_timer(SEL_TIMER, self.sel_polling_period)
+        self._sel_timer.start()
+        breaker = self.pool.primary.breaker
         while not self._quit_sel_thread:
-            self._poll_sel()
-            wait_period(SEL_TIMER, self.sel_polling_period)
+            try:
+                self._poll_sel()
+            except Exception as e:
+                if self._quit_sel_thread:
+                    break
+                log.error('Error polling the SEL: %s', e)
+                # counts like a sensor read, the SEL waits for the primary
+                # session to be back
+                if isinstance(e, socket.timeout) and breaker.add_timeout():
+                    self._trip_session(self.pool.primary)
+            if not self._sel_timer.wait():
+                break
 
     def create_manifest(self, output_path):
+        self.wait_fru_inventories()
         create_manifest(self.slots, output_path)
 
-    def _sensor_polling_loop(self):
-        log.info('Monitoring %d sensors, period set to %d ms',
-                 len(self._to_monitor), self.sensor_polling_period)
-        reset_timer(POLLING_TIMER, self.sensor_polling_period)
+    def _read_sensor(self, sensor_watch, request):
+        (raw, status) = decode_sensor_reading(request.result())
+        self.stats.add_read(sensor_watch.slot_id, request.elapsed_ms)
+        if self._time_logging and request.elapsed_ms is not None:
+            delay = request.elapsed_ms
+            cnt = self._sensor_value_delay.setdefault(delay, 0)
+            self._sensor_value_delay[delay] = cnt + 1
+
+        return (raw, status)
+
+    def _publish_sensor(self, sensor_watch, raw, status):
+        (sdr_i, record, typ) = \
+            (sensor_watch.sdr, sensor_watch.record, sensor_watch.type)
+        now = time_ms()
+        changed = raw != sensor_watch.last_raw or \
+            status != sensor_watch.last_status
+        silent = sensor_watch.last_publish is None or \
+            now - sensor_watch.last_publish >= self.max_silence
+        if not changed and not silent:
+            self.stats.add_suppressed()
+            return
+
+        status_changed = status != sensor_watch.last_status
+        sensor_watch.last_raw = raw
+        sensor_watch.last_status = status
+        if typ == InfoType.FULL:
+            value = self.value_tables.get_value(sdr_i.value_table_index, raw)
+        elif typ == InfoType.COMPACT:
+            value = raw
+        else:
+            value = None
+
+        if value is not None and not status_changed and not silent and \
+                not is_outside_deadband(value, sensor_watch.last_value,
+                                        sensor_watch.deadband):
+            self.stats.add_suppressed()
+            return
+
+        severity = alarm.NO_ALARM
+        if typ == InfoType.FULL:
+            severity = self.value_tables.get_severity(
+                sdr_i.value_table_index, raw, status)
+            if math.isnan(value):  # the reading can't be converted
+                severity = alarm.INVALID_ALARM
+            elif severity != alarm.NO_ALARM and \
+                    sensor_watch.severity is not None:
+                severity = sensor_watch.severity
+            if status_changed and self.freeze_history_on_alarm and \
+                    sensor_watch.history is not None and \
+                    severity in (alarm.MINOR_ALARM, alarm.MAJOR_ALARM):
+                self.history.freeze(sensor_watch.history)
+            record.set(value, severity=severity)
+        elif typ == InfoType.COMPACT:
+            record.set(value)
+        elif typ == InfoType.HOTSWAP:
+            record.set(hs_states2string.get(status & 0xff, 'Unknown'))
+        if self.recorder and value is not None:
+            self.recorder.add(sensor_watch.slot_id, sdr_i.name, value, status)
+        if self.metrics and value is not None:
+            self.metrics.update(sensor_watch.slot_id, sdr_i.name, value,
+                                severity)
+        sensor_watch.last_value = value
+        sensor_watch.last_publish = now
+        self.stats.add_published()
+
+    def _record_history(self, sensor_watch, raw):
+        if sensor_watch.type == InfoType.FULL:
+            value = self.value_tables.get_value(
+                sensor_watch.sdr.value_table_index, raw)
+        else:
+            value = raw
+        self.history.append(sensor_watch.history, value)
+
+    def _sensor_polling_loop(self, session):
+        scheduler = self._schedulers[session.index]
+        # the engine keeps up to a window of pipelined reads in flight, the
+        # readings are handled on the engine thread as they arrive
+        in_flight = threading.BoundedSemaphore(session.engine.window)
+        if session is self.pool.primary:
+            log.info('Monitoring %d sensors, base period set to %d ms',
+                     len(self._to_monitor), self.sensor_polling_period)
         while not self._quit_sensor_thread:
-            for sensor_watch in list(self._to_monitor):
-                (sdr_i, record, typ) = sensor_watch
-                try:
-                    with self.ipmi_lock:
-                        ms1 = time_ms()
-
-                        (raw, status) = self.ipmi.get_sensor_reading(
-                            sdr_i.number, sdr_i.owner_lun)
-
-                        if self._time_logging:
-                            ms2 = time_ms()
-                            delay = ms2 - ms1
-                            cnt = self._sensor_value_delay.setdefault(delay, 0)
-                            self._sensor_value_delay[delay] = cnt + 1
-
-                except Exception as e:
-                    log.error('Error requesting %s: %s', sdr_i.name, e)
-                    continue
-
-                if raw is None:  # value is not available
-                    log.debug('Value for sensor %s (%d/%d) not available',
-                              sdr_i.name, sdr_i.number, sdr_i.owner_lun)
-                    self._to_monitor.remove(sensor_watch)
-                    continue
-                if typ == InfoType.FULL:
-                    value = sdr_i.convert_sensor_raw_to_value(raw)
-                    severity = self._get_sensor_alarm(sdr_i, status)
-                    record.set(value, severity=severity)
-                elif typ == InfoType.COMPACT:
-                    record.set(raw)
-                elif typ == InfoType.HOTSWAP:
-                    record.set(hs_states2string.get(status & 0xff, 'Unknown'))
-
-            wait_period(POLLING_TIMER, self.sensor_polling_period)
+            if session.breaker.is_open:
+                self._recover_session(session)
+            else:
+                self._poll_due_sensors(session, scheduler, in_flight)
+            if session is self.pool.primary:
+                self.stats.publish_if_due()
+                if self.history:
+                    self.history.publish_if_due()
+
+    def _poll_due_sensors(self, session, scheduler, in_flight):
+        due = scheduler.wait_due(session.engine.window)
+        start = time_ms()
+        for (sensor_watch, deadline) in due:
+            in_flight.acquire()
+            if session.breaker.is_open:
+                # the sensors left are scheduled again once it is back
+                in_flight.release()
+                break
+            session.engine.submit(
+                create_sensor_reading_request(sensor_watch.sdr),
+                functools.partial(self._on_sensor_reading, in_flight,
+                                  sensor_watch, deadline))
+        if due:
+            # time waiting for room in the window of the session
+            self.stats.add_sweep(time_ms() - start)
+
+    def _get_session_watches(self, session):
+        return [sensor_watch for sensor_watch in self._to_monitor
+                if sensor_watch.session is session]
+
+    def _trip_session(self, session):
+        """ A session stopped answering: its sensors go INVALID at once
+            instead of each one waiting for its own timeout """
+        log.error('IPMI session %d of %s is not answering, reconnecting',
+                  session.index, self.mch_ip)
+        self.stats.add_trip()
+        self.stats.offline = self.pool.offline
+        for sensor_watch in self._get_session_watches(session):
+            self._set_sensor_invalid(sensor_watch)
+            # publish as soon as the session is back
+            sensor_watch.last_raw = None
+            sensor_watch.last_status = None
+            sensor_watch.last_value = None
+
+    def _recover_session(self, session):
+        """ Reconnects a tripped session once its backoff is over, its
+            sensors are polled again if the MCH answers """
+        breaker = session.breaker
+        if not breaker.wait_retry(MAX_IDLE_WAIT) or self._quit_sensor_thread:
+            return
+        if not session.reconnect():
+            breaker.retry_failed()
+            log.debug('Reconnecting IPMI session %d again in %d ms',
+                      session.index, breaker.backoff)
+            return
+
+        log.info('IPMI session %d of %s is back', session.index,
+                 self.mch_ip)
+        breaker.close()
+        self.stats.offline = self.pool.offline
+        scheduler = self._schedulers[session.index]
+        for sensor_watch in self._get_session_watches(session):
+            if sensor_watch.backoff:
+                scheduler.add_probe(sensor_watch, time_ms())
+            else:
+                scheduler.add(sensor_watch)
+
+    def _on_sensor_reading(self, in_flight, sensor_watch, deadline, request):
+        try:
+            # readings still queued when stopping fail, nothing to report
+            if not self._quit_sensor_thread:
+                self._handle_sensor_reading(sensor_watch, deadline, request)
+        finally:
+            in_flight.release()
+
+    def _handle_sensor_reading(self, sensor_watch, deadline, request):
+        sdr_i = sensor_watch.sdr
+        if not sensor_watch.bound:
+            return
+        breaker = sensor_watch.session.breaker
+        try:
+            (raw, status) = self._read_sensor(sensor_watch, request)
+        except Exception as e:
+            self.stats.add_error(e)
+            if not isinstance(e, socket.timeout):
+                breaker.add_success()  # the MCH answered with an error
+            elif breaker.add_timeout():
+                self._trip_session(sensor_watch.session)
+            if breaker.is_open:
+                # it is scheduled again when the session is back
+                log.debug('Error requesting %s: %s', sdr_i.name, e)
+                return
+            log.error('Error requesting %s: %s', sdr_i.name, e)
+            if sensor_watch.backoff:
+                self._park_sensor(sensor_watch)
+            else:
+                self._get_scheduler(sensor_watch).reschedule(sensor_watch,
+                                                             deadline)
+            return
+
+        breaker.add_success()
+        if raw is None:  # value is not available
+            log.debug('Value for sensor %s (%d/%d) not available',
+                      sdr_i.name, sdr_i.number, sdr_i.owner_lun)
+            self._park_sensor(sensor_watch)
+            return
+
+        if sensor_watch.backoff:
+            log.info('Sensor %s is available again', sdr_i.name)
+            sensor_watch.backoff = 0
+            self.active_sensors.add(sensor_watch)
+            self.stats.parked = len(self._to_monitor) - \
+                len(self.active_sensors)
+            deadline = time_ms()
+        if sensor_watch.history is not None:
+            self._record_history(sensor_watch, raw)
+        self._publish_sensor(sensor_watch, raw, status)
+        self._get_scheduler(sensor_watch).reschedule(sensor_watch, deadline)
+
+    def _set_sensor_invalid(self, sensor_watch):
+        record = sensor_watch.record
+        record.set(record.get(), severity=alarm.INVALID_ALARM,
+                   alarm=alarm.UDF_ALARM)
+        if self.metrics and sensor_watch.type != InfoType.HOTSWAP:
+            self.metrics.update(sensor_watch.slot_id, sensor_watch.sdr.name,
+                                math.nan, alarm.INVALID_ALARM)
+
+    def _park_sensor(self, sensor_watch):
+        """ Moves a sensor without value to the probe queue, probing it
+            less often the longer it stays without value """
+        if sensor_watch.backoff:
+            sensor_watch.backoff = min(2 * sensor_watch.backoff,
+                                       MAX_PROBE_BACKOFF)
+        else:
+            log.info('Sensor %s has no value, parking it',
+                     sensor_watch.sdr.name)
+            sensor_watch.backoff = MIN_PROBE_BACKOFF
+            self.active_sensors.discard(sensor_watch)
+            self.stats.parked = len(self._to_monitor) - \
+                len(self.active_sensors)
+            self._set_sensor_invalid(sensor_watch)
+            # publish as soon as the sensor comes back
+            sensor_watch.last_raw = None
+            sensor_watch.last_status = None
+            sensor_watch.last_value = None
+        self._get_scheduler(sensor_watch).add_probe(
+            sensor_watch, time_ms() + sensor_watch.backoff)
+
+    def stop(self):
+        """ Stops the polling loops and closes the IPMI sessions """
+        self._quit_sensor_thread = True
+        self._quit_sel_thread = True
+        for session in self.pool.sessions:
+            session.breaker.abort()
+        if self._sel_timer:
+            self._sel_timer.stop()
+        for thread in self.sensor_threads + [self.sel_thread]:
+            if thread:
+                thread.join()
+        self.sensor_threads = []
+        self.sel_thread = None
+        self._sel_worker.stop()
+        if self.sel_journal:
+            self.sel_journal.close()
+        self.pool.stop()
+        if self.recorder:
+            self.recorder.stop()
 
     def dump_sensors(self):
         for index, entry in self._sensor_index.items():
@@ -403,3 +1273,7 @@ class EpicsMonMTCA(object):
             print('{} ms - {} times'.format(delay, count))
 
         print('Total count: {}'.format(total))
+        latency = self.stats.latency
+        if latency.total:
+            print('Round trip p50: {:.1f} ms p99: {:.1f} ms'.format(
+                latency.percentile(50), latency.percentile(99)))
@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 import logging
+import os
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from os import chmod, path, stat
 from stat import S_IXUSR, S_IXGRP, S_IXOTH
 
-from epicsmonmtca.manifest import parse_manifest
+from epicsmonmtca.manifest import get_concrete_modules, parse_manifest
 from epicsmonmtca.epicsutils import get_sensor_pv_suffix
 from epicsmonmtca.edmwidgets import (banner, embed, embedded_grid,
                                      related_display, screen, static_text,
@@ -12,29 +15,116 @@ from epicsmonmtca.edmwidgets import (banner, embed, embedded_grid,
 from epicsmonmtca.mtcautils import valid_mtca_module_types
 
 log = logging.getLogger(__name__)
-
-
-def create_edm_startup(pv_prefix, crate_name, output_path="start-gui"):
-    with open(output_path, 'w') as fhandle:
-        fhandle.write('''#!/bin/bash
+STARTUP_FILENAME = 'start-gui'
+# paths of the files written by a run, grouped by what happened to them
+EdmChanges = namedtuple('EdmChanges', ['created', 'updated', 'unchanged'])
+EdmCrate = namedtuple('EdmCrate', ['manifest_path', 'pv_prefix', 'crate_name'])
+
+
+def write_if_changed(filepath, content):
+    """ Writes content to filepath unless the file already has the same
+        content, so its modification time is kept and the tools syncing the
+        screens don't see it as changed
+        Returns:
+           'created', 'updated' or 'unchanged'
+    """
+    data = content.encode()
+    try:
+        with open(filepath, 'rb') as fhandle:
+            old_data = fhandle.read()
+    except FileNotFoundError:
+        old_data = None
+
+    if old_data == data:
+        return 'unchanged'
+
+    with open(filepath, 'wb') as fhandle:
+        fhandle.write(data)
+    return 'created' if old_data is None else 'updated'
+
+
+def write_edm_files(files, output_dir):
+    """ Writes the files of a crate created by create_edm_files
+        Returns:
+           An EdmChanges
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    changes = EdmChanges([], [], [])
+    for filename, content in sorted(files.items()):
+        filepath = path.join(output_dir, filename)
+        result = write_if_changed(filepath, content)
+        getattr(changes, result).append(filepath)
+        if filename == STARTUP_FILENAME and result != 'unchanged':
+            st = stat(filepath)
+            chmod(filepath, st.st_mode | S_IXUSR | S_IXGRP | S_IXOTH)
+
+    return changes
+
+
+def create_edm_startup(pv_prefix, crate_name):
+    return '''#!/bin/bash
 TOP="$(cd $(dirname "$0"); pwd)"
 export EDMDATAFILES="$TOP"
 exec edm -x -eolc -m 'device={device}' '{crate_name}.edl'
-'''.format(device=pv_prefix, crate_name=crate_name))
+'''.format(device=pv_prefix, crate_name=crate_name)
 
-    st = stat(output_path)
-    chmod(output_path, st.st_mode | S_IXUSR | S_IXGRP | S_IXOTH)
+
+def create_edm_files(manifest_path, pv_prefix, crate_name):
+    """ Creates the EDM screens of a crate and its start-gui script
+        Returns:
+           A dictionary with the content of each file by filename
+    """
+    slots = get_concrete_modules(parse_manifest(manifest_path))
+    files = {}
+    create_edm(crate_name, slots, files)
+    files[STARTUP_FILENAME] = create_edm_startup(pv_prefix, crate_name)
+    return files
 
 
 def create_edm_from_manifest(
         manifest_path, pv_prefix, crate_name, output_dir="data"):
-    slots = parse_manifest(manifest_path)
-    create_edm(crate_name, slots, output_dir)
-    create_edm_startup(
-        pv_prefix, crate_name, path.join(output_dir, 'start-gui'))
+    """ Returns:
+           An EdmChanges with the files written in output_dir
+    """
+    files = create_edm_files(manifest_path, pv_prefix, crate_name)
+    return write_edm_files(files, output_dir)
+
+
+def _create_crate_edm(crate, output_dir):
+    return create_edm_from_manifest(crate.manifest_path, crate.pv_prefix,
+                                    crate.crate_name, output_dir)
+
+
+def create_edm_from_manifests(crates, output_dir="data", processes=None,
+                              flat=False):
+    """ Creates the screens of many crates in a pool of processes, each
+        crate in the `crate_name` subdirectory of output_dir, or in
+        output_dir itself if flat is set
+        Arguments:
+           crates: a list of EdmCrate
+           processes: size of the pool, the number of CPUs if None
+        Returns:
+           A generator of (EdmCrate, EdmChanges) tuples, in the order of
+           crates
+    """
+    crate_dirs = [output_dir if flat else path.join(output_dir,
+                                                    crate.crate_name)
+                  for crate in crates]
+    if len(crates) == 1 or processes == 1:
+        for crate, crate_dir in zip(crates, crate_dirs):
+            yield (crate, _create_crate_edm(crate, crate_dir))
+        return
 
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(_create_crate_edm, crate, crate_dir)
+                   for crate, crate_dir in zip(crates, crate_dirs)]
+        for crate, future in zip(crates, futures):
+            yield (crate, future.result())
 
-def create_edm(crate_name, slots, output_dir):
+
+def create_edm(crate_name, slots, files):
+    """ Adds the screens of a crate to files, a dictionary of file contents
+        by filename """
     # this slot type appears in main screen
     main_slot_type = 'AMC'
     # this slot types appear in separate screens and
@@ -42,11 +132,11 @@ def create_edm(crate_name, slots, output_dir):
     extra_slot_types = list(valid_mtca_module_types)
     extra_slot_types.remove(main_slot_type)
     for slot_type in extra_slot_types:
-        create_edm_for_slot_type(crate_name, slots, slot_type, output_dir)
+        create_edm_for_slot_type(crate_name, slots, slot_type, files)
     title = crate_name
     macros = ""
     w, h = create_edm_for_slot_type(
-        crate_name, slots, main_slot_type, output_dir)
+        crate_name, slots, main_slot_type, files)
     x, y = GRID, h
     parts = []
     parts.append(
@@ -61,61 +151,56 @@ def create_edm(crate_name, slots, output_dir):
             "{}-{}.edl".format(crate_name, slot_type), macros))
         x += 74 + GRID
 
-    create_edm_for_info(crate_name, slots, output_dir)
+    create_edm_for_info(crate_name, slots, files)
     parts.append(related_display(
         x, y, 64, 24, 'INFO',
         '{}-INFO.edl'.format(crate_name, slot_type), macros))
 
     parts.insert(0, screen(w, h, title))
 
-    filepath = path.join(output_dir, "{}.edl".format(crate_name))
-    with open(filepath, 'w') as f:
-        f.write("".join(parts))
+    files["{}.edl".format(crate_name)] = "".join(parts)
 
     return (w, h)
 
 
-def create_edm_for_slot_type(crate_name, slots, slot_type, output_dir):
+def create_edm_for_slot_type(crate_name, slots, slot_type, files):
     w_h_filenames = []
     for slot_id in sorted(slots):
-        if slot_id[0] == slot_type:
+        if slot_id[0] == slot_type and slots[slot_id]:
             mod_filename = "{}{}.edl".format(slot_id[0], slot_id[1])
-            mod_filepath = path.join(output_dir, mod_filename)
-            part_size = create_edm_for_slot(
-                slot_id, slots[slot_id], mod_filepath)
+            content, part_size = create_edm_for_slot(slot_id, slots[slot_id])
+            files[mod_filename] = content
             w_h_filenames.append((part_size[0], part_size[1], mod_filename))
 
     title = "{} {}s".format(crate_name, slot_type)
     edm_content, size = embedded_grid(title, w_h_filenames)
-    filepath = path.join(output_dir, "{}-{}.edl".format(crate_name, slot_type))
-    with open(filepath, 'w') as f:
-        f.write(edm_content)
+    files["{}-{}.edl".format(crate_name, slot_type)] = edm_content
     return size
 
 
-def create_edm_for_slot(slot_id, mtca_mod, filepath):
-    if not mtca_mod:
-        return
+def create_edm_for_slot(slot_id, mtca_mod):
+    """ Returns:
+           A tuple with the edm description of the module's screen and the
+           screen size
+    """
     x = GRID
     y = GRID
     size = ((TW + GRID) * 2, (TH + GRID) * len(mtca_mod.sensors) + GRID + BH)
     title = "{}{}: {}".format(slot_id[0], slot_id[1], mtca_mod.name)
     log.info("Creating EDM screen for %s", title)
 
-    with open(filepath, 'w') as f:
-        f.write(screen(size[0], size[1], title))
-        f.write(banner(size[0], title))
-        y += BH
-        for sensor in mtca_mod.sensors:
-            f.write(static_text(x, y, sensor.name))
-            f.write(text_monitor(x + TW, y, "$(device):{}".format(
-                get_sensor_pv_suffix(slot_id, sensor.name))))
-            y += TH + GRID
+    parts = [screen(size[0], size[1], title), banner(size[0], title)]
+    y += BH
+    for sensor in mtca_mod.sensors:
+        parts.append(static_text(x, y, sensor.name))
+        parts.append(text_monitor(x + TW, y, "$(device):{}".format(
+            get_sensor_pv_suffix(slot_id, sensor.name))))
+        y += TH + GRID
 
-    return size
+    return "".join(parts), size
 
 
-def create_edm_for_info(crate_name, slots, output_dir):
+def create_edm_for_info(crate_name, slots, files):
     title = "{} FRU Info".format(crate_name)
     w_h_filenames = []
 
@@ -123,18 +208,16 @@ def create_edm_for_info(crate_name, slots, output_dir):
         mod_filename = "{}-{}{}-INFO.edl".format(crate_name,
                                                  slot_id[0],
                                                  slot_id[1])
-        mod_filepath = path.join(output_dir, mod_filename)
-        part_size = create_edm_for_one_info(slot_id, mod_filepath)
+        content, part_size = create_edm_for_one_info(slot_id)
+        files[mod_filename] = content
         w_h_filenames.append((part_size[0], part_size[1], mod_filename))
 
     edm_content, size = embedded_grid(title, w_h_filenames)
-    filepath = path.join(output_dir, "{}-INFO.edl".format(crate_name))
-    with open(filepath, 'w') as f:
-        f.write(edm_content)
+    files["{}-INFO.edl".format(crate_name)] = edm_content
     return size
 
 
-def create_edm_for_one_info(slot_id, filepath):
+def create_edm_for_one_info(slot_id):
     x = GRID
     y = GRID
     name_suffix = [
@@ -147,14 +230,12 @@ def create_edm_for_one_info(slot_id, filepath):
     title = "{}{}".format(slot_id[0], slot_id[1])
     log.info("Creating info EDM screen for %s", title)
 
-    with open(filepath, 'w') as f:
-        f.write(screen(size[0], size[1], title))
-        f.write(banner(size[0], title))
-        y += BH
-        for name, suffix in name_suffix:
-            f.write(static_text(x, y, name))
-            f.write(text_monitor(x + TW, y, "$(device):{}{}:{}".format(
-                slot_id[0], slot_id[1], suffix)))
-            y += TH + GRID
+    parts = [screen(size[0], size[1], title), banner(size[0], title)]
+    y += BH
+    for name, suffix in name_suffix:
+        parts.append(static_text(x, y, name))
+        parts.append(text_monitor(x + TW, y, "$(device):{}{}:{}".format(
+            slot_id[0], slot_id[1], suffix)))
+        y += TH + GRID
 
-    return size
+    return "".join(parts), size
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 import logging
 
-from pyipmi import sdr
+from pyipmi import sdr, Target
+from pyipmi.errors import CompletionCodeError
+from pyipmi.msgs.constants import CC_RES_CANCELED
 
 log = logging.getLogger(__name__)
 MAX_AMC = 12
@@ -16,6 +18,25 @@ fruid_base_offsets = {
     'MCMC': 3,
     'CARRIER': 253
 }
+# IPMB-L address of the MMC in the first AMC slot, the next slots follow
+# every two addresses
+AMC_IPMB_BASE_ADDRESS = 0x72
+# SDR header plus owner id, owner lun, sensor number, entity id and
+# entity instance, enough to know the slot of a sensor record
+SDR_SLOT_KEY_LENGTH = 10
+SDR_TYPE_OFFSET = 3
+SDR_OWNER_ID_OFFSET = 5
+SDR_ENTITY_ID_OFFSET = 8
+LAST_SDR_RECORD_ID = 0xffff
+# walks started again when the SDR reservation is canceled meanwhile
+MAX_SDR_RESERVATIONS = 3
+# IPMB addresses of the RMCP session, the MCH and its carrier manager, AMCs
+# sit on the IPMB-L channel of the carrier manager
+RMCP_SLAVE_ADDRESS = 0x81
+MCH_IPMB_ADDRESS = 0x20
+CARRIER_MANAGER_ADDRESS = 0x82
+IPMB_0_CHANNEL = 0
+IPMB_L_CHANNEL = 7
 
 
 def get_slot_fru_id(slot_id):
@@ -27,6 +48,118 @@ def get_slot_fru_id(slot_id):
     return fruid
 
 
+def get_empty_slot_ids(slots):
+    return [("AMC", index) for index in range(1, MAX_AMC + 1)
+            if ("AMC", index) not in slots]
+
+
+def ipmb_address_to_slot_id(address):
+    index = address - AMC_IPMB_BASE_ADDRESS
+    if address % 2 or index < 0 or index >= 2 * MAX_AMC:
+        return None
+    return ("AMC", index // 2 + 1)
+
+
+def get_carrier_manager_target():
+    return Target(ipmb_address=CARRIER_MANAGER_ADDRESS,
+                  routing=[(RMCP_SLAVE_ADDRESS, MCH_IPMB_ADDRESS,
+                            IPMB_0_CHANNEL),
+                           (MCH_IPMB_ADDRESS, CARRIER_MANAGER_ADDRESS, None)])
+
+
+def get_owner_target(owner_id):
+    """ Shortest path from the RMCP session to the controller owning a
+        sensor: the MCH answers directly, AMCs are bridged through the
+        carrier manager and IPMB-L, any other controller (carrier manager,
+        PMs, CUs) is bridged on IPMB-0 """
+    if owner_id == MCH_IPMB_ADDRESS:
+        return Target(ipmb_address=MCH_IPMB_ADDRESS)
+    if ipmb_address_to_slot_id(owner_id):
+        return Target(ipmb_address=owner_id,
+                      routing=[(RMCP_SLAVE_ADDRESS, MCH_IPMB_ADDRESS,
+                                IPMB_0_CHANNEL),
+                               (MCH_IPMB_ADDRESS, CARRIER_MANAGER_ADDRESS,
+                                IPMB_L_CHANNEL),
+                               (MCH_IPMB_ADDRESS, owner_id, None)])
+    return Target(ipmb_address=owner_id,
+                  routing=[(RMCP_SLAVE_ADDRESS, MCH_IPMB_ADDRESS,
+                            IPMB_0_CHANNEL),
+                           (MCH_IPMB_ADDRESS, owner_id, None)])
+
+
+def reserve_sdr_repository(ipmi):
+    return ipmi.reserve_sdr_repository()
+
+
+def read_sdr_key(ipmi, reservation_id, record_id):
+    """ Reads the first SDR_SLOT_KEY_LENGTH bytes of a SDR record
+        Returns:
+           A (next record id, data) tuple
+    """
+    rsp = ipmi.send_message_with_name(
+        'GetSdr', reservation_id=reservation_id, record_id=record_id,
+        offset=0, bytes_to_read=SDR_SLOT_KEY_LENGTH)
+    return (rsp.next_record_id, rsp.record_data)
+
+
+def get_repository_sdr(ipmi, record_id, reservation_id):
+    return ipmi.get_repository_sdr(record_id, reservation_id)
+
+
+def read_slot_sdr_entries(call, slot_id):
+    """ Reads the sensor records of one slot from the SDR repository
+        Only the first bytes of the other records are read, so it costs
+        about a third of a full repository walk
+        Arguments:
+           call: runs func(ipmi, *args) and returns its result, every
+                 record is read with its own call, so the polling can go on
+                 between them
+        Returns:
+           A list of SDR entries
+    """
+    for _ in range(MAX_SDR_RESERVATIONS):
+        reservation_id = call(reserve_sdr_repository)
+        entries = []
+        record_id = 0
+        try:
+            while record_id != LAST_SDR_RECORD_ID:
+                (next_id, data) = call(read_sdr_key, reservation_id,
+                                       record_id)
+                if is_slot_sensor_key(data, slot_id):
+                    entries.append(call(get_repository_sdr,
+                                        data[0] | data[1] << 8,
+                                        reservation_id))
+                record_id = next_id
+        except CompletionCodeError as e:
+            if e.cc != CC_RES_CANCELED:
+                raise
+            log.debug('SDR reservation canceled, walking it again')
+            continue
+        return entries
+
+    raise CompletionCodeError(CC_RES_CANCELED)
+
+
+def is_slot_sensor(record_type, owner_id, entity_id, instance_id, slot_id):
+    return record_type in (sdr.SDR_TYPE_FULL_SENSOR_RECORD,
+                           sdr.SDR_TYPE_COMPACT_SENSOR_RECORD) and \
+        (entity_to_slot_id(entity_id, instance_id) == slot_id or
+         ipmb_address_to_slot_id(owner_id) == slot_id)
+
+
+def is_slot_sensor_key(data, slot_id):
+    """ Whether the first bytes of a SDR record belong to a sensor of the
+        slot, by entity or owner """
+    return len(data) >= SDR_SLOT_KEY_LENGTH and is_slot_sensor(
+        data[SDR_TYPE_OFFSET], data[SDR_OWNER_ID_OFFSET],
+        data[SDR_ENTITY_ID_OFFSET], data[SDR_ENTITY_ID_OFFSET + 1], slot_id)
+
+
+def is_slot_sensor_record(entry, slot_id):
+    return is_slot_sensor(entry.type, entry.owner_id, entry.entity_id,
+                          entry.entity_instance, slot_id)
+
+
 def entity_to_slot_id(entity_id, instance_id):
     instance_id &= 0x7f
 
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+import logging
+import socket
+import threading
+
+from array import array
+from queue import Empty, Queue
+
+from pyipmi.errors import CompletionCodeError
+from pyipmi.interfaces.ipmb import (IpmbHeaderReq, IpmbHeaderRsp,
+                                    decode_bridged_message,
+                                    encode_bridged_message, encode_ipmb_msg,
+                                    rx_filter)
+from pyipmi.interfaces.rmcp import Rmcp
+from pyipmi.msgs import (constants, create_message, create_request_by_name,
+                         decode_message, encode_message)
+from pyipmi.utils import check_completion_code
+
+from epicsmonmtca.timeutils import time_ms
+
+log = logging.getLogger(__name__)
+DEFAULT_WINDOW = 4
+# rq_seq is 6 bits wide, every request in flight needs its own number
+MAX_WINDOW = 63
+IPMB_RSP_MIN_LEN = 7
+DEFAULT_RESPONSE_TIMEOUT = 2  # s
+# a window refilled as responses arrive gives the lock back after this time
+MAX_WINDOW_RUN = 1000  # ms
+
+
+def create_sensor_reading_request(sdr_entry):
+    """ The request goes to the target of the SDR entry when it has one,
+        to the default target of the connection otherwise """
+    req = create_request_by_name('GetSensorReading')
+    req.sensor_number = sdr_entry.number
+    req.lun = sdr_entry.owner_lun
+    req.target = getattr(sdr_entry, 'target', None)
+    return req
+
+
+def send_message(ipmi, req):
+    """ Sends a request to its own target if it has one, to the default
+        target of the connection otherwise """
+    if not getattr(req, 'target', None):
+        return ipmi.send_message(req)
+    # send_message would replace the target of the request
+    req.requester = ipmi.requester
+    return ipmi.interface.send_and_receive(req)
+
+
+def decode_sensor_reading(rsp):
+    """ Same result as pyipmi's get_sensor_reading: (raw, states) """
+    check_completion_code(rsp.completion_code)
+    reading = rsp.sensor_reading
+    if rsp.config.initial_update_in_progress:
+        reading = None
+
+    states = None
+    if rsp.states1 is not None:
+        states = rsp.states1
+        if rsp.states2 is not None:
+            states |= (rsp.states2 << 8)
+    return (reading, states)
+
+
+class IpmiRequest(object):
+    """ Work submitted to the engine, the caller waits on result() or
+        gets the request back in callback, called on the engine thread """
+    def __init__(self, req=None, func=None, args=(), kwargs=None,
+                 callback=None):
+        self.req = req
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.header = None
+        self.elapsed_ms = None
+        self._sent_ms = None
+        self._rsp = None
+        self._error = None
+        self._started = threading.Event()
+        self._done = threading.Event()
+        self.callback = callback
+
+    def start(self):
+        """ Called by the engine when the request is sent or the call
+            runs """
+        self._sent_ms = time_ms()
+        self._started.set()
+
+    def wait_started(self, timeout=None):
+        """ Waits until the engine gets to the request
+            Returns:
+               False if it is still queued after timeout seconds
+        """
+        return self._started.wait(timeout)
+
+    def set_result(self, rsp):
+        if self._sent_ms is not None:
+            self.elapsed_ms = time_ms() - self._sent_ms
+        self._rsp = rsp
+        self._complete()
+
+    def set_error(self, error):
+        self._error = error
+        self._complete()
+
+    def _complete(self):
+        self._started.set()
+        self._done.set()
+        if self.callback:
+            try:
+                self.callback(self)
+            except Exception as e:
+                log.exception('IPMI request callback failed: %s', e)
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError('IPMI request not completed')
+        if self._error is not None:
+            raise self._error
+        return self._rsp
+
+
+class IpmiRequestEngine(object):
+    """ Owns the IPMI connection for the polling loops
+
+        Plain requests are sent in windows: up to `window` requests are
+        outstanding at once, each one with its own IPMB sequence number, and
+        the responses are matched back by sequence number, so a window costs
+        about one round trip instead of one per request. Each response makes
+        room for the next queued request, so the window stays full.
+        Compound operations (e.g. SEL transactions) are run with call() on
+        the engine thread between windows.
+    """
+    def __init__(self, ipmi, window=DEFAULT_WINDOW):
+        self.ipmi = ipmi
+        self.window = max(1, min(window, MAX_WINDOW))
+        # time of the last request completed without error
+        self.last_result_ms = None
+        self._queue = Queue()
+        self._thread = None
+        self._quit = False
+
+    def start(self):
+        if not self._thread:
+            self._quit = False
+            self._thread = threading.Thread(None, self._engine_loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._quit = True
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, req, callback=None):
+        request = IpmiRequest(req=req, callback=callback)
+        self._queue.put(request)
+        return request
+
+    def call(self, func, *args, **kwargs):
+        request = IpmiRequest(func=func, args=args, kwargs=kwargs)
+        self._queue.put(request)
+        return request
+
+    def _engine_loop(self):
+        pending = []
+        while not self._quit:
+            request = pending.pop(0) if pending else self._queue.get()
+            if request is None:
+                continue
+
+            if request.func:
+                self._run_call(request)
+                continue
+
+            requests = [request]
+            while len(requests) < self.window:
+                try:
+                    request = self._queue.get_nowait()
+                except Empty:
+                    break
+                if request is None or request.func:
+                    # calls keep their place in the queue order
+                    pending.append(request)
+                    break
+                requests.append(request)
+
+            pending.extend(self._run_window(requests))
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except Empty:
+                break
+            if request:
+                request.set_error(RuntimeError('IPMI engine stopped'))
+
+    def _set_result(self, request, rsp):
+        self.last_result_ms = time_ms()
+        request.set_result(rsp)
+
+    def _run_call(self, request):
+        request.start()
+        try:
+            rsp = request.func(*request.args, **request.kwargs)
+        except Exception as e:
+            request.set_error(e)
+            return
+        self._set_result(request, rsp)
+
+    def _run_window(self, requests):
+        """ Returns:
+               The calls taken from the queue meanwhile, in queue order
+        """
+        if isinstance(self.ipmi.interface, Rmcp):
+            return self._send_window(requests)
+
+        # other interfaces can't have several requests in flight
+        for request in requests:
+            request.start()
+            try:
+                rsp = send_message(self.ipmi, request.req)
+            except Exception as e:
+                request.set_error(e)
+                continue
+            self._set_result(request, rsp)
+        return []
+
+    def _encode(self, request):
+        interface = self.ipmi.interface
+        req = request.req
+        target = getattr(req, 'target', None) or self.ipmi.target
+        interface._inc_sequence_number()
+        header = IpmbHeaderReq()
+        header.netfn = req.netfn
+        header.rs_lun = req.lun
+        header.rs_sa = target.ipmb_address
+        header.rq_seq = interface.next_sequence_number
+        header.rq_lun = 0
+        header.rq_sa = interface.slave_address
+        header.cmdid = req.cmdid
+        payload = encode_message(req)
+        if target.routing:
+            tx_data = encode_bridged_message(target.routing, header, payload,
+                                             header.rq_seq)
+        else:
+            tx_data = encode_ipmb_msg(header, payload)
+        request.header = header
+        return tx_data
+
+    def _send_request(self, request, in_flight):
+        try:
+            tx_data = self._encode(request)
+            request.start()
+            self.ipmi.interface._send_ipmi_msg(tx_data)
+        except Exception as e:
+            request.set_error(e)
+            return
+        in_flight[request.header.rq_seq] = request
+
+    def _refill(self, in_flight, deferred):
+        """ Sends queued requests until the window is full again, stops at
+            the first call, it has to wait for the window to drain """
+        while len(in_flight) < self.window:
+            try:
+                request = self._queue.get_nowait()
+            except Empty:
+                return
+            if request is None or request.func:
+                deferred.append(request)
+                return
+            self._send_request(request, in_flight)
+
+    @staticmethod
+    def _expire(in_flight, timeout_ms):
+        now = time_ms()
+        for (seq, request) in list(in_flight.items()):
+            if now - request._sent_ms > timeout_ms:
+                in_flight.pop(seq).set_error(
+                    socket.timeout('No response from MCH'))
+
+    def _send_window(self, requests):
+        interface = self.ipmi.interface
+        timeout_ms = (interface._sock.gettimeout() or
+                      DEFAULT_RESPONSE_TIMEOUT) * 1000
+        in_flight = {}
+        deferred = []
+        start = time_ms()
+        # the transaction lock keeps pyipmi's own requests (e.g. keep alive)
+        # from reading our responses
+        with interface.transaction_lock:
+            for request in requests:
+                self._send_request(request, in_flight)
+
+            while in_flight:
+                # completed requests are replaced by queued ones, so the
+                # window stays full, the lock is released now and then
+                if not deferred and time_ms() - start < MAX_WINDOW_RUN:
+                    self._refill(in_flight, deferred)
+                self._expire(in_flight, timeout_ms)
+                if not in_flight:
+                    break
+                try:
+                    rx_data = interface._receive_ipmi_msg()
+                except socket.timeout:
+                    break
+                except Exception as e:
+                    log.debug('Discarding bad message: %s', e)
+                    continue
+
+                if not rx_data or len(rx_data) < IPMB_RSP_MIN_LEN:
+                    continue
+                seq = IpmbHeaderRsp(data=rx_data).rq_seq
+                request = in_flight.get(seq)
+                if not request:
+                    log.debug('Discarding response with sequence %d', seq)
+                    continue
+
+                if array('B', rx_data)[5] == constants.CMDID_SEND_MESSAGE:
+                    try:
+                        rx_data = decode_bridged_message(rx_data)
+                    except CompletionCodeError as e:
+                        in_flight.pop(seq).set_error(e)
+                        continue
+                    if not rx_data or len(rx_data) < IPMB_RSP_MIN_LEN:
+                        # the forwarded reply comes in the next packet
+                        continue
+
+                if not rx_filter(request.header, rx_data):
+                    continue
+
+                in_flight.pop(seq)
+                req = request.req
+                rsp = create_message(req.netfn + 1, req.cmdid,
+                                     req.group_extension)
+                try:
+                    decode_message(rsp, rx_data[6:-1])
+                except Exception as e:
+                    request.set_error(e)
+                    continue
+                self._set_result(request, rsp)
+
+        for request in in_flight.values():
+            request.set_error(socket.timeout('No response from MCH'))
+        return deferred
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+import heapq
+import itertools
+import logging
+import math
+import threading
+
+from collections import namedtuple
+
+from pyipmi import sensor
+
+from epicsmonmtca.timeutils import (CATCH_UP_SKIP, LoopTiming,
+                                    get_next_deadline, time_ms)
+
+log = logging.getLogger(__name__)
+# polling period of each sensor type as a multiple of the base period,
+# slow moving values don't need to be read as often
+SENSOR_TYPE_PERIOD_FACTORS = {
+    sensor.SENSOR_TYPE_TEMPERATURE: 1,
+    sensor.SENSOR_TYPE_FRU_HOT_SWAP: 1,
+    sensor.SENSOR_TYPE_FAN: 2,
+    sensor.SENSOR_TYPE_CURRENT: 5,
+    sensor.SENSOR_TYPE_VOLTAGE: 10,
+}
+DEFAULT_PERIOD_FACTOR = 2
+MAX_IDLE_WAIT = 1000  # ms
+# unchanged values are published again after this time anyway, so clients
+# and archivers can tell a quiet sensor from a dead IOC
+DEFAULT_MAX_SILENCE = 10000  # ms
+# sensors without value are probed with an exponential backoff
+MIN_PROBE_BACKOFF = 1000  # ms
+MAX_PROBE_BACKOFF = 60000  # ms
+# a value is published when it moves more than the absolute deadband or
+# the relative one (a fraction of the last published value)
+Deadband = namedtuple('Deadband', ['absolute', 'relative'])
+NO_DEADBAND = Deadband(0.0, 0.0)
+
+
+def get_default_polling_period(sdr_entry, base_period):
+    factor = SENSOR_TYPE_PERIOD_FACTORS.get(
+        getattr(sdr_entry, 'sensor_type_code', None), DEFAULT_PERIOD_FACTOR)
+    return base_period * factor
+
+
+def is_outside_deadband(value, last_value, deadband):
+    if last_value is None or math.isnan(value) or math.isnan(last_value):
+        return True
+    limit = max(deadband.absolute, deadband.relative * abs(last_value))
+    return abs(value - last_value) > limit
+
+
+class SensorScheduler(object):
+    """ Keeps a deadline for each sensor and returns the sensors in
+        deadline order, so every sensor is read at its own period instead of
+        sweeping all of them at the fastest one
+
+        Parked sensors (sensors that returned no value) wait in a separate
+        probe queue and are only returned when there is room left after the
+        due active sensors
+
+        A sensor has one live entry in the queues, adding it again (e.g. to
+        read it right away) replaces the entry it had """
+    def __init__(self, catch_up=CATCH_UP_SKIP, timing=None):
+        self.catch_up = catch_up
+        # lateness of the reads of the active sensors, several schedulers
+        # can share it
+        self.timing = timing or LoopTiming()
+        self._heap = []
+        self._probe_heap = []
+        self._counter = itertools.count()
+        # live entry of each sensor, the other entries are skipped
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, sensor_watch, deadline=None):
+        if deadline is None:
+            deadline = time_ms()
+        self._push(self._heap, sensor_watch, deadline)
+
+    def add_probe(self, sensor_watch, deadline):
+        self._push(self._probe_heap, sensor_watch, deadline)
+
+    def _push(self, heap, sensor_watch, deadline):
+        with self._lock:
+            entry = next(self._counter)
+            self._entries[sensor_watch] = entry
+            heapq.heappush(heap, (deadline, entry, sensor_watch))
+        self._wakeup.set()
+
+    def _pop_due(self, heap, now, due, max_count, timed):
+        while heap and heap[0][0] <= now and len(due) < max_count:
+            deadline, entry, sensor_watch = heapq.heappop(heap)
+            if self._entries.get(sensor_watch) != entry:
+                continue  # replaced by a later entry
+            del self._entries[sensor_watch]
+            if timed:
+                self.timing.add_late(now - deadline)
+            due.append((sensor_watch, deadline))
+
+    def reschedule(self, sensor_watch, deadline):
+        """ Schedules the next read one period after the previous deadline,
+            if the sensor is late by more than a period, missed reads are
+            skipped or done in a burst depending on the catch-up policy """
+        now = time_ms()
+        (next_deadline, skipped) = get_next_deadline(
+            deadline, sensor_watch.period, now, self.catch_up)
+        if next_deadline < now or skipped:
+            self.timing.add_overrun(skipped)
+        self.add(sensor_watch, next_deadline)
+
+    def wait_due(self, max_count=1, timeout=MAX_IDLE_WAIT):
+        """ Waits until some sensor is due
+            Arguments:
+               max_count: maximum number of sensors returned
+               timeout: maximum time to wait in ms
+            Returns:
+               A list of (sensor_watch, deadline) tuples in deadline order,
+               empty if no sensor was due within the timeout
+        """
+        with self._lock:
+            self._wakeup.clear()
+            now = time_ms()
+            due = []
+            self._pop_due(self._heap, now, due, max_count, True)
+            self._pop_due(self._probe_heap, now, due, max_count, False)
+            if due:
+                return due
+            for heap in (self._heap, self._probe_heap):
+                if heap:
+                    timeout = min(timeout, heap[0][0] - now)
+
+        self._wakeup.wait(timeout / 1000.0)
+        return []
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+import glob
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+from array import array
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from os import path
+
+from epicsmonmtca.epicsutils import get_sensor_pv_suffix
+from epicsmonmtca.timeutils import PeriodicTimer
+
+log = logging.getLogger(__name__)
+DEFAULT_MAX_FILE_SIZE = 64 * 1024 * 1024  # bytes
+DEFAULT_MAX_FILE_AGE = 24 * 3600  # s
+FLUSH_PERIOD = 1000  # ms
+# readings waiting to be written, newer ones are dropped when the disk
+# can't keep up
+MAX_PENDING_READINGS = 1000000
+FILE_MAGIC = b'EMMREC\x01\n'
+FILE_PATTERN = 'readings-*.emr'
+# a file is a sequence of blocks, each starting with its type:
+# 'N': id (u32), name length (u16) and name of a sensor, before its first
+#      reading in the file
+# 'R': count (u32), first and last time (f64) and then the columns of
+#      count readings: times (f64), sensor ids (u32), values (f32) and
+#      status (u16), all little endian
+NAME_BLOCK = b'N'
+READINGS_BLOCK = b'R'
+NAME_HEADER = struct.Struct('<IH')
+READINGS_HEADER = struct.Struct('<Idd')
+COLUMN_TYPES = ('d', 'I', 'f', 'H')
+
+Reading = namedtuple('Reading', ['time', 'sensor', 'value', 'status'])
+
+
+def _to_little_endian(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class ReadingRecorder(object):
+    """ Appends the published sensor readings to local files
+
+        The polling loops only append to in-memory columns, a background
+        thread writes them out as one block every FLUSH_PERIOD, so the IPMI
+        loops never wait for the disk. A new file is started when the
+        current one is bigger than max_bytes or older than max_age seconds,
+        only the newest `keep` files are kept (all of them if 0).
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_FILE_SIZE,
+                 max_age=DEFAULT_MAX_FILE_AGE, keep=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.dropped = 0
+        self._ids = {}
+        self._names = []
+        self._columns = self._new_columns()
+        self._lock = threading.Lock()
+        self._timer = PeriodicTimer(FLUSH_PERIOD)
+        self._thread = None
+        self._fhandle = None
+        self._file_size = 0
+        self._file_opened = 0
+        self._written_names = 0
+
+    @staticmethod
+    def _new_columns():
+        return tuple(array(typecode) for typecode in COLUMN_TYPES)
+
+    def add(self, slot_id, sensor_name, value, status, timestamp=None):
+        key = (slot_id, sensor_name)
+        with self._lock:
+            if len(self._columns[0]) >= MAX_PENDING_READINGS:
+                self.dropped += 1
+                return
+            sensor_id = self._ids.get(key)
+            if sensor_id is None:
+                sensor_id = len(self._names)
+                self._ids[key] = sensor_id
+                self._names.append(get_sensor_pv_suffix(slot_id, sensor_name))
+            (times, ids, values, statuses) = self._columns
+            times.append(time.time() if timestamp is None else timestamp)
+            ids.append(sensor_id)
+            values.append(value)
+            statuses.append((status or 0) & 0xffff)
+
+    def start(self):
+        if not self._thread:
+            os.makedirs(self.directory, exist_ok=True)
+            self._timer.start()
+            self._thread = threading.Thread(None, self._writer_loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """ Writes the pending readings and closes the current file """
+        if self._thread:
+            self._timer.stop()
+            self._thread.join()
+            self._thread = None
+
+    def _writer_loop(self):
+        while self._timer.wait():
+            self._flush()
+        self._flush()
+        self._close_file()
+
+    def _flush(self):
+        with self._lock:
+            columns = self._columns
+            names = self._names[:]
+            self._columns = self._new_columns()
+        if not columns[0]:
+            return
+
+        try:
+            self._rotate_if_due()
+            data = []
+            for sensor_id in range(self._written_names, len(names)):
+                name = names[sensor_id].encode()
+                data.append(NAME_BLOCK)
+                data.append(NAME_HEADER.pack(sensor_id, len(name)))
+                data.append(name)
+            self._written_names = len(names)
+            times = columns[0]
+            data.append(READINGS_BLOCK)
+            data.append(READINGS_HEADER.pack(len(times), min(times),
+                                             max(times)))
+            data.extend(_to_little_endian(column) for column in columns)
+            block = b''.join(data)
+            self._fhandle.write(block)
+            self._fhandle.flush()
+            self._file_size += len(block)
+        except (IOError, OSError) as e:
+            log.error('Failed to record %d readings: %s', len(columns[0]), e)
+            self._close_file()
+
+    def _rotate_if_due(self):
+        if self._fhandle and (
+                self._file_size >= self.max_bytes or
+                time.time() - self._file_opened >= self.max_age):
+            self._close_file()
+        if not self._fhandle:
+            self._open_file()
+
+    def _open_file(self):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        filepath = path.join(self.directory, 'readings-{}.emr'.format(stamp))
+        suffix = 1
+        while path.exists(filepath):
+            filepath = path.join(self.directory, 'readings-{}-{}.emr'.format(
+                stamp, suffix))
+            suffix += 1
+        log.info('Recording readings to %s', filepath)
+        self._fhandle = open(filepath, 'wb')
+        self._fhandle.write(FILE_MAGIC)
+        self._file_size = len(FILE_MAGIC)
+        self._file_opened = time.time()
+        # every file names the sensors it uses
+        self._written_names = 0
+        self._prune()
+
+    def _close_file(self):
+        if self._fhandle:
+            try:
+                self._fhandle.close()
+            except (IOError, OSError) as e:
+                log.debug('Failed to close recording: %s', e)
+            self._fhandle = None
+
+    def _prune(self):
+        if not self.keep:
+            return
+        for filepath in list_recording_files(self.directory)[:-self.keep]:
+            try:
+                os.remove(filepath)
+            except OSError as e:
+                log.warning('Failed to remove %s: %s', filepath, e)
+
+
+def list_recording_files(directory):
+    """ Returns:
+           The recording files of a directory, oldest first
+    """
+    return sorted(glob.glob(path.join(directory, FILE_PATTERN)),
+                  key=path.getmtime)
+
+
+def read_recording_file(filepath, start=None, end=None, sensors=None):
+    """ Reads the readings of a recording file in the time range [start,
+        end] (epoch seconds), only of the sensors matching one of the
+        `sensors` glob patterns if given. Blocks out of the range are
+        skipped without reading their columns.
+        Returns:
+           A generator of Reading tuples
+    """
+    names = {}
+    wanted = {}
+    with open(filepath, 'rb') as fhandle:
+        if fhandle.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError('{} is not a recording'.format(filepath))
+        while True:
+            block_type = fhandle.read(1)
+            if not block_type:
+                break
+            if block_type == NAME_BLOCK:
+                header = fhandle.read(NAME_HEADER.size)
+                if len(header) < NAME_HEADER.size:
+                    break
+                (sensor_id, length) = NAME_HEADER.unpack(header)
+                name = fhandle.read(length).decode()
+                names[sensor_id] = name
+                wanted[sensor_id] = sensors is None or any(
+                    fnmatchcase(name, pattern) for pattern in sensors)
+                continue
+            if block_type != READINGS_BLOCK:
+                raise ValueError('Corrupted recording {}'.format(filepath))
+
+            header = fhandle.read(READINGS_HEADER.size)
+            if len(header) < READINGS_HEADER.size:
+                break  # truncated by a crash
+            (count, first, last) = READINGS_HEADER.unpack(header)
+            sizes = [count * array(typecode).itemsize
+                     for typecode in COLUMN_TYPES]
+            if (start is not None and last < start) or \
+                    (end is not None and first > end):
+                fhandle.seek(sum(sizes), os.SEEK_CUR)
+                continue
+
+            data = fhandle.read(sum(sizes))
+            if len(data) < sum(sizes):
+                break
+            columns = []
+            offset = 0
+            for (typecode, size) in zip(COLUMN_TYPES, sizes):
+                columns.append(_from_little_endian(
+                    typecode, data[offset:offset + size]))
+                offset += size
+            for (timestamp, sensor_id, value, status) in zip(*columns):
+                if not wanted.get(sensor_id) or \
+                        (start is not None and timestamp < start) or \
+                        (end is not None and timestamp > end):
+                    continue
+                yield Reading(timestamp, names[sensor_id], value, status)
+
+
+def read_recording(directory, start=None, end=None, sensors=None):
+    """ Readings of every recording file of a directory, see
+        read_recording_file """
+    for filepath in list_recording_files(directory):
+        if start is not None and path.getmtime(filepath) < start:
+            continue  # nothing was written to it after start
+        for reading in read_recording_file(filepath, start, end, sensors):
+            yield reading
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import logging
+import os
+import sqlite3
+import time
+
+from collections import namedtuple
+from os import path
+
+log = logging.getLogger(__name__)
+# rows are committed once the SEL worker has no more entries queued, or
+# every this many rows
+MAX_BATCH = 500
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sel_events (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        logged REAL NOT NULL,
+        record_id INTEGER,
+        slot TEXT,
+        generator INTEGER,
+        sensor_number INTEGER,
+        sensor TEXT,
+        sensor_type INTEGER,
+        event_type INTEGER,
+        assertion INTEGER,
+        offset INTEGER,
+        event_data BLOB,
+        summary TEXT,
+        raw BLOB)''',
+    'CREATE INDEX IF NOT EXISTS sel_time ON sel_events (time)',
+    'CREATE INDEX IF NOT EXISTS sel_slot ON sel_events (slot, time)',
+    'CREATE INDEX IF NOT EXISTS sel_sensor ON sel_events (sensor, time)',
+    'CREATE INDEX IF NOT EXISTS sel_event_type '
+    'ON sel_events (event_type, time)',
+]
+INSERT = '''INSERT INTO sel_events (time, logged, record_id, slot, generator,
+    sensor_number, sensor, sensor_type, event_type, assertion, offset,
+    event_data, summary, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+    ?)'''
+# conditions selecting each kind of event
+EVENT_KINDS = {
+    'threshold': 'event_type = 1',
+    'discrete': 'event_type BETWEEN 2 AND 12',
+    'sensor-specific': 'event_type = 111',
+    'hotswap': 'sensor_type = 240',
+}
+
+QUERY_COLUMNS = 'time, slot, sensor, sensor_type, event_type, assertion, ' \
+    'summary, raw'
+SelEvent = namedtuple('SelEvent', ['time', 'slot', 'sensor', 'sensor_type',
+                                   'event_type', 'assertion', 'summary',
+                                   'raw'])
+
+
+def get_journal_path(directory, pv_prefix):
+    return path.join(directory, '{}.sqlite'.format(pv_prefix))
+
+
+class SelJournal(object):
+    """ Every drained SEL entry in a SQLite database, raw and decoded,
+        indexed by time, slot, sensor and event type
+
+        The database is in WAL mode, so it can be queried while the IOC
+        writes to it. It is only used from the SEL worker thread, which
+        commits its rows in batches.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._conn = None
+        self._pending = 0
+
+    def _connect(self):
+        directory = path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        log.info('Journaling SEL entries to %s', self.filepath)
+        # created by the SEL worker, closed by the thread stopping it
+        conn = sqlite3.connect(self.filepath, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+
+    def add(self, sel_entry, slot_id=None, sensor_name=None, summary=None):
+        if not self._conn:
+            self._conn = self._connect()
+        self._conn.execute(INSERT, (
+            sel_entry.timestamp, time.time(), sel_entry.record_id,
+            '{}{}'.format(*slot_id) if slot_id else None,
+            sel_entry.generator_id, sel_entry.sensor_number, sensor_name,
+            sel_entry.sensor_type, sel_entry.event_type,
+            int(not sel_entry.event_direction),
+            sel_entry.event_data[0] & 15 if sel_entry.event_data else None,
+            bytes(sel_entry.event_data), summary, bytes(sel_entry.data)))
+        self._pending += 1
+        if self._pending >= MAX_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self._conn and self._pending:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        if self._conn:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+
+def query_sel_journal(filepath, start=None, end=None, slot=None,
+                      sensor=None, kind=None, limit=None):
+    """ Arguments:
+           start, end: time range in epoch seconds
+           slot: e.g. 'AMC5'
+           sensor: glob pattern of the sensor name
+           kind: one of EVENT_KINDS
+        Returns:
+           A list of SelEvent, oldest first
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append('time >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('time <= ?')
+        params.append(end)
+    if slot:
+        conditions.append('slot = ?')
+        params.append(slot.upper())
+    if sensor:
+        conditions.append('sensor GLOB ?')
+        params.append(sensor)
+    if kind:
+        conditions.append(EVENT_KINDS[kind])
+
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    if limit:
+        # the newest ones, still oldest first
+        query = 'SELECT {0} FROM (SELECT id, {0} FROM sel_events{1} ' \
+            'ORDER BY time DESC, id DESC LIMIT ?) ORDER BY time, id'
+        params.append(int(limit))
+    else:
+        query = 'SELECT {0} FROM sel_events{1} ORDER BY time, id'
+    query = query.format(QUERY_COLUMNS, where)
+
+    conn = sqlite3.connect('file:{}?mode=ro'.format(filepath), uri=True)
+    try:
+        return [SelEvent(*row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
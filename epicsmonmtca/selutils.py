@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+import logging
+import threading
+
+from collections import deque
+from queue import Queue
+
+from pyipmi.errors import CompletionCodeError
+from pyipmi.msgs import constants
+from pyipmi.sel import SelInfo
+from softioc import builder
+
+from epicsmonmtca.epicsutils import get_sensor_pv_suffix
+
+log = logging.getLogger(__name__)
+FIRST_SEL_RECORD_ID = 0
+LAST_SEL_RECORD_ID = 0xffff
+MAX_RESERVATION_RETRIES = 5
+# events shown in SEL:EVENTS, newest first
+SEL_HISTORY_LENGTH = 20
+SEL_SUMMARY_LENGTH = 120
+
+
+class SelReader(object):
+    """ Drains the SEL in one pass
+
+        Get SEL Info is checked first and nothing else is sent when the last
+        addition timestamp and the number of entries didn't change. Otherwise
+        all the entries are read under one reservation by following the next
+        record ids, and the SEL is cleared with that same reservation if no
+        entry was added in the meantime, or the read entries are deleted one
+        by one if some was. Entries that could not be removed are read again
+        by the next drain but only returned once.
+    """
+    def __init__(self, ipmi):
+        self.ipmi = ipmi
+        self._last_state = None
+        # raw data of the entries returned but still in the SEL
+        self._returned = set()
+
+    def get_sel_state(self):
+        info = SelInfo(self.ipmi.send_message_with_name('GetSelInfo'))
+        return (info.most_recent_addition, info.entries)
+
+    def drain(self):
+        """ Returns:
+               A list with the new SEL entries, which are removed from the SEL
+        """
+        state = self.get_sel_state()
+        (_, count) = state
+        if count == 0 or state == self._last_state:
+            return []
+
+        for _ in range(MAX_RESERVATION_RETRIES):
+            reservation = self.ipmi.get_sel_reservation_id()
+            try:
+                entries = self._read_entries(reservation, count)
+                break
+            except CompletionCodeError as e:
+                if e.cc != constants.CC_RES_CANCELED:
+                    raise
+        else:
+            raise RuntimeError('SEL reservation canceled repeatedly')
+
+        log.debug('Read %d SEL entries', len(entries))
+        new_entries = [sel_entry for sel_entry in entries
+                       if bytes(sel_entry.data) not in self._returned]
+        try:
+            if self.get_sel_state() == state and self._clear(reservation):
+                state = None
+            else:
+                self._delete_entries(entries, reservation)
+        except Exception as e:
+            # the next drain reads them again and tries to remove them
+            log.warning('Failed to remove %d SEL entries: %s', len(entries),
+                        e)
+            self._returned = {bytes(sel_entry.data) for sel_entry in entries}
+            return new_entries
+
+        self._returned = set()
+        self._last_state = state
+        return new_entries
+
+    def _read_entries(self, reservation, count):
+        entries = []
+        record_id = FIRST_SEL_RECORD_ID
+        # the count bounds the walk in case the next ids are broken
+        while record_id != LAST_SEL_RECORD_ID and len(entries) < count:
+            (sel_entry, record_id) = self.ipmi.get_sel_entry(record_id,
+                                                             reservation)
+            entries.append(sel_entry)
+
+        return entries
+
+    def _clear(self, reservation):
+        try:
+            self.ipmi.send_message_with_name(
+                'ClearSel', reservation_id=reservation,
+                cmd=constants.REPOSITORY_INITIATE_ERASE)
+        except CompletionCodeError as e:
+            if e.cc == constants.CC_RES_CANCELED:
+                return False
+            raise
+        return True
+
+    def _delete_entries(self, entries, reservation):
+        for sel_entry in entries:
+            for _ in range(MAX_RESERVATION_RETRIES):
+                try:
+                    self.ipmi.delete_sel_entry(sel_entry.record_id,
+                                               reservation)
+                    break
+                except CompletionCodeError as e:
+                    if e.cc != constants.CC_RES_CANCELED:
+                        raise
+                    reservation = self.ipmi.get_sel_reservation_id()
+
+
+class SelEventLog(object):
+    """ PVs of the last SEL events: SEL:EVENTS has one line per event,
+        newest first, SEL:LAST the last one, SEL:COUNT and <SLOT>:SEL:COUNT
+        count the events since start """
+    def __init__(self, length=SEL_HISTORY_LENGTH):
+        self.count = 0
+        self.slot_counts = {}
+        self._summaries = deque(maxlen=length)
+        self._records = None
+        self._slot_records = {}
+
+    def create_records(self, slot_ids):
+        self._records = (
+            builder.longStringIn(
+                'SEL:EVENTS',
+                length=self._summaries.maxlen * (SEL_SUMMARY_LENGTH + 1)),
+            builder.stringIn('SEL:LAST'),
+            builder.longIn('SEL:COUNT'))
+        for slot_id in slot_ids:
+            self._slot_records[slot_id] = builder.longIn(
+                get_sensor_pv_suffix(slot_id, 'SEL COUNT'))
+
+    def add(self, summary, slot_id=None):
+        self.count += 1
+        self._summaries.appendleft(summary[:SEL_SUMMARY_LENGTH])
+        if slot_id:
+            self.slot_counts[slot_id] = self.slot_counts.get(slot_id, 0) + 1
+        if not self._records:
+            return
+
+        (events, last, count) = self._records
+        events.set('\n'.join(self._summaries))
+        last.set(summary[:39])
+        count.set(self.count)
+        slot_record = self._slot_records.get(slot_id)
+        if slot_record:
+            slot_record.set(self.slot_counts[slot_id])
+
+
+class SelWorker(object):
+    """ Handles the drained SEL entries on its own thread, so decoding,
+        logging and publishing them doesn't hold up the next SEL poll.
+        idle is called whenever the queued entries have been handled """
+    def __init__(self, handler, idle=None):
+        self.handler = handler
+        self.idle = idle
+        self._queue = Queue()
+        self._thread = None
+
+    def start(self):
+        if not self._thread:
+            self._thread = threading.Thread(None, self._worker_loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """ Handles the queued entries and stops """
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def put(self, sel_entries):
+        for sel_entry in sel_entries:
+            self._queue.put(sel_entry)
+
+    def _worker_loop(self):
+        while True:
+            sel_entry = self._queue.get()
+            if sel_entry is None:
+                break
+            try:
+                self.handler(sel_entry)
+            except Exception as e:
+                log.exception('Failed to handle SEL entry %d: %s',
+                              sel_entry.record_id, e)
+            if self.idle and self._queue.empty():
+                self.idle()
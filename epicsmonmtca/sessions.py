@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+import logging
+import threading
+
+from epicsmonmtca.pipeline import DEFAULT_WINDOW, IpmiRequestEngine
+from epicsmonmtca.timeutils import PeriodicTimer, time_ms
+
+log = logging.getLogger(__name__)
+DEFAULT_SESSIONS = 1
+HEALTH_CHECK_PERIOD = 5000  # ms
+# the probe is given this time once the engine sends it, the time spent
+# queued behind other requests doesn't count
+HEALTH_CHECK_TIMEOUT = 5  # s
+# a probe still queued after this time is not taken as an answer either way
+MAX_HEALTH_CHECK_QUEUEING = 60  # s
+# sensors can be spread across the sessions by slot or by owner IPMC
+SHARD_BY_SLOT = 'slot'
+SHARD_BY_OWNER = 'owner'
+SHARD_POLICIES = (SHARD_BY_SLOT, SHARD_BY_OWNER)
+# consecutive read timeouts after which a session is considered down
+DEFAULT_TRIP_TIMEOUTS = 3
+# a session that is down is established again with an exponential backoff
+MIN_RECONNECT_BACKOFF = 1000  # ms
+MAX_RECONNECT_BACKOFF = 60000  # ms
+
+
+class CircuitBreaker(object):
+    """ Connection health of a session
+
+        `threshold` consecutive timeouts trip the breaker (0 never trips
+        it): the session is considered down and is not polled until a
+        reconnection succeeds. The reconnections are attempted after
+        MIN_RECONNECT_BACKOFF, doubling up to MAX_RECONNECT_BACKOFF.
+    """
+    def __init__(self, threshold=DEFAULT_TRIP_TIMEOUTS):
+        self.threshold = threshold
+        self.is_open = False
+        self.trips = 0
+        self.backoff = 0
+        self.retry_at = None
+        self._timeouts = 0
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+
+    def add_success(self):
+        self._timeouts = 0
+
+    def add_timeout(self):
+        """ Returns:
+               True if this timeout tripped the breaker
+        """
+        with self._lock:
+            if self.is_open or not self.threshold:
+                return False
+            self._timeouts += 1
+            if self._timeouts < self.threshold:
+                return False
+            self.is_open = True
+            self.trips += 1
+            self.backoff = MIN_RECONNECT_BACKOFF
+            self.retry_at = time_ms() + self.backoff
+        return True
+
+    def wait_retry(self, max_wait):
+        """ Waits until the next reconnection is due, max_wait ms at most
+            Returns:
+               True if the reconnection is due
+        """
+        delay = self.retry_at - time_ms()
+        if delay > 0:
+            self._abort.wait(min(delay, max_wait) / 1000.0)
+        return not self._abort.is_set() and time_ms() >= self.retry_at
+
+    def retry_failed(self):
+        self.backoff = min(2 * self.backoff, MAX_RECONNECT_BACKOFF)
+        self.retry_at = time_ms() + self.backoff
+
+    def close(self):
+        with self._lock:
+            self.is_open = False
+            self._timeouts = 0
+            self.backoff = 0
+            self.retry_at = None
+
+    def abort(self):
+        """ Wakes up and stops any wait_retry, when stopping """
+        self._abort.set()
+
+
+class IpmiSession(object):
+    """ One RMCP session to the MCH with its own request engine """
+    def __init__(self, index, ipmi, window=DEFAULT_WINDOW):
+        self.index = index
+        self.ipmi = ipmi
+        self.engine = IpmiRequestEngine(ipmi, window)
+        self.breaker = CircuitBreaker()
+        self.healthy = True
+
+    def check_health(self):
+        """ Sends a Get Device ID through the engine, an unhealthy session
+            is established again. No probe is sent when the session
+            answered a request within the last health check period.
+            Returns:
+               True if the session answered
+        """
+        last_result = self.engine.last_result_ms
+        if self.healthy and last_result is not None and \
+                time_ms() - last_result < HEALTH_CHECK_PERIOD:
+            return True
+
+        request = self.engine.call(self.ipmi.get_device_id)
+        if not request.wait_started(MAX_HEALTH_CHECK_QUEUEING):
+            log.debug('Health check of IPMI session %d still queued',
+                      self.index)
+            return self.healthy
+        try:
+            request.result(HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            if self.healthy:
+                log.warning('IPMI session %d is not answering: %s',
+                            self.index, e)
+            self.healthy = False
+            self.engine.call(self._reestablish)
+            return False
+
+        if not self.healthy:
+            log.info('IPMI session %d is back', self.index)
+        self.healthy = True
+        return True
+
+    def reconnect(self):
+        """ Establishes the session again and probes it with a Get Device
+            ID, both through the engine
+            Returns:
+               True if the MCH answered the probe
+        """
+        self.engine.call(self._reestablish).result()
+        try:
+            self.engine.call(self.ipmi.get_device_id).result()
+        except Exception as e:
+            log.debug('IPMI session %d is still down: %s', self.index, e)
+            self.healthy = False
+            return False
+
+        self.healthy = True
+        return True
+
+    def _reestablish(self):
+        try:
+            self.ipmi.session.close()
+        except Exception as e:
+            log.debug('Failed to close IPMI session %d: %s', self.index, e)
+        try:
+            self.ipmi.session.establish()
+        except Exception as e:
+            log.debug('Failed to establish IPMI session %d: %s', self.index,
+                      e)
+
+    def close(self):
+        self.breaker.abort()
+        self.engine.stop()
+        try:
+            self.ipmi.session.close()
+        except Exception as e:
+            log.debug('Failed to close IPMI session %d: %s', self.index, e)
+
+
+class IpmiSessionPool(object):
+    """ Several RMCP sessions to the same MCH, so the reads of different
+        modules are in flight at the same time instead of queueing behind a
+        single session. Each session keeps itself alive (pyipmi's keep-alive
+        runs per interface) and is health checked on its own.
+
+        The first session is the primary one, it serves the SEL and FRU
+        requests as well as its share of the sensors. Sensors are assigned
+        to sessions by shard key (slot or owner IPMC) in round-robin order
+        of first use, so the requests to an IPMC keep their order.
+    """
+    def __init__(self, create_connection, size=DEFAULT_SESSIONS,
+                 window=DEFAULT_WINDOW):
+        self.sessions = []
+        try:
+            for index in range(max(1, size)):
+                self.sessions.append(
+                    IpmiSession(index, create_connection(), window))
+        except Exception:
+            # the sessions already opened would be kept alive for nothing
+            for session in self.sessions:
+                session.close()
+            raise
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._health_timer = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @property
+    def primary(self):
+        return self.sessions[0]
+
+    def get_session(self, shard_key):
+        with self._lock:
+            index = self._shards.get(shard_key)
+            if index is None:
+                index = len(self._shards) % len(self.sessions)
+                self._shards[shard_key] = index
+        return self.sessions[index]
+
+    def set_timeout(self, timeout):
+        for session in self.sessions:
+            session.ipmi.interface.set_timeout(timeout)
+
+    def set_trip_timeouts(self, timeouts):
+        """ Consecutive timeouts after which a session is considered down,
+            0 disables it """
+        for session in self.sessions:
+            session.breaker.threshold = timeouts
+
+    @property
+    def offline(self):
+        """ Number of sessions whose breaker is open """
+        return sum(1 for session in self.sessions if session.breaker.is_open)
+
+    def start(self):
+        for session in self.sessions:
+            session.engine.start()
+        if not self._health_thread:
+            self._health_timer = PeriodicTimer(HEALTH_CHECK_PERIOD)
+            self._health_thread = threading.Thread(None, self._health_loop)
+            self._health_thread.daemon = True
+            self._health_thread.start()
+
+    def stop(self):
+        if self._health_thread:
+            self._health_timer.stop()
+            self._health_thread.join()
+            self._health_thread = None
+        for session in self.sessions:
+            session.close()
+
+    def _health_loop(self):
+        self._health_timer.start()
+        while self._health_timer.wait():
+            for session in self.sessions:
+                # a tripped session is reconnected by its polling loop
+                if not session.breaker.is_open:
+                    session.check_health()
@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+import heapq
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+
+from pyipmi.interfaces.ipmb import checksum
+from pyipmi.interfaces.rmcp import (RMCP_CLASS_ASF, RMCP_CLASS_IPMI, AsfMsg,
+                                    AsfPong, RmcpMsg)
+from pyipmi.msgs import constants
+
+log = logging.getLogger(__name__)
+SDR_VERSION = 0x51
+SEL_VERSION = 0x51
+SEL_RECORD_TYPE_SYSTEM_EVENT = 0x02
+SEL_EVM_REVISION = 0x04
+LAST_RECORD_ID = 0xffff
+MCH_ADDRESS = 0x20
+CARRIER_MANAGER_ADDRESS = 0x82
+SENSOR_TYPE_TEMPERATURE = 0x01
+SENSOR_TYPE_FRU_HOT_SWAP = 0xf0
+ENTITY_ID_AMC = 0xc1
+MAX_AMC = 12
+SENSORS_PER_LUN = 256
+HS_STATE_M4 = 0x10
+# M states reported by hot swap events
+HS_EVENT_M0 = 0
+HS_EVENT_M4 = 4
+SENSOR_UPDATE_IN_PROGRESS = 0x20
+CC_OK = 0x00
+CC_INVALID_COMMAND = 0xc1
+CC_REQ_DATA_NOT_PRESENT = 0xcb
+
+
+def encode_sdr_name(name):
+    name = name.encode()
+    return bytes([0xc0 | len(name)]) + name
+
+
+def encode_sdr_header(record_id, record_type, body):
+    return struct.pack('<HBBB', record_id, SDR_VERSION, record_type,
+                       len(body)) + body
+
+
+def encode_full_sensor_record(record_id, owner_id, lun, number, name,
+                              entity_id=ENTITY_ID_AMC, instance=0x61,
+                              sensor_type=SENSOR_TYPE_TEMPERATURE, m=1, b=0,
+                              units2=1, thresholds=(90, 80, 70, 0, 5, 10)):
+    """ Full sensor record of a linear threshold based sensor
+        thresholds: (UNR, UC, UNC, LNR, LC, LNC) raw values
+    """
+    body = bytearray(42)
+    body[0] = owner_id
+    body[1] = lun & 0x3
+    body[2] = number
+    body[3] = entity_id
+    body[4] = instance
+    body[5] = 0x7f  # sensor initialization
+    body[6] = 0x68  # sensor capabilities
+    body[7] = sensor_type
+    body[8] = 0x01  # threshold event/reading type
+    body[9:15] = b'\xff\x7f\xff\x7f\x3f\x3f'  # event masks
+    body[16] = units2
+    body[19] = m & 0xff
+    body[20] = (m >> 2) & 0xc0
+    body[21] = b & 0xff
+    body[22] = (b >> 2) & 0xc0
+    body[31:37] = bytes(thresholds)
+    return encode_sdr_header(record_id, 0x01,
+                             bytes(body) + encode_sdr_name(name))
+
+
+def encode_compact_sensor_record(record_id, owner_id, lun, number, name,
+                                 entity_id=ENTITY_ID_AMC, instance=0x61,
+                                 sensor_type=SENSOR_TYPE_FRU_HOT_SWAP,
+                                 event_type=0x6f):
+    body = bytearray(26)
+    body[0] = owner_id
+    body[1] = lun & 0x3
+    body[2] = number
+    body[3] = entity_id
+    body[4] = instance
+    body[7] = sensor_type
+    body[8] = event_type
+    return encode_sdr_header(record_id, 0x02,
+                             bytes(body) + encode_sdr_name(name))
+
+
+def _encode_fru_area(prefix, fields):
+    area = bytearray(prefix)
+    for field in fields:
+        area += encode_sdr_name(field)
+    area += b'\xc1'  # end of fields
+    while (len(area) + 1) % 8:
+        area += b'\x00'
+    area += b'\x00'
+    area[1] = len(area) // 8
+    area[-1] = checksum(area[:-1])
+    return area
+
+
+def encode_fru_inventory(manufacturer, product, part_number, serial_number):
+    """ FRU inventory with a board and a product info area """
+    board = _encode_fru_area([1, 0, 25, 0, 0, 0], [
+        manufacturer, product, serial_number, part_number, ''])
+    product_area = _encode_fru_area([1, 0, 25], [
+        manufacturer, product, part_number, '1.0', serial_number, '', ''])
+    header = bytearray([1, 0, 0, 1, 1 + len(board) // 8, 0, 0, 0])
+    header[7] = checksum(header[:7])
+    return bytes(header + board + product_area)
+
+
+class SimulatedCrate(object):
+    """ Contents of the simulated MCH: SDR repository, FRU inventories,
+        sensor readings and SEL """
+    def __init__(self):
+        self.sdr_records = []
+        # most recent addition and erase of SDR records
+        self.sdr_timestamp = int(time.time())
+        self.sdr_erase_timestamp = self.sdr_timestamp
+        self.fru_inventories = {}
+        # raw reading and states of each (owner_id, lun, number)
+        self.readings = {}
+        self._readings_by_number = {}
+        # raw (UNR, UC, UNC, LNR, LC, LNC) of each full sensor
+        self.thresholds = {}
+        self.sel = {}
+        self.sel_timestamp = 0
+        self._next_sel_record_id = 1
+        self._lock = threading.Lock()
+
+    def add_sdr(self, record, reading=None):
+        self.sdr_records.append(record)
+        (owner_id, lun, number) = (record[5], record[6] & 0x3, record[7])
+        if record[3] == 0x01:
+            self.thresholds[(owner_id, lun, number)] = tuple(record[36:42])
+        if reading is not None:
+            self.set_reading(owner_id, lun, number, *reading)
+
+    def get_next_sdr_record_id(self):
+        return len(self.sdr_records) + 1
+
+    def set_reading(self, owner_id, lun, number, raw, states=0):
+        """ raw None makes the sensor return no value """
+        self.readings[(owner_id, lun, number)] = (raw, states)
+        self._readings_by_number.setdefault((lun, number), (owner_id, lun,
+                                                            number))
+
+    def get_reading(self, owner_id, lun, number):
+        key = (owner_id, lun, number)
+        if key not in self.readings:
+            # requests not routed to the sensor owner
+            key = self._readings_by_number.get((lun, number))
+        return self.readings.get(key)
+
+    def insert_amc(self, amc, nsensors, event=True):
+        """ Adds the SDR records and FRU inventory of an AMC with nsensors
+            temperature sensors, announcing it with a hot swap event """
+        instance = 0x60 + amc
+        owner_id = get_amc_address(amc)
+        self.add_sdr(encode_compact_sensor_record(
+            self.get_next_sdr_record_id(), owner_id, 0, 0,
+            'HS {:03d}'.format(amc), instance=instance),
+            reading=(0, HS_STATE_M4))
+        self.fru_inventories[5 + amc - 1] = encode_fru_inventory(
+            'Simulated', 'AMC {}'.format(amc), 'SIM-AMC',
+            'SN{:04d}'.format(amc))
+        for index in range(1, nsensors + 1):
+            (lun, number) = divmod(index, SENSORS_PER_LUN)
+            self.add_sdr(encode_full_sensor_record(
+                self.get_next_sdr_record_id(), owner_id, lun, number,
+                'Temp {}'.format(index), instance=instance),
+                reading=(40 + index % 20, 0))
+        self.sdr_timestamp = int(time.time())
+        if event:
+            self.add_hotswap_event(amc, HS_EVENT_M4)
+
+    def remove_amc(self, amc, event=True):
+        """ Removes the SDR records and FRU inventory of an AMC, the record
+            ids of the records left are renumbered as an MCH would """
+        owner_id = get_amc_address(amc)
+        self.sdr_records = [
+            struct.pack('<H', index + 1) + record[2:] for (index, record)
+            in enumerate(record for record in self.sdr_records
+                         if record[5] != owner_id)]
+        for key in [key for key in self.readings if key[0] == owner_id]:
+            del self.readings[key]
+            self.thresholds.pop(key, None)
+        self._readings_by_number = {}
+        for key in self.readings:
+            self._readings_by_number.setdefault(key[1:], key)
+        self.fru_inventories.pop(5 + amc - 1, None)
+        self.sdr_erase_timestamp = int(time.time())
+        if event:
+            self.add_hotswap_event(amc, HS_EVENT_M0)
+
+    def add_hotswap_event(self, amc, state):
+        self.add_sel_event(0, SENSOR_TYPE_FRU_HOT_SWAP, 0x6f,
+                           (0xa0 | state, 0xff, 0xff),
+                           generator_id=get_amc_address(amc))
+
+    def add_sel_event(self, sensor_number, sensor_type, event_type,
+                      event_data=(0, 0xff, 0xff), lun=0,
+                      generator_id=CARRIER_MANAGER_ADDRESS, assertion=True):
+        with self._lock:
+            record_id = self._next_sel_record_id
+            self._next_sel_record_id = record_id % 0xfffe + 1
+            self.sel_timestamp = int(time.time())
+            self.sel[record_id] = struct.pack(
+                '<HBIHBBBB3B', record_id, SEL_RECORD_TYPE_SYSTEM_EVENT,
+                self.sel_timestamp, generator_id | (lun << 8),
+                SEL_EVM_REVISION, sensor_type, sensor_number,
+                (0 if assertion else 0x80) | event_type, *event_data)
+            return record_id
+
+
+def get_amc_address(amc):
+    return 0x70 + 2 * amc
+
+
+def build_crate(nsensors, namc=MAX_AMC):
+    """ Crate with namc AMCs, each one with a hot swap sensor, an FRU
+        inventory and its share of nsensors temperature sensors """
+    crate = SimulatedCrate()
+    namc = max(1, min(namc, MAX_AMC))
+    for amc in range(1, namc + 1):
+        crate.insert_amc(amc, nsensors // namc + (amc <= nsensors % namc),
+                         event=False)
+
+    return crate
+
+
+class MchSimulator(object):
+    """ Answers IPMI over RMCP (IPMI v1.5, no authentication) on a UDP
+        socket like an MCH would, serving the contents of a SimulatedCrate.
+
+        Bridged requests (Send Message) are answered in one packet with the
+        bridged response embedded. Sensor readings are answered after
+        latency +/- jitter seconds without blocking other requests, so
+        several requests can be outstanding as with a real MCH.
+    """
+    def __init__(self, crate, host='127.0.0.1', port=0, latency=0.0,
+                 jitter=0.0):
+        self.crate = crate
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.5)
+        (self.host, self.port) = self._sock.getsockname()
+        self._session_id = 0x1000
+        self._session_seq = 0
+        self._reservation_id = 0
+        self._pending = []
+        self._pending_cond = threading.Condition()
+        self._counter = 0
+        self._quit = False
+        self._threads = []
+        self._handlers = {
+            (constants.NETFN_APP, constants.CMDID_GET_DEVICE_ID):
+                self._get_device_id,
+            (constants.NETFN_APP, 0x38): self._get_channel_auth_cap,
+            (constants.NETFN_APP, 0x39): self._get_session_challenge,
+            (constants.NETFN_APP, 0x3a): self._activate_session,
+            (constants.NETFN_APP, 0x3b): self._set_session_privilege_level,
+            (constants.NETFN_APP, 0x3c): self._close_session,
+            (constants.NETFN_STORAGE, 0x10): self._get_fru_area_info,
+            (constants.NETFN_STORAGE, 0x11): self._read_fru_data,
+            (constants.NETFN_STORAGE, 0x20): self._get_sdr_repository_info,
+            (constants.NETFN_STORAGE, 0x22): self._reserve,
+            (constants.NETFN_STORAGE, 0x23): self._get_sdr,
+            (constants.NETFN_STORAGE, 0x40): self._get_sel_info,
+            (constants.NETFN_STORAGE, 0x42): self._reserve,
+            (constants.NETFN_STORAGE, 0x43): self._get_sel_entry,
+            (constants.NETFN_STORAGE, 0x46): self._delete_sel_entry,
+            (constants.NETFN_STORAGE, 0x47): self._clear_sel,
+            (constants.NETFN_SENSOR_EVENT, 0x27):
+                self._get_sensor_thresholds,
+            (constants.NETFN_SENSOR_EVENT, 0x2d): self._get_sensor_reading,
+        }
+
+    def start(self):
+        for target in (self._receive_loop, self._send_loop):
+            thread = threading.Thread(None, target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        log.info('MCH simulator listening on %s:%d', self.host, self.port)
+
+    def stop(self):
+        self._quit = True
+        with self._pending_cond:
+            self._pending_cond.notify()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._sock.close()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _receive_loop(self):
+        while not self._quit:
+            try:
+                (pdu, addr) = self._sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self._handle_packet(pdu, addr)
+            except Exception as e:
+                log.warning('Discarding request: %s', e)
+
+    def _send_loop(self):
+        while True:
+            with self._pending_cond:
+                while not self._quit and (not self._pending or
+                                          self._pending[0][0] > time.time()):
+                    timeout = self._pending[0][0] - time.time() \
+                        if self._pending else None
+                    self._pending_cond.wait(timeout)
+                if self._quit:
+                    break
+                (_, _, data, addr) = heapq.heappop(self._pending)
+            self._send_ipmi_msg(data, addr)
+
+    def _send_later(self, delay, data, addr):
+        with self._pending_cond:
+            self._counter += 1
+            heapq.heappush(self._pending,
+                           (time.time() + delay, self._counter, data, addr))
+            self._pending_cond.notify()
+
+    def _send_ipmi_msg(self, data, addr):
+        self._session_seq = (self._session_seq + 1) & 0xffffffff
+        sdu = struct.pack('!BIIB', 0, self._session_seq, self._session_id,
+                          len(data)) + data
+        self._sock.sendto(RmcpMsg(RMCP_CLASS_IPMI).pack(sdu, 0xff), addr)
+
+    def _handle_packet(self, pdu, addr):
+        rmcp = RmcpMsg()
+        sdu = rmcp.unpack(pdu)
+        if rmcp.class_of_msg == RMCP_CLASS_ASF:
+            ping = AsfMsg()
+            ping.unpack(sdu)
+            pong = AsfPong()
+            pong_msg = AsfMsg()
+            pong_msg.asf_type = AsfMsg.ASF_TYPE_PRESENCE_PONG
+            pong_msg.tag = ping.tag
+            pong_msg.data = pong.pack()
+            self._sock.sendto(
+                RmcpMsg(RMCP_CLASS_ASF).pack(pong_msg.pack(), 0xff), addr)
+            return
+
+        # session header: auth type, sequence, session id, [auth code], len
+        header_len = 10 if sdu[0] == 0 else 26
+        msg = sdu[header_len:header_len + sdu[header_len - 1]]
+        self.requests += 1
+        (delay, rsp) = self._handle_ipmb_msg(msg)
+        if rsp is None:
+            return
+        if delay > 0:
+            self._send_later(delay, rsp, addr)
+        else:
+            self._send_ipmi_msg(rsp, addr)
+
+    def _handle_ipmb_msg(self, msg):
+        (rs_sa, netfn, rs_lun) = (msg[0], msg[1] >> 2, msg[1] & 0x3)
+        (rq_sa, rq_seq, rq_lun, cmdid) = (msg[3], msg[4] >> 2, msg[4] & 0x3,
+                                          msg[5])
+        payload = msg[6:-1]
+        delay = 0
+        if netfn == constants.NETFN_APP and \
+                cmdid == constants.CMDID_SEND_MESSAGE:
+            # the bridged response goes inside the send message response
+            (delay, data) = self._handle_ipmb_msg(payload[1:])
+            data = bytes([CC_OK]) + (data or b'')
+        else:
+            handler = self._handlers.get((netfn, cmdid))
+            if handler:
+                (cc, data) = handler(rs_sa, rs_lun, payload)
+                if netfn == constants.NETFN_SENSOR_EVENT:
+                    delay = self._get_delay()
+            else:
+                (cc, data) = (CC_INVALID_COMMAND, b'')
+            data = bytes([cc]) + data
+
+        header = bytes([rq_sa, (netfn + 1) << 2 | rq_lun])
+        header += bytes([checksum(header), rs_sa, rq_seq << 2 | rs_lun,
+                         cmdid])
+        body = header[3:] + data
+        return (delay, header + data + bytes([checksum(body)]))
+
+    def _get_delay(self):
+        if self.jitter:
+            return max(0.0, random.uniform(self.latency - self.jitter,
+                                           self.latency + self.jitter))
+        return self.latency
+
+    def _get_device_id(self, rs_sa, rs_lun, payload):
+        return (CC_OK, struct.pack('<BBBBBB3sH', 0, 0x81, 1, 0, 0x51, 0xbf,
+                                   b'\x5a\x31\x00', 0x1234))
+
+    def _get_channel_auth_cap(self, rs_sa, rs_lun, payload):
+        # only authentication type none, null user enabled
+        return (CC_OK, bytes([0x01, 0x01, 0x02, 0, 0, 0, 0, 0]))
+
+    def _get_session_challenge(self, rs_sa, rs_lun, payload):
+        return (CC_OK, struct.pack('<I', self._session_id) + bytes(16))
+
+    def _activate_session(self, rs_sa, rs_lun, payload):
+        return (CC_OK, struct.pack('<BIIB', 0, self._session_id, 1, 4))
+
+    def _set_session_privilege_level(self, rs_sa, rs_lun, payload):
+        return (CC_OK, bytes([payload[0] & 0xf or 4]))
+
+    def _close_session(self, rs_sa, rs_lun, payload):
+        return (CC_OK, b'')
+
+    def _reserve(self, rs_sa, rs_lun, payload):
+        self._reservation_id = self._reservation_id % 0xffff + 1
+        return (CC_OK, struct.pack('<H', self._reservation_id))
+
+    def _get_fru_area_info(self, rs_sa, rs_lun, payload):
+        data = self.crate.fru_inventories.get(payload[0])
+        if data is None:
+            return (CC_REQ_DATA_NOT_PRESENT, b'')
+        return (CC_OK, struct.pack('<HB', len(data), 0))
+
+    def _read_fru_data(self, rs_sa, rs_lun, payload):
+        (fru_id, offset, count) = struct.unpack('<BHB', payload[:4])
+        data = self.crate.fru_inventories.get(fru_id)
+        if data is None:
+            return (CC_REQ_DATA_NOT_PRESENT, b'')
+        chunk = data[offset:offset + count]
+        return (CC_OK, bytes([len(chunk)]) + chunk)
+
+    def _get_sdr_repository_info(self, rs_sa, rs_lun, payload):
+        return (CC_OK, struct.pack('<BHHIIB', SDR_VERSION,
+                                   len(self.crate.sdr_records), 0xffff,
+                                   self.crate.sdr_timestamp,
+                                   self.crate.sdr_erase_timestamp, 0x02))
+
+    def _get_sdr(self, rs_sa, rs_lun, payload):
+        (_, record_id, offset, length) = struct.unpack('<HHBB', payload[:6])
+        records = self.crate.sdr_records
+        index = max(record_id, 1) - 1
+        if index >= len(records):
+            return (CC_REQ_DATA_NOT_PRESENT, b'')
+        next_id = index + 2 if index + 1 < len(records) else LAST_RECORD_ID
+        record = records[index]
+        return (CC_OK, struct.pack('<H', next_id) +
+                record[offset:offset + length])
+
+    def _get_sel_info(self, rs_sa, rs_lun, payload):
+        return (CC_OK, struct.pack('<BHHIIB', SEL_VERSION,
+                                   len(self.crate.sel), 0xffff,
+                                   self.crate.sel_timestamp, 0, 0x0a))
+
+    def _get_sel_entry(self, rs_sa, rs_lun, payload):
+        (_, record_id, offset, length) = struct.unpack('<HHBB', payload[:6])
+        with self.crate._lock:
+            record_ids = sorted(self.crate.sel)
+            if not record_ids:
+                return (CC_REQ_DATA_NOT_PRESENT, b'')
+            if record_id == 0:
+                record_id = record_ids[0]
+            elif record_id == LAST_RECORD_ID:
+                record_id = record_ids[-1]
+            if record_id not in self.crate.sel:
+                return (CC_REQ_DATA_NOT_PRESENT, b'')
+            index = record_ids.index(record_id)
+            next_id = record_ids[index + 1] \
+                if index + 1 < len(record_ids) else LAST_RECORD_ID
+            record = self.crate.sel[record_id]
+        return (CC_OK, struct.pack('<H', next_id) +
+                record[offset:offset + length])
+
+    def _delete_sel_entry(self, rs_sa, rs_lun, payload):
+        (_, record_id) = struct.unpack('<HH', payload[:4])
+        with self.crate._lock:
+            if self.crate.sel.pop(record_id, None) is None:
+                return (CC_REQ_DATA_NOT_PRESENT, b'')
+        return (CC_OK, struct.pack('<H', record_id))
+
+    def _clear_sel(self, rs_sa, rs_lun, payload):
+        with self.crate._lock:
+            self.crate.sel.clear()
+        return (CC_OK, bytes([0x01]))  # erasure completed
+
+    def _get_sensor_reading(self, rs_sa, rs_lun, payload):
+        reading = self.crate.get_reading(rs_sa, rs_lun, payload[0])
+        if reading is None:
+            return (CC_REQ_DATA_NOT_PRESENT, b'')
+        (raw, states) = reading
+        if raw is None:  # e.g. payload powered off
+            return (CC_OK, bytes([0, 0xc0 | SENSOR_UPDATE_IN_PROGRESS, 0, 0]))
+        return (CC_OK, bytes([raw, 0xc0, states & 0xff, states >> 8]))
+
+    def _get_sensor_thresholds(self, rs_sa, rs_lun, payload):
+        thresholds = self.crate.thresholds.get((rs_sa, rs_lun, payload[0]))
+        if thresholds is None:
+            return (CC_REQ_DATA_NOT_PRESENT, b'')
+        (unr, uc, unc, lnr, lc, lnc) = thresholds
+        return (CC_OK, bytes([0x3f, lnc, lc, lnr, unc, uc, unr]))
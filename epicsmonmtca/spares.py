@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+import logging
+
+from softioc import builder
+
+log = logging.getLogger(__name__)
+DEFAULT_SPARE_SENSORS = 24
+
+
+class SpareRecordPool(object):
+    """ Records of an empty slot, created before the IOC starts, so the
+        sensors of a module inserted later can be published without
+        restarting it. Each spare record has a NAME record with the name of
+        the sensor bound to it """
+    def __init__(self, slot_id, nsensors=DEFAULT_SPARE_SENSORS):
+        prefix = '{}{}:SPARE'.format(slot_id[0], slot_id[1])
+        self.slot_id = slot_id
+        self._free = [
+            (builder.aIn('{}:{:02d}'.format(prefix, index)),
+             builder.stringIn('{}:{:02d}:NAME'.format(prefix, index)))
+            for index in range(nsensors)]
+        self._free_hotswap = [(builder.stringIn(prefix + ':HS'),
+                               builder.stringIn(prefix + ':HS:NAME'))]
+        self._in_use = {}
+
+    def take(self, sensor_name, hotswap=False):
+        """ Returns:
+               A free record bound to the sensor, or None if there are no
+               free records left
+        """
+        free = self._free_hotswap if hotswap else self._free
+        if not free:
+            log.warning('No spare records left in %s%d for %s',
+                        self.slot_id[0], self.slot_id[1], sensor_name)
+            return None
+        (record, name_record) = free.pop(0)
+        name_record.set(sensor_name)
+        self._in_use[record] = (name_record, free)
+        return record
+
+    def release(self, record):
+        if record not in self._in_use:
+            return
+        (name_record, free) = self._in_use.pop(record)
+        name_record.set('')
+        free.append((record, name_record))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+import logging
+import socket
+import threading
+
+from bisect import bisect_left
+
+from softioc import builder
+
+from epicsmonmtca.epicsutils import get_sensor_pv_suffix
+from epicsmonmtca.timeutils import time_ms
+
+log = logging.getLogger(__name__)
+# upper edges in ms of the round trip histogram buckets, the last bucket
+# counts everything above the last edge
+LATENCY_BUCKET_EDGES = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+NBUCKETS = len(LATENCY_BUCKET_EDGES) + 1
+STATS_PUBLISH_PERIOD = 1000  # ms
+
+
+class LatencyHistogram(object):
+    """ Fixed bucket histogram of round trip times, the percentiles are
+        taken from the bucket counts, so adding a sample is O(log buckets)
+        and nothing is kept per sample """
+    def __init__(self):
+        self.counts = [0] * NBUCKETS
+        self.total = 0
+        self.records = None
+
+    def add(self, ms):
+        self.counts[bisect_left(LATENCY_BUCKET_EDGES, ms)] += 1
+        self.total += 1
+
+    def percentile(self, pct):
+        """ Returns:
+               The percentile in ms interpolated inside its bucket, or None
+               when there are no samples
+        """
+        if not self.total:
+            return None
+
+        rank = self.total * pct / 100.0
+        acc = 0
+        for (index, count) in enumerate(self.counts):
+            if count and acc + count >= rank:
+                low = LATENCY_BUCKET_EDGES[index - 1] if index else 0
+                if index == len(LATENCY_BUCKET_EDGES):
+                    return low
+                high = LATENCY_BUCKET_EDGES[index]
+                return low + (high - low) * (rank - acc) / count
+            acc += count
+
+        return LATENCY_BUCKET_EDGES[-1]
+
+    def create_records(self, prefix):
+        self.records = (
+            builder.WaveformIn(prefix + ':HIST', length=NBUCKETS,
+                               FTVL='LONG'),
+            builder.aIn(prefix + ':P50', EGU='ms', PREC=1),
+            builder.aIn(prefix + ':P99', EGU='ms', PREC=1))
+
+    def publish(self):
+        if not self.records:
+            return
+        (hist, p50, p99) = self.records
+        hist.set(self.counts)
+        if self.total:
+            p50.set(self.percentile(50))
+            p99.set(self.percentile(99))
+
+
+class LoopStats(object):
+    """ Timing PVs of a periodic loop: overruns, the ratio of iterations
+        that overran since the previous publish and the mean and max
+        lateness of the wake-ups """
+    def __init__(self, name, timing):
+        self.name = name
+        self.timing = timing
+        prefix = 'STATS:{}'.format(name)
+        self.records = {
+            'overruns': builder.longIn(prefix + ':OVERRUNS'),
+            'skipped': builder.longIn(prefix + ':SKIPPED'),
+            'overrun_ratio': builder.aIn(prefix + ':OVERRUN_RATIO', EGU='%',
+                                         PREC=1),
+            'jitter': builder.aIn(prefix + ':JITTER', EGU='ms', PREC=1),
+            'jitter_max': builder.aIn(prefix + ':JITTER_MAX', EGU='ms'),
+        }
+        self._last_iterations = 0
+        self._last_overruns = 0
+
+    def publish(self):
+        (iterations, overruns, skipped, jitter, jitter_max) = \
+            self.timing.take()
+        delta = iterations - self._last_iterations
+        self.records['overruns'].set(overruns)
+        self.records['skipped'].set(skipped)
+        self.records['overrun_ratio'].set(
+            100.0 * (overruns - self._last_overruns) / delta if delta
+            else 0.0)
+        self.records['jitter'].set(jitter)
+        self.records['jitter_max'].set(jitter_max)
+        self._last_iterations = iterations
+        self._last_overruns = overruns
+
+
+class PollingStats(object):
+    """ Always on counters of the sensor polling loop, published as PVs.
+        The readings are counted from the engine threads of every session,
+        so the counters are updated under a lock """
+    def __init__(self, nloops=1):
+        # number of sensor polling loops, one per IPMI session
+        self.nloops = nloops
+        self.latency = LatencyHistogram()
+        self.slot_latency = {}
+        self.reads = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.published = 0
+        self.suppressed = 0
+        self.parked = 0
+        self.event_reads = 0
+        # times a session was considered down and sessions down right now
+        self.trips = 0
+        self.offline = 0
+        self.sweep_ms = 0
+        self.records = None
+        self.loops = []
+        self._lock = threading.Lock()
+        self._busy_ms = 0
+        self._last_reads = 0
+        self._last_publish = time_ms()
+
+    def add_read(self, slot_id, ms):
+        with self._lock:
+            self.reads += 1
+            if ms is None:
+                return
+            self.latency.add(ms)
+            slot_latency = self.slot_latency.get(slot_id)
+            if slot_latency:
+                slot_latency.add(ms)
+
+    def add_error(self, error):
+        with self._lock:
+            self.errors += 1
+            if isinstance(error, socket.timeout):
+                self.timeouts += 1
+
+    def add_published(self):
+        with self._lock:
+            self.published += 1
+
+    def add_suppressed(self):
+        with self._lock:
+            self.suppressed += 1
+
+    def add_event_read(self):
+        with self._lock:
+            self.event_reads += 1
+
+    def add_trip(self):
+        with self._lock:
+            self.trips += 1
+
+    def add_sweep(self, ms):
+        with self._lock:
+            self.sweep_ms = ms
+            self._busy_ms += ms
+
+    def create_records(self, slot_ids):
+        self.latency.create_records('STATS:LATENCY')
+        for slot_id in slot_ids:
+            slot_latency = LatencyHistogram()
+            slot_latency.create_records(
+                get_sensor_pv_suffix(slot_id, 'STATS LATENCY'))
+            self.slot_latency[slot_id] = slot_latency
+
+        builder.WaveformIn('STATS:LATENCY:BUCKETS',
+                           initial_value=LATENCY_BUCKET_EDGES)
+        self.records = {
+            'reads': builder.longIn('STATS:READS'),
+            'errors': builder.longIn('STATS:ERRORS'),
+            'timeouts': builder.longIn('STATS:TIMEOUTS'),
+            'published': builder.longIn('STATS:PUBLISHED'),
+            'suppressed': builder.longIn('STATS:SUPPRESSED'),
+            'parked': builder.longIn('STATS:PARKED'),
+            'event_reads': builder.longIn('STATS:EVENT_READS'),
+            'trips': builder.longIn('STATS:TRIPS'),
+            'offline': builder.longIn('STATS:OFFLINE'),
+            'read_rate': builder.aIn('STATS:READ_RATE', EGU='reads/s',
+                                     PREC=1),
+            'sweep': builder.aIn('STATS:SWEEP_TIME', EGU='ms'),
+            'load': builder.aIn('STATS:LOAD', EGU='%', PREC=1),
+        }
+
+    def add_loop(self, name, timing):
+        """ Publishes the timing of a polling loop, its records are created
+            right away """
+        self.loops.append(LoopStats(name, timing))
+
+    def publish_if_due(self):
+        now = time_ms()
+        elapsed = now - self._last_publish
+        if elapsed < STATS_PUBLISH_PERIOD:
+            return
+
+        if self.records:
+            self.records['reads'].set(self.reads)
+            self.records['errors'].set(self.errors)
+            self.records['timeouts'].set(self.timeouts)
+            self.records['published'].set(self.published)
+            self.records['suppressed'].set(self.suppressed)
+            self.records['parked'].set(self.parked)
+            self.records['event_reads'].set(self.event_reads)
+            self.records['trips'].set(self.trips)
+            self.records['offline'].set(self.offline)
+            self.records['read_rate'].set(
+                (self.reads - self._last_reads) * 1000.0 / elapsed)
+            self.records['sweep'].set(self.sweep_ms)
+            self.records['load'].set(
+                100.0 * self._busy_ms / elapsed / self.nloops)
+            self.latency.publish()
+            for slot_latency in self.slot_latency.values():
+                slot_latency.publish()
+        for loop in self.loops:
+            loop.publish()
+
+        self._last_reads = self.reads
+        self._busy_ms = 0
+        self._last_publish = now
@@ -1,30 +1,140 @@
 #!/usr/bin/env python
 import logging
+import threading
 import time
 
+from datetime import datetime
+
 log = logging.getLogger(__name__)
-NTIMERS = 10
-_timers = [0] * NTIMERS
+# what a periodic loop does with the periods it missed while overrunning:
+# skip them and carry on at the next one, or run them back to back
+CATCH_UP_SKIP = 'skip'
+CATCH_UP_RUN = 'run'
+CATCH_UP_POLICIES = (CATCH_UP_SKIP, CATCH_UP_RUN)
+# units of the durations accepted by parse_time, in seconds
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
 
 
 def time_ms():
     return int(time.monotonic() * 1000)
 
 
-def reset_timer(timer=0, ms=0):
-    _timers[timer] = time_ms() + ms
+def parse_time(text):
+    """ Parses epoch seconds, an ISO 8601 date in local time or a
+        duration back from now such as 30m, 12h or 7d
+        Returns:
+           The time in epoch seconds
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    unit = DURATION_UNITS.get(text[-1:])
+    if unit:
+        try:
+            return time.time() - float(text[:-1]) * unit
+        except ValueError:
+            pass
+    return datetime.fromisoformat(text).timestamp()
+
+
+def get_next_deadline(deadline, period, now, catch_up=CATCH_UP_SKIP):
+    """ The next deadline stays on the grid of the first one, so the
+        period does not drift with the time the loop takes
+        Returns:
+           A (next deadline, skipped periods) tuple
+    """
+    next_deadline = deadline + period
+    if next_deadline >= now or catch_up == CATCH_UP_RUN or period <= 0:
+        return (next_deadline, 0)
+    skipped = (now - deadline - 1) // period
+    return (deadline + (skipped + 1) * period, skipped)
+
+
+class LoopTiming(object):
+    """ How late a periodic loop runs: wake-up lateness (jitter) and the
+        iterations that took longer than the period. Safe to update from
+        one thread and read from another """
+    def __init__(self):
+        self.iterations = 0
+        self.overruns = 0
+        self.skipped = 0
+        self._late_total = 0
+        self._late_count = 0
+        self._late_max = 0
+        self._lock = threading.Lock()
+
+    def add_late(self, late_ms):
+        late_ms = max(late_ms, 0)
+        with self._lock:
+            self.iterations += 1
+            self._late_total += late_ms
+            self._late_count += 1
+            self._late_max = max(self._late_max, late_ms)
+
+    def add_overrun(self, skipped=0):
+        with self._lock:
+            self.overruns += 1
+            self.skipped += skipped
+
+    def take(self):
+        """ Returns:
+               An (iterations, overruns, skipped, mean jitter, max jitter)
+               tuple, the jitter is measured since the previous call
+        """
+        with self._lock:
+            mean = self._late_total / float(self._late_count) \
+                if self._late_count else 0.0
+            result = (self.iterations, self.overruns, self.skipped, mean,
+                      self._late_max)
+            self._late_total = 0
+            self._late_count = 0
+            self._late_max = 0
+        return result
+
 
+class PeriodicTimer(object):
+    """ Wakes a loop up every period ms. Each loop has its own timer, so
+        several monitors can run in the same process """
+    def __init__(self, period, catch_up=CATCH_UP_SKIP):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError('Unknown catch-up policy {}'.format(catch_up))
+        self.period = period
+        self.catch_up = catch_up
+        self.timing = LoopTiming()
+        self._deadline = None
+        self._stop = threading.Event()
 
-def reset_timers(ms=0):
-    global _timers
-    _timers = [time_ms() + ms] * NTIMERS
+    def start(self, delay=None):
+        """ The first deadline is one period (or delay ms) from now """
+        self._stop.clear()
+        self._deadline = time_ms() + (self.period if delay is None
+                                      else delay)
 
+    def stop(self):
+        """ Wakes the loop up, wait returns False from now on """
+        self._stop.set()
 
-def wait_period(timer=0, ms=0):
-    diff_ms = _timers[timer] - time_ms()
-    if diff_ms >= 0:
-        time.sleep(diff_ms / 1000.0)
-    else:
-        log.debug("Overrun of {} ms".format(-1*diff_ms))
+    def wait(self):
+        """ Sleeps until the next deadline
+            Returns:
+               False if the timer was stopped
+        """
+        if self._deadline is None:
+            self.start()
+        now = time_ms()
+        if self._deadline >= now:
+            if self._stop.wait((self._deadline - now) / 1000.0):
+                return False
+            now = time_ms()
+        else:
+            log.debug('Overrun of %d ms', now - self._deadline)
+            skipped = 0
+            if self.catch_up == CATCH_UP_SKIP and self.period > 0:
+                skipped = (now - self._deadline) // self.period
+                self._deadline += skipped * self.period
+            self.timing.add_overrun(skipped)
 
-    _timers[timer] += ms
+        self.timing.add_late(now - self._deadline)
+        self._deadline += self.period
+        return not self._stop.is_set()
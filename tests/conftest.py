@@ -0,0 +1,58 @@
+import itertools
+import time
+
+import pytest
+
+from epicsmonmtca import EpicsMonMTCA
+from epicsmonmtca.simulator import MchSimulator, build_crate
+
+# softioc records live in one database per process, every monitor of the
+# test session needs its own PV prefix
+_prefixes = itertools.count()
+
+
+def wait_for(condition, timeout=5.0):
+    """ Polls condition until it is true or timeout seconds have passed
+        Returns:
+           The last result of condition
+    """
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        if result or time.time() > deadline:
+            return result
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def simulator():
+    """ A factory of MCH simulators, stopped at the end of the test """
+    simulators = []
+
+    def start(crate=None, **kwargs):
+        sim = MchSimulator(crate or build_crate(6, namc=2), **kwargs)
+        sim.start()
+        simulators.append(sim)
+        return sim
+
+    yield start
+    for sim in simulators:
+        sim.stop()
+
+
+@pytest.fixture
+def monitor_factory():
+    """ A factory of monitors of a simulator, stopped at the end of the
+        test """
+    monitors = []
+
+    def create(sim, **kwargs):
+        monitor = EpicsMonMTCA(
+            sim.host, port=sim.port,
+            pv_prefix='TEST{}'.format(next(_prefixes)), **kwargs)
+        monitors.append(monitor)
+        return monitor
+
+    yield create
+    for monitor in monitors:
+        monitor.stop()
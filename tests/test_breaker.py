@@ -0,0 +1,80 @@
+from conftest import wait_for
+from epicsmonmtca.sessions import MIN_RECONNECT_BACKOFF
+from epicsmonmtca.simulator import build_crate
+
+
+def count_sensor_reads(engine):
+    """ Counts the sensor reads submitted to an engine and the ones
+        completed """
+    counts = {'submitted': 0, 'completed': 0}
+    submit = engine.submit
+
+    def counting_submit(req, callback=None):
+        counts['submitted'] += 1
+
+        def counting_callback(request):
+            counts['completed'] += 1
+            if callback:
+                callback(request)
+
+        return submit(req, counting_callback)
+
+    engine.submit = counting_submit
+    return counts
+
+
+def test_sensors_go_invalid_and_come_back(simulator, monitor_factory):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    monitor = monitor_factory(sim)
+    monitor.set_ipmi_timeout(0.3)
+    monitor.export_metrics()
+    monitor.watch_sensors(100)
+    breaker = monitor.pool.primary.breaker
+    counts = count_sensor_reads(monitor.pool.primary.engine)
+    assert wait_for(lambda: monitor.stats.reads > 10)
+
+    sim.stop()
+    assert wait_for(lambda: breaker.is_open)
+    assert monitor.stats.trips == 1
+    assert monitor.stats.offline == 1
+    assert all(sensor_watch.last_raw is None
+               for sensor_watch in monitor._to_monitor)
+    severities = [severity_line.rsplit(' ', 1)[1] for (_, severity_line)
+                  in monitor.metrics.take_lines()]
+    assert severities and set(severities) == {'3'}
+    # the reads in flight when it tripped time out, then nothing is sent
+    # while the session is down, not even after a failed reconnection
+    assert wait_for(lambda: counts['completed'] == counts['submitted'])
+    (submitted, errors) = (counts['submitted'], monitor.stats.errors)
+    assert wait_for(lambda: breaker.backoff > MIN_RECONNECT_BACKOFF)
+    assert counts['submitted'] == submitted
+    assert monitor.stats.errors == errors
+
+    simulator(crate, port=sim.port)
+    assert wait_for(lambda: not breaker.is_open, timeout=10)
+    assert monitor.stats.offline == 0
+    assert wait_for(lambda: all(sensor_watch.last_raw is not None
+                                for sensor_watch in monitor._to_monitor))
+
+
+def test_sel_loop_survives_timeouts(simulator, monitor_factory, caplog):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    monitor = monitor_factory(sim)
+    monitor.set_ipmi_timeout(0.3)
+    # the sensor reads alone never trip the session
+    monitor.set_trip_timeouts(1000)
+    monitor.watch_sensors(100)
+    monitor.watch_sel(50)
+    crate.add_sel_event(1, 0x01, 0x01, (0x07, 85, 80), generator_id=0x72)
+    assert wait_for(lambda: monitor.sel_events.count == 1)
+
+    sim.stop()
+    assert wait_for(lambda: 'Error polling the SEL' in caplog.text)
+    assert monitor.sel_thread.is_alive()
+
+    simulator(crate, port=sim.port)
+    crate.add_sel_event(1, 0x01, 0x01, (0x07, 85, 80), generator_id=0x72)
+    assert wait_for(lambda: monitor.sel_events.count == 2, timeout=15)
+    assert monitor.sel_thread.is_alive()
@@ -0,0 +1,109 @@
+import logging
+import threading
+
+from types import SimpleNamespace
+
+from conftest import wait_for
+from epicsmonmtca.cache import DiskCache, sdr_repository_fingerprint
+from epicsmonmtca.simulator import build_crate
+
+DEVICE_ID = SimpleNamespace(manufacturer_id=0x315a, product_id=0x1234,
+                            device_id=1, fw_revision='1.2')
+
+
+def get_repo_info(addition, erase, count=10):
+    return SimpleNamespace(record_count=count, most_recent_addition=addition,
+                           most_recent_erase=erase)
+
+
+def test_fingerprint_changes_with_each_timestamp():
+    fingerprint = sdr_repository_fingerprint(DEVICE_ID,
+                                             get_repo_info(100, 50))
+    assert fingerprint == sdr_repository_fingerprint(
+        DEVICE_ID, get_repo_info(100, 50))
+    assert fingerprint != sdr_repository_fingerprint(
+        DEVICE_ID, get_repo_info(101, 50))
+    assert fingerprint != sdr_repository_fingerprint(
+        DEVICE_ID, get_repo_info(100, 51))
+    assert fingerprint != sdr_repository_fingerprint(
+        DEVICE_ID, get_repo_info(100, 50, count=11))
+
+
+def test_entries_are_only_valid_with_their_fingerprint(tmp_path):
+    filepath = str(tmp_path / 'mch.json')
+    cache = DiskCache(filepath)
+    cache.put('sdr', 'a', [b'\x01\x02'])
+    cache.save()
+    cache = DiskCache(filepath)
+    assert cache.get('sdr', 'a') == [b'\x01\x02']
+    assert cache.get('sdr', 'b') is None
+
+
+def read_repository(monitor_factory, sim, cache_dir, caplog):
+    caplog.clear()
+    monitor = monitor_factory(sim, cache_dir=cache_dir)
+    with caplog.at_level(logging.INFO, logger='epicsmonmtca.monitor'):
+        monitor.process_sdr_repository()
+    monitor.wait_fru_inventories()
+    return 'Using' in caplog.text
+
+
+def test_sdr_erase_invalidates_the_cache(simulator, monitor_factory,
+                                         tmp_path, caplog):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    cache_dir = str(tmp_path)
+    assert not read_repository(monitor_factory, sim, cache_dir, caplog)
+    assert read_repository(monitor_factory, sim, cache_dir, caplog)
+
+    # records erased and added again without a new addition timestamp
+    addition = crate.sdr_timestamp
+    crate.remove_amc(2, event=False)
+    crate.insert_amc(2, 3, event=False)
+    crate.sdr_timestamp = addition
+    crate.sdr_erase_timestamp += 1
+    assert not read_repository(monitor_factory, sim, cache_dir, caplog)
+    assert read_repository(monitor_factory, sim, cache_dir, caplog)
+
+
+def test_rescanned_slot_is_cached(simulator, monitor_factory, tmp_path,
+                                  caplog):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    cache_dir = str(tmp_path)
+    monitor = monitor_factory(sim, cache_dir=cache_dir)
+    monitor.watch_sensors(100)
+    monitor.watch_sel(50)
+    fingerprint = monitor._sdr_fingerprint
+    crate.remove_amc(2)
+    crate.insert_amc(2, 5)
+    # the fingerprint is updated once the rescan is cached
+    assert wait_for(lambda: monitor._sdr_fingerprint != fingerprint)
+
+    monitor = monitor_factory(sim, cache_dir=cache_dir)
+    with caplog.at_level(logging.INFO, logger='epicsmonmtca.monitor'):
+        monitor.process_sdr_repository()
+    assert 'Using 10 cached SDR entries' in caplog.text
+    assert len(monitor.slots[('AMC', 2)].sensors) == 6
+    # the thresholds of the new sensors come from the cache too
+    assert not monitor._thresholds_changed
+
+
+def test_save_while_other_threads_put(tmp_path):
+    filepath = str(tmp_path / 'mch.json')
+    cache = DiskCache(filepath)
+    cache.put('sdr', 'a', [bytes(64)])
+
+    def put_entries():
+        for index in range(5000):
+            cache.put('fru:{}'.format(index), 'a', [bytes(64)])
+
+    thread = threading.Thread(target=put_entries)
+    thread.start()
+    try:
+        while thread.is_alive():
+            cache.save()
+    finally:
+        thread.join()
+    cache.save()
+    assert DiskCache(filepath).get('fru:4999', 'a') == [bytes(64)]
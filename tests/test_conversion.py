@@ -0,0 +1,86 @@
+from softioc import alarm
+
+from epicsmonmtca.conversion import (get_limits_severity,
+                                     get_threshold_limits, SensorValueTables,
+                                     THRESHOLD_READING_TYPE,
+                                     THRESHOLD_SEVERITIES)
+
+
+class FakeSdrEntry(object):
+    def __init__(self, event_reading_type_code=THRESHOLD_READING_TYPE):
+        self.event_reading_type_code = event_reading_type_code
+
+    @staticmethod
+    def convert_sensor_raw_to_value(raw):
+        if raw == 255:
+            raise ValueError('No value')
+        return raw * 0.5
+
+
+def test_status_severities():
+    assert THRESHOLD_SEVERITIES[0] == alarm.NO_ALARM
+    assert THRESHOLD_SEVERITIES[0x01] == alarm.MINOR_ALARM
+    assert THRESHOLD_SEVERITIES[0x20] == alarm.MINOR_ALARM
+    # only the threshold comparison bits count
+    assert THRESHOLD_SEVERITIES[0xc0] == alarm.NO_ALARM
+
+
+def test_non_recoverable_threshold_is_a_fallback():
+    assert get_threshold_limits({'lcr': 1, 'lnr': 0, 'ucr': 9}) == {
+        'LOLO': 1, 'HIHI': 9}
+    assert get_threshold_limits({'lnr': 0, 'unr': 10}) == {
+        'LOLO': 0, 'HIHI': 10}
+
+
+def test_limits_severity():
+    limits = {'LOLO': 0, 'LOW': 10, 'HIGH': 50, 'HIHI': 60}
+    assert get_limits_severity(30, limits) == alarm.NO_ALARM
+    assert get_limits_severity(50, limits) == alarm.MINOR_ALARM
+    assert get_limits_severity(10, limits) == alarm.MINOR_ALARM
+    assert get_limits_severity(60, limits) == alarm.MAJOR_ALARM
+    assert get_limits_severity(-5, limits) == alarm.MAJOR_ALARM
+    assert get_limits_severity(1e6, {}) == alarm.NO_ALARM
+
+
+def test_severity_table_from_thresholds():
+    tables = SensorValueTables()
+    index = tables.add(FakeSdrEntry())
+    # before the thresholds are known the status bits are used
+    assert tables.get_severity(index, 130, 0x10) == alarm.MINOR_ALARM
+    assert tables.get_severity(index, 130, 0) == alarm.NO_ALARM
+
+    limits = tables.set_thresholds(index, {'lnc': 20, 'unc': 100,
+                                           'ucr': 120})
+    assert limits == {'LOW': 10, 'HIGH': 50, 'HIHI': 60}
+    assert tables.get_severity(index, 60, 0x10) == alarm.NO_ALARM
+    assert tables.get_severity(index, 100, 0) == alarm.MINOR_ALARM
+    assert tables.get_severity(index, 10, 0) == alarm.MINOR_ALARM
+    assert tables.get_severity(index, 130, 0) == alarm.MAJOR_ALARM
+    assert tables.get_severity(index, 255, 0) == alarm.NO_ALARM
+
+
+def test_tables_are_independent():
+    tables = SensorValueTables()
+    first = tables.add(FakeSdrEntry())
+    second = tables.add(FakeSdrEntry(event_reading_type_code=0x6f))
+    tables.set_thresholds(first, {'ucr': 20})
+    assert tables.get_severity(first, 20, 0) == alarm.MAJOR_ALARM
+    # discrete sensors never alarm on their own
+    assert tables.get_severity(second, 20, 0x3f) == alarm.NO_ALARM
+    assert len(tables) == 2
+
+
+def test_removed_tables_are_reused():
+    tables = SensorValueTables()
+    first = tables.add(FakeSdrEntry())
+    second = tables.add(FakeSdrEntry())
+    tables.set_thresholds(first, {'ucr': 20})
+    tables.remove(first)
+    assert len(tables) == 1
+    index = tables.add(FakeSdrEntry(event_reading_type_code=0x6f))
+    assert index == first
+    assert len(tables) == 2
+    # nothing is left of the previous sensor
+    assert tables.get_severity(index, 20, 0x3f) == alarm.NO_ALARM
+    assert tables.get_value(index, 20) == 10
+    assert tables.get_value(second, 20) == 10
@@ -0,0 +1,46 @@
+from epicsmonmtca.fruutils import read_fru_fingerprint
+from epicsmonmtca.simulator import encode_fru_inventory
+
+
+class FakeIpmi(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read_fru_data(self, offset, count, fru_id):
+        return list(self.data[offset:offset + count])
+
+
+def get_fingerprint(data):
+    return read_fru_fingerprint(FakeIpmi(data), 5)
+
+
+def test_cards_of_the_same_model_are_told_apart():
+    first = encode_fru_inventory('Simulated', 'AMC', 'SIM-AMC', 'SN0001')
+    second = encode_fru_inventory('Simulated', 'AMC', 'SIM-AMC', 'SN0002')
+    # the serial number is beyond the first 32 bytes
+    assert first[:32] == second[:32]
+    assert get_fingerprint(first) != get_fingerprint(second)
+    assert get_fingerprint(first) == get_fingerprint(bytes(first))
+
+
+def test_fingerprint_ends_at_the_serial_number():
+    data = bytearray(encode_fru_inventory('Simulated', 'AMC', 'SIM-AMC',
+                                          'SN0001'))
+    fingerprint = get_fingerprint(data)
+    # the part number comes after the serial number in the board area
+    data[data.index(b'SIM-AMC')] = ord('X')
+    assert get_fingerprint(data) == fingerprint
+
+
+def test_board_area_after_another_area():
+    data = bytearray(encode_fru_inventory('Simulated', 'AMC', 'SIM-AMC',
+                                          'SN0001'))
+    # an 8 byte internal use area first, the other areas move along
+    header = bytearray(data[:8])
+    header[1] = 1
+    header[3] += 1
+    header[4] += 1
+    header[7] = -sum(header[:7]) & 0xff
+    moved = bytes(header) + bytes(8) + bytes(data[8:])
+    other = moved.replace(b'SN0001', b'SN0002')
+    assert get_fingerprint(moved) != get_fingerprint(other)
@@ -0,0 +1,94 @@
+from softioc.device import ProcessDeviceSupportCore
+
+from conftest import wait_for
+from epicsmonmtca.simulator import build_crate
+
+AMC = 'AMC'
+
+
+def get_slot_watches(monitor, slot_id):
+    return [sensor_watch for sensor_watch in monitor._to_monitor
+            if sensor_watch.slot_id == slot_id]
+
+
+def test_insert_extract_reinsert_uses_spare_records(simulator,
+                                                    monitor_factory):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    monitor = monitor_factory(sim)
+    monitor.spare_sensors_per_slot = 8
+    monitor.watch_sensors(100)
+    monitor.watch_sel(50)
+    slot_id = (AMC, 5)
+    pool = monitor._spare_pools[slot_id]
+    nfree = len(pool._free)
+
+    crate.insert_amc(5, 3)
+    assert wait_for(lambda: len(get_slot_watches(monitor, slot_id)) == 4)
+    watches = get_slot_watches(monitor, slot_id)
+    assert len(pool._free) == nfree - 3
+    assert not pool._free_hotswap
+
+    crate.remove_amc(5)
+    # the slot is forgotten before its sensors are detached, every spare
+    # record is free again once the last one is
+    assert wait_for(lambda: slot_id not in monitor.slots and
+                    len(pool._free) == nfree and
+                    len(pool._free_hotswap) == 1)
+    assert not get_slot_watches(monitor, slot_id)
+    assert not any(sensor_watch.bound for sensor_watch in watches)
+
+    ntables = len(monitor.value_tables)
+    crate.insert_amc(5, 3)
+    assert wait_for(lambda: len(get_slot_watches(monitor, slot_id)) == 4)
+    watches = get_slot_watches(monitor, slot_id)
+    # the tables of the extracted module are reused
+    assert len(monitor.value_tables._threshold_based) == ntables + 3
+    assert all(sensor_watch in monitor.active_sensors
+               for sensor_watch in watches)
+    assert wait_for(lambda: all(sensor_watch.last_raw is not None
+                                for sensor_watch in watches))
+
+
+def test_reinserted_module_reuses_its_startup_records(simulator,
+                                                      monitor_factory):
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    monitor = monitor_factory(sim)
+    monitor.watch_sensors(100)
+    monitor.watch_sel(50)
+    slot_id = (AMC, 2)
+    records = {sensor_watch.sdr.name: sensor_watch.record
+               for sensor_watch in get_slot_watches(monitor, slot_id)}
+
+    crate.remove_amc(2)
+    assert wait_for(lambda: slot_id not in monitor.slots)
+    crate.insert_amc(2, 3)
+    assert wait_for(lambda: len(get_slot_watches(monitor, slot_id)) == 4)
+    assert {sensor_watch.sdr.name: sensor_watch.record
+            for sensor_watch in get_slot_watches(monitor, slot_id)} == records
+
+
+def test_reused_records_get_the_fields_of_the_new_module(
+        simulator, monitor_factory, monkeypatch):
+    fields = {}
+
+    def set_field(device, field, value):
+        fields.setdefault(device, {})[field] = value
+
+    monkeypatch.setattr(ProcessDeviceSupportCore, 'set_field', set_field)
+    crate = build_crate(6, namc=2)
+    sim = simulator(crate)
+    monitor = monitor_factory(sim)
+    monitor.watch_sensors(100)
+    monitor.watch_sel(50)
+    slot_id = (AMC, 2)
+
+    crate.remove_amc(2)
+    assert wait_for(lambda: slot_id not in monitor.slots)
+    crate.insert_amc(2, 3)
+    assert wait_for(lambda: len(get_slot_watches(monitor, slot_id)) == 4)
+    for sensor_watch in get_slot_watches(monitor, slot_id):
+        if sensor_watch.sdr.name.startswith('Temp'):
+            device_fields = fields[sensor_watch.record.set_field.__self__]
+            assert {'EGU', 'PREC', 'HIGH', 'HIHI'} <= set(device_fields)
@@ -0,0 +1,66 @@
+import itertools
+import logging
+import sys
+
+import pytest
+
+from epicsmonmtca.cli import ioc
+from epicsmonmtca.crates import parse_crates_file
+
+_prefixes = itertools.count()
+
+
+@pytest.fixture
+def start_monitors(monkeypatch, tmp_path):
+    """ Starts the monitors of a crates file with the IOC arguments """
+    started = []
+
+    def start(hosts, port):
+        lines = ['{} IOCTEST{}'.format(host, next(_prefixes))
+                 for host in hosts]
+        crates_file = tmp_path / 'crates.txt'
+        crates_file.write_text('\n'.join(lines) + '\n')
+        monkeypatch.setattr(sys, 'argv', [
+            'emm-ioc', '--crates-file', str(crates_file), '--no-cache',
+            '--mch-port', str(port), '--crate-retries', '1',
+            '--crate-retry-delay', '0'])
+        args = ioc.parse_args()
+        crates = parse_crates_file(args.crates_file)
+        monitors = ioc.start_crate_monitors(crates, args)
+        started.extend(monitors.values())
+        return (crates, monitors)
+
+    yield start
+    for monitor in started:
+        monitor.stop()
+
+
+def test_unreachable_crate_does_not_stop_the_others(simulator,
+                                                    start_monitors, caplog):
+    sim = simulator()
+    # nothing answers on this address
+    with caplog.at_level(logging.INFO, logger=ioc.__name__):
+        (crates, monitors) = start_monitors(['127.0.0.2', sim.host],
+                                            sim.port)
+    assert list(monitors) == [crates[1].pv_prefix]
+    assert monitors[crates[1].pv_prefix].sensor_threads
+    assert 'Trying 1 crates again' in caplog.text
+    assert 'Giving up on 127.0.0.2' in caplog.text
+
+
+def test_failed_crate_is_retried(simulator, start_monitors, monkeypatch):
+    sim = simulator()
+    start_crate_monitor = ioc.start_crate_monitor
+    attempts = []
+
+    def fail_once(crate, args):
+        attempts.append(crate.pv_prefix)
+        if len(attempts) == 1:
+            raise IOError('MCH not ready')
+        return start_crate_monitor(crate, args)
+
+    monkeypatch.setattr(ioc, 'start_crate_monitor', fail_once)
+    (crates, monitors) = start_monitors([sim.host, sim.host], sim.port)
+    assert sorted(monitors) == sorted(crate.pv_prefix for crate in crates)
+    assert attempts == [crates[0].pv_prefix, crates[1].pv_prefix,
+                        crates[0].pv_prefix]
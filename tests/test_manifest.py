@@ -0,0 +1,59 @@
+from epicsmonmtca.manifest import (get_concrete_modules, parse_manifest,
+                                   ManifestIndex)
+from epicsmonmtca.mtcaedm import create_edm_files
+
+MANIFEST = """AMC,2: AMC-FPGA
+- FPGA Temp | period=500 severity=MAJOR
+- Temp [A]
+- glob:Temp* | period=5000
+*,*: any module
+- +12V
+AMC,*: any AMC
+- glob:*Current | deadband=2%
+"""
+
+
+def write_manifest(tmp_path):
+    filepath = tmp_path / 'sensors.txt'
+    filepath.write_text(MANIFEST)
+    return str(filepath)
+
+
+def test_patterns_are_kept_apart_from_names(tmp_path):
+    slots = parse_manifest(write_manifest(tmp_path))
+    assert list(slots) == [('AMC', 2), ('*', '*'), ('AMC', '*')]
+    sensors = slots[('AMC', 2)].sensors
+    assert [(sensor.name, sensor.pattern) for sensor in sensors] == [
+        ('FPGA Temp', False), ('Temp [A]', False), ('Temp*', True)]
+
+    concrete = get_concrete_modules(slots)
+    assert list(concrete) == [('AMC', 2)]
+    assert [sensor.name for sensor in concrete[('AMC', 2)].sensors] == [
+        'FPGA Temp', 'Temp [A]']
+
+
+def test_lookup(tmp_path):
+    index = ManifestIndex.from_file(write_manifest(tmp_path))
+    amc2 = ('AMC', 2)
+    policy = index.lookup(amc2, 'FPGA Temp')
+    assert (policy.period, policy.severity) == (500, 'MAJOR')
+    # a name with wildcard characters only matches itself
+    assert index.lookup(amc2, 'Temp [A]').period == 5000
+    assert index.lookup(amc2, 'Temp A').period == 5000
+    assert index.lookup(amc2, 'Volt A') is None
+    assert index.lookup(('AMC', 3), 'Temp A') is None
+    assert index.lookup(('AMC', 3), '+12V') is not None
+    assert index.lookup(('AMC', 3), '12V Current').deadband.relative == 0.02
+    assert index.lookup(('CU', 1), '12V Current') is None
+
+
+def test_names_of_a_list_are_exact():
+    index = ManifestIndex.from_names(['Temp [A]'])
+    assert index.lookup(('AMC', 1), 'Temp [A]') is not None
+    assert index.lookup(('AMC', 1), 'Temp A') is None
+
+
+def test_screens_show_names_with_wildcard_characters(tmp_path):
+    files = create_edm_files(write_manifest(tmp_path), 'TEST', 'crate')
+    assert 'Temp [A]' in files['AMC2.edl']
+    assert 'Temp*' not in files['AMC2.edl']
@@ -0,0 +1,15 @@
+import os
+
+from epicsmonmtca.mtcaedm import write_if_changed
+
+
+def test_write_if_changed(tmp_path):
+    filepath = str(tmp_path / 'AMC1.edl')
+    assert write_if_changed(filepath, 'screen') == 'created'
+    os.utime(filepath, (0, 0))
+    assert write_if_changed(filepath, 'screen') == 'unchanged'
+    # the modification time is kept
+    assert os.stat(filepath).st_mtime == 0
+    assert write_if_changed(filepath, 'screen 2') == 'updated'
+    with open(filepath) as fhandle:
+        assert fhandle.read() == 'screen 2'
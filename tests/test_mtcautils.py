@@ -0,0 +1,42 @@
+from pyipmi.errors import CompletionCodeError
+from pyipmi.msgs.constants import CC_RES_CANCELED
+
+from epicsmonmtca.ipmiutils import get_sdr_name
+from epicsmonmtca.mtcautils import read_slot_sdr_entries
+from epicsmonmtca.simulator import build_crate
+
+
+def test_slot_walk_reads_only_the_records_of_the_slot(simulator,
+                                                      monitor_factory):
+    sim = simulator(build_crate(6, namc=2))
+    monitor = monitor_factory(sim)
+    calls = []
+
+    def call(func, *args):
+        calls.append(func.__name__)
+        return monitor._call_ipmi(func, *args)
+
+    entries = read_slot_sdr_entries(call, ('AMC', 2))
+    assert sorted(get_sdr_name(entry) for entry in entries) == [
+        'HS 002', 'Temp 1', 'Temp 2', 'Temp 3']
+    # the key of every record, one call each, and the slot records in full
+    assert calls.count('read_sdr_key') == len(sim.crate.sdr_records)
+    assert calls.count('get_repository_sdr') == 4
+
+
+def test_slot_walk_starts_again_when_the_reservation_is_canceled(
+        simulator, monitor_factory):
+    sim = simulator(build_crate(6, namc=2))
+    monitor = monitor_factory(sim)
+    calls = []
+
+    def call(func, *args):
+        calls.append(func.__name__)
+        if calls.count('read_sdr_key') == 3 and func.__name__ == \
+                'read_sdr_key':
+            raise CompletionCodeError(CC_RES_CANCELED)
+        return monitor._call_ipmi(func, *args)
+
+    entries = read_slot_sdr_entries(call, ('AMC', 1))
+    assert len(entries) == 4
+    assert calls.count('reserve_sdr_repository') == 2
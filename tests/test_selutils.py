@@ -0,0 +1,32 @@
+import socket
+
+from pyipmi.sensor import SENSOR_TYPE_TEMPERATURE
+
+from epicsmonmtca.selutils import SelReader
+
+
+def add_events(crate, count):
+    for _ in range(count):
+        crate.add_sel_event(1, SENSOR_TYPE_TEMPERATURE, 0x01)
+
+
+def test_entries_are_returned_when_clearing_fails(simulator, monitor_factory,
+                                                   monkeypatch):
+    sim = simulator()
+    reader = SelReader(monitor_factory(sim).ipmi)
+    add_events(sim.crate, 2)
+    clear = reader._clear
+
+    def fail_once(reservation):
+        monkeypatch.setattr(reader, '_clear', clear)
+        raise socket.timeout('No response from MCH')
+
+    monkeypatch.setattr(reader, '_clear', fail_once)
+    assert len(reader.drain()) == 2
+    assert len(sim.crate.sel) == 2
+    # removed by the next drain, but not returned twice
+    assert reader.drain() == []
+    assert not sim.crate.sel
+
+    add_events(sim.crate, 1)
+    assert len(reader.drain()) == 1
@@ -0,0 +1,130 @@
+import socket
+import time
+
+import pytest
+
+from epicsmonmtca import sessions
+from epicsmonmtca.sessions import (CircuitBreaker, IpmiSession,
+                                   IpmiSessionPool, MAX_RECONNECT_BACKOFF,
+                                   MIN_RECONNECT_BACKOFF)
+
+
+def test_breaker_trips_after_consecutive_timeouts():
+    breaker = CircuitBreaker(3)
+    assert not breaker.add_timeout()
+    assert not breaker.add_timeout()
+    breaker.add_success()
+    assert not breaker.add_timeout()
+    assert not breaker.add_timeout()
+    assert not breaker.is_open
+    assert breaker.add_timeout()
+    assert breaker.is_open
+    assert breaker.trips == 1
+    assert breaker.backoff == MIN_RECONNECT_BACKOFF
+    # only the timeout tripping it is reported
+    assert not breaker.add_timeout()
+    assert breaker.trips == 1
+
+
+def test_breaker_without_threshold_never_trips():
+    breaker = CircuitBreaker(0)
+    for _ in range(100):
+        assert not breaker.add_timeout()
+    assert not breaker.is_open
+
+
+def test_breaker_backoff_doubles_up_to_the_maximum():
+    breaker = CircuitBreaker(1)
+    breaker.add_timeout()
+    backoffs = []
+    for _ in range(10):
+        breaker.retry_failed()
+        backoffs.append(breaker.backoff)
+    assert backoffs[:3] == [2 * MIN_RECONNECT_BACKOFF,
+                            4 * MIN_RECONNECT_BACKOFF,
+                            8 * MIN_RECONNECT_BACKOFF]
+    assert backoffs[-1] == MAX_RECONNECT_BACKOFF
+
+
+def test_breaker_close():
+    breaker = CircuitBreaker(2)
+    breaker.add_timeout()
+    breaker.add_timeout()
+    breaker.close()
+    assert not breaker.is_open
+    assert (breaker.backoff, breaker.retry_at) == (0, None)
+    assert not breaker.add_timeout()
+    assert breaker.add_timeout()
+    assert breaker.trips == 2
+
+
+def test_breaker_wait_retry():
+    breaker = CircuitBreaker(1)
+    breaker.add_timeout()
+    assert not breaker.wait_retry(10)
+    breaker.retry_at -= MIN_RECONNECT_BACKOFF
+    assert breaker.wait_retry(10)
+    breaker.abort()
+    assert not breaker.wait_retry(10)
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.closed = 0
+        self.established = 0
+
+    def close(self):
+        self.closed += 1
+
+    def establish(self):
+        self.established += 1
+
+
+class FakeIpmi(object):
+    def __init__(self):
+        self.session = FakeSession()
+        self.probes = 0
+
+    def get_device_id(self):
+        self.probes += 1
+        return 'device id'
+
+
+@pytest.fixture
+def session():
+    session = IpmiSession(0, FakeIpmi())
+    session.engine.start()
+    yield session
+    session.close()
+
+
+def test_probe_time_in_queue_does_not_count(session, monkeypatch):
+    monkeypatch.setattr(sessions, 'HEALTH_CHECK_TIMEOUT', 0.1)
+    # a long operation ahead of the probe, e.g. a FRU read
+    session.engine.call(time.sleep, 0.3)
+    assert session.check_health()
+    assert session.ipmi.probes == 1
+    assert not session.ipmi.session.established
+
+
+def test_no_probe_after_a_recent_result(session):
+    session.engine.call(time.sleep, 0).result()
+    assert session.check_health()
+    assert session.ipmi.probes == 0
+    session.engine.last_result_ms -= sessions.HEALTH_CHECK_PERIOD
+    assert session.check_health()
+    assert session.ipmi.probes == 1
+
+
+def test_pool_closes_its_sessions_when_one_fails():
+    connections = [FakeIpmi()]
+
+    def create_connection():
+        if not connections:
+            raise socket.timeout('timed out')
+        return connections.pop()
+
+    ipmi = connections[0]
+    with pytest.raises(socket.timeout):
+        IpmiSessionPool(create_connection, size=2)
+    assert ipmi.session.closed == 1
@@ -0,0 +1,31 @@
+import pytest
+
+from epicsmonmtca.stats import LatencyHistogram, LATENCY_BUCKET_EDGES
+
+
+def test_empty_histogram_has_no_percentile():
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_percentile_is_interpolated_inside_its_bucket():
+    histogram = LatencyHistogram()
+    for _ in range(100):
+        histogram.add(3)
+    # every sample is in the (2, 5] bucket
+    assert histogram.percentile(50) == 3.5
+    assert histogram.percentile(100) == 5
+
+
+def test_percentiles_of_several_buckets():
+    histogram = LatencyHistogram()
+    for ms in [1] * 90 + [15] * 10:
+        histogram.add(ms)
+    # 90 samples in the [0, 1] bucket, 10 in the (10, 20] bucket
+    assert histogram.percentile(50) == pytest.approx(50 / 90.0)
+    assert histogram.percentile(99) == pytest.approx(19)
+
+
+def test_samples_above_the_last_edge():
+    histogram = LatencyHistogram()
+    histogram.add(LATENCY_BUCKET_EDGES[-1] * 10)
+    assert histogram.percentile(99) == LATENCY_BUCKET_EDGES[-1]
@@ -0,0 +1,49 @@
+from epicsmonmtca.timeutils import (get_next_deadline, PeriodicTimer,
+                                    CATCH_UP_RUN, CATCH_UP_SKIP)
+
+
+def test_next_deadline_on_time():
+    assert get_next_deadline(1000, 100, 1050) == (1100, 0)
+    assert get_next_deadline(1000, 100, 1100) == (1100, 0)
+
+
+def test_next_deadline_skips_missed_periods():
+    # stays on the grid of the first deadline
+    assert get_next_deadline(1000, 100, 1101) == (1200, 1)
+    assert get_next_deadline(1000, 100, 1350) == (1400, 3)
+    assert get_next_deadline(1000, 100, 1400) == (1400, 3)
+
+
+def test_next_deadline_runs_missed_periods():
+    assert get_next_deadline(1000, 100, 1350, CATCH_UP_RUN) == (1100, 0)
+
+
+def test_next_deadline_without_period():
+    assert get_next_deadline(1000, 0, 1350) == (1000, 0)
+
+
+def test_timer_skips_missed_periods():
+    timer = PeriodicTimer(100, CATCH_UP_SKIP)
+    timer.start(delay=-250)
+    assert timer.wait()
+    assert (timer.timing.overruns, timer.timing.skipped) == (1, 2)
+    # back on the grid, the next deadline is ahead
+    assert timer.wait()
+    assert (timer.timing.overruns, timer.timing.iterations) == (1, 2)
+
+
+def test_timer_runs_missed_periods_back_to_back():
+    timer = PeriodicTimer(100, CATCH_UP_RUN)
+    timer.start(delay=-250)
+    for _ in range(3):
+        assert timer.wait()
+    assert (timer.timing.overruns, timer.timing.skipped) == (3, 0)
+    assert timer.wait()
+    assert timer.timing.overruns == 3
+
+
+def test_stopped_timer_wakes_up():
+    timer = PeriodicTimer(10000)
+    timer.start()
+    timer.stop()
+    assert not timer.wait()